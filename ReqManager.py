@@ -1,41 +1,258 @@
 ﻿import sys
 import json
-import csv
 import os
-import html
-import shutil
-import re
+import threading
+import queue
+import time
 from datetime import datetime
 
-from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
-                             QHBoxLayout, QTreeWidget, QTreeWidgetItem, QTableWidget, 
-                             QTableWidgetItem, QPushButton, QLabel, QDialog, QLineEdit, 
-                             QComboBox, QTextEdit, QMessageBox, QFileDialog, QHeaderView, 
-                             QSplitter, QRadioButton, QInputDialog, QFrame, QMenu, 
-                             QStyle, QAbstractItemView, QGridLayout, QGroupBox)
-from PyQt6.QtCore import QMarginsF, Qt, QSize, QTimer
-from PyQt6.QtGui import QColor, QFont, QIcon, QAction, QTextDocument, QPageLayout
-from PyQt6.QtPrintSupport import QPrinter
+from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
+                             QHBoxLayout, QTreeWidget, QTreeWidgetItem, QTableView,
+                             QPushButton, QLabel, QDialog, QLineEdit,
+                             QComboBox, QTextEdit, QMessageBox, QFileDialog, QHeaderView,
+                             QSplitter, QRadioButton, QInputDialog, QFrame, QMenu,
+                             QStyle, QAbstractItemView, QGridLayout, QGroupBox, QCheckBox,
+                             QProgressDialog)
+from PyQt6.QtCore import Qt, QSize, QTimer, QAbstractTableModel, QModelIndex, QThread, pyqtSignal
+from PyQt6.QtGui import QColor, QFont, QIcon, QAction, QKeySequence
+
+from reqcore import (clean_html_smart, apply_op, Requirement, DatabaseIndex, JsonStore, SqliteStore, ShardedStore, LazyProject, RemoteStore, open_store, convert_store, sub_count,
+                     TYPE_OPTS, STATUS_OPTS, METHOD_OPTS, STANDARD_SUBSYSTEMS, new_req, next_req_id,
+                     req_id_error, creates_cycle, parent_ref_op, reparent_ops,
+                     compile_query, is_structured_query, QueryError,
+                     CSV_COLUMNS, CSV_DEFAULT, ExportCancelled, write_csv,
+                     report_header_html, ReportCache, read_import_rows, plan_import, validate, review_ops,
+                     UndoLog, op_label, BaselineStore, baseline_path, compact_desc, rich_desc, compact_ops,
+                     PROFILER, profiled)
+from reqrender import print_report
 
 # --- CONSTANTS ---
 CONFIG_FILE = "satreq_config.json"
 ICON_NAME = "icon.ico"
 VERSION = "7.6 Classic"
+DB_FILTER = "Database (*.json *.sqlite *.sqlite3 *.db);;JSON (*.json);;SQLite (*.sqlite *.sqlite3 *.db);;Sharded (manifest.json)"
+SAVE_DEBOUNCE_MS = 300  # finestra di coalescenza dei salvataggi (config: "save_debounce_ms")
+SEARCH_DEBOUNCE_MS = 150
 
 # --- UTILS ---
 def get_timestamp():
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-def clean_html_smart(raw_html):
-    """Pulisce l'HTML per l'export mantenendo spazi corretti."""
-    if not raw_html: return ""
-    cleanr_style = re.compile('<style.*?>.*?</style>', re.DOTALL)
-    text = re.sub(cleanr_style, '', raw_html)
-    text = text.replace('</div>', ' ').replace('</p>', ' ').replace('<br>', ' ').replace('<br/>', ' ')
-    cleanr_tags = re.compile('<.*?>')
-    text = re.sub(cleanr_tags, '', text)
-    text = html.unescape(text)
-    return " ".join(text.split())
+class PersistenceWorker(QThread):
+    """Scrive sullo store (journal o SQLite) fuori dal GUI thread, raggruppando in una sola scrittura le modifiche
+    arrivate nella finestra di debounce. Le operazioni arrivano gia' serializzate (snapshot)."""
+    saved = pyqtSignal(int, float)   # operazioni scritte, latenza in ms
+    failed = pyqtSignal(str)
+    FLUSH = object(); STOP = object()
+
+    def __init__(self, parent=None, window_ms=SAVE_DEBOUNCE_MS):
+        super().__init__(parent)
+        self.window = window_ms / 1000.0
+        self.queue = queue.Queue()
+
+    def submit(self, store, ops):
+        self.queue.put((store, store.encode(ops), len(ops)))
+
+    def flush(self):
+        """Blocca finche' tutto cio' che e' in coda non e' su disco."""
+        self.queue.put(self.FLUSH); self.queue.join()
+
+    def stop(self):
+        self.queue.put(self.STOP); self.wait()
+
+    def run(self):
+        while True:
+            item = self.queue.get(); batch = []; stop = False
+            deadline = time.monotonic() + self.window
+            while True:
+                if item is self.STOP: stop = True; break
+                if item is self.FLUSH: break
+                batch.append(item)
+                try: item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty: break
+                self.queue.task_done()
+            self.write(batch)
+            self.queue.task_done()
+            if stop: return
+
+    @profiled("store_commit", lambda res, self, batch: sum(n for _, _, n in batch))
+    def write(self, batch):
+        if not batch: return
+        t0 = time.perf_counter()
+        try:
+            # in genere un solo store; piu' di uno solo se il database e' stato cambiato nel frattempo
+            groups = {}
+            for store, payload, n in batch: groups.setdefault(id(store), (store, []))[1].append(payload)
+            for store, payloads in groups.values(): store.commit(payloads)
+            self.saved.emit(sum(n for _, _, n in batch), (time.perf_counter() - t0) * 1000)
+        except Exception as e: self.failed.emit(str(e))
+
+class LoaderWorker(QThread):
+    """Legge il database fuori dal GUI thread (cache binaria se valida, altrimenti JSON/SQLite/server),
+    costruisce gli indici di progetto e fa la validazione di avvio: al GUI thread resta solo l'albero."""
+    loaded = pyqtSignal(object, object, object, object, float)   # store, dati, indice, problemi (None = non validato), ms
+    failed = pyqtSignal(str)
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+
+    def run(self):
+        t0 = time.perf_counter()
+        try:
+            data = self.store.load(); index = DatabaseIndex(data)
+            # progetti lazy (shard, SQLite): indice e validazione completa leggerebbero tutti i sottosistemi
+            lazy = any(isinstance(subs, LazyProject) for subs in data.values())
+            # prima la validazione: i problemi (ID mancanti, duplicati, ...) si riportano, non fanno fallire l'apertura
+            issues = None if lazy else validate(data)
+            if not lazy:
+                for p in data: index.project(p)
+            self.loaded.emit(self.store, data, index, issues, (time.perf_counter() - t0) * 1000)
+        except Exception as e: self.failed.emit(str(e))
+
+class ExportWorker(QThread):
+    """Esegue un export job(progress, cancelled) fuori dal GUI thread; il job controlla cancelled() tra un blocco e l'altro."""
+    progress = pyqtSignal(int, int)   # elementi fatti, totale
+    done = pyqtSignal(object)         # risultato del job, None se annullato
+    failed = pyqtSignal(str)
+
+    def __init__(self, job, parent=None):
+        super().__init__(parent)
+        self.job = job; self.stop_flag = threading.Event()
+
+    def cancel(self): self.stop_flag.set()
+
+    def run(self):
+        try: self.done.emit(self.job(self.progress.emit, self.stop_flag.is_set))
+        except ExportCancelled: self.done.emit(None)
+        except Exception as e: self.failed.emit(str(e))
+
+STD_SUB_ORDER = {s: k for k, s in enumerate(STANDARD_SUBSYSTEMS)}
+def sub_sort_key(name):
+    return (STD_SUB_ORDER.get(name, 99), name)
+
+def status_color(st):
+    if "Closed" in st or "Obsolete" in st: return QColor("#666666")
+    if "TBD" in st or "TBC" in st: return QColor("#cc0000")
+    if "Verified" in st: return QColor("#006600")
+    return None
+
+# --- MODELS ---
+class ReqTableModel(QAbstractTableModel):
+    """Modello tabellare sulla lista di requisiti: i dati sono calcolati solo per le celle visibili."""
+    HEADERS = ["ID", "Type", "Description", "Target", "Unit", "Status", "Method", "Parent", "Review"]
+    KEYS = ['id', 'type', 'desc', 'value', 'unit', 'status', 'method', 'parent_id', 'needs_review']
+
+    def __init__(self, parent=None, show_review=True):
+        super().__init__(parent)
+        self.reqs = []; self.hay = []
+        self.n_cols = len(self.HEADERS) if show_review else len(self.HEADERS) - 1
+
+    def set_reqs(self, reqs):
+        self.beginResetModel(); self.reqs = reqs; self.hay = [None] * len(reqs); self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()): return 0 if parent.isValid() else len(self.reqs)
+    def columnCount(self, parent=QModelIndex()): return 0 if parent.isValid() else self.n_cols
+    def req_at(self, row): return self.reqs[row] if 0 <= row < len(self.reqs) else None
+
+    def cell_text(self, req, col):
+        key = self.KEYS[col]
+        if key == 'id': return str(req.get('id', ''))
+        if key == 'type': return str(req.get('type', '-'))
+        if key == 'desc': return clean_html_smart(req.get('desc', ''))
+        if key == 'needs_review': return "YES" if req.get('needs_review', False) else "NO"
+        return str(req.get(key, ''))
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid(): return None
+        req = self.reqs[index.row()]; col = index.column()
+        if role == Qt.ItemDataRole.DisplayRole: return self.cell_text(req, col)
+        if role == Qt.ItemDataRole.TextAlignmentRole: return Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignLeft
+        if role == Qt.ItemDataRole.UserRole: return req
+        if role == Qt.ItemDataRole.ForegroundRole and col == 5: return status_color(req.get('status', ''))
+        if col == 8 and req.get('needs_review', False):
+            if role == Qt.ItemDataRole.BackgroundRole: return QColor("#FFCCCC")
+            if role == Qt.ItemDataRole.ToolTipRole: return "Richiede Revisione: ID o Parent ID modificato."
+        return None
+
+    # --- indice di ricerca: testo minuscolo di tutte le colonne, calcolato una volta per riga ---
+    def haystack(self, row):
+        h = self.hay[row]
+        if h is None:
+            req = self.reqs[row]
+            h = self.hay[row] = "\n".join(self.cell_text(req, c) for c in range(self.n_cols)).lower()
+        return h
+
+    def match_rows(self, text, candidates=None):
+        """Righe che contengono text; candidates restringe la ricerca (query che si allunga)."""
+        return [r for r in (range(len(self.reqs)) if candidates is None else candidates) if text in self.haystack(r)]
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal: return self.HEADERS[section]
+        return None
+
+    # --- notifiche puntuali (niente rebuild) ---
+    def row_changed(self, row):
+        if 0 <= row < len(self.reqs): self.dataChanged.emit(self.index(row, 0), self.index(row, self.n_cols - 1))
+
+    # --- hook per apply_op sulla lista mostrata ---
+    def before_op(self, op):
+        if op['op'] == 'ins': self.beginInsertRows(QModelIndex(), op['i'], op['i'])
+        elif op['op'] == 'del': self.beginRemoveRows(QModelIndex(), op['i'], op['i'])
+
+    def after_op(self, op):
+        k = op['op']; i = op.get('i')
+        if k == 'ins': self.hay.insert(i, None); self.endInsertRows()
+        elif k == 'del': del self.hay[i]; self.endRemoveRows()
+        elif k == 'set': self.hay[i] = None; self.row_changed(i)
+        elif k == 'swap':
+            j = op['j']; self.hay[i], self.hay[j] = self.hay[j], self.hay[i]
+            self.row_changed(i); self.row_changed(j)
+
+class ReqTableView(QTableView):
+    """Adatta l'altezza solo delle righe visibili e la memorizza, invece di resizeRowsToContents() su tutto."""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.row_heights = {}
+        self.verticalHeader().setDefaultSectionSize(self.fontMetrics().height() + 12)
+        self.verticalScrollBar().valueChanged.connect(self.schedule_fit)
+        self.horizontalHeader().sectionResized.connect(self.invalidate_heights)
+        self._fit_pending = False
+
+    def setModel(self, model):
+        super().setModel(model)
+        model.modelReset.connect(self.invalidate_heights)
+        model.rowsInserted.connect(self.invalidate_heights)
+        model.rowsRemoved.connect(self.invalidate_heights)
+        model.dataChanged.connect(self.on_data_changed)
+
+    def on_data_changed(self, top_left, bottom_right, roles=None):
+        for r in range(top_left.row(), bottom_right.row() + 1): self.row_heights.pop(r, None)
+        self.schedule_fit()
+
+    def invalidate_heights(self, *args):
+        self.row_heights.clear(); self.schedule_fit()
+
+    def schedule_fit(self, *args):
+        if not self._fit_pending: self._fit_pending = True; QTimer.singleShot(0, self.fit_visible_rows)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event); self.schedule_fit()
+
+    def fit_visible_rows(self):
+        self._fit_pending = False
+        model = self.model()
+        if model is None or model.rowCount() == 0: return
+        first = self.rowAt(0)
+        if first < 0: first = 0
+        last = self.rowAt(self.viewport().height() - 1)
+        if last < 0: last = model.rowCount() - 1
+        for r in range(first, last + 1):
+            if self.isRowHidden(r) or r in self.row_heights: continue
+            self.resizeRowToContents(r)
+            self.row_heights[r] = self.rowHeight(r)
+        # righe ridimensionate possono spostare il fondo della viewport
+        if self.rowAt(self.viewport().height() - 1) > last: self.schedule_fit()
 
 # --- DIALOGS ---
 class StartupDialog(QDialog):
@@ -83,16 +300,14 @@ class NewProjectDialog(QDialog):
     def get_data(self): return (self.inp_name.text().strip(), self.radio_mission.isChecked(), self.combo_sub.currentText())
 
 class RequirementDialog(QDialog):
-    def __init__(self, parent, existing_ids, full_db, current_project, req_data=None):
+    def __init__(self, parent, existing_ids, full_db, current_project, req_data=None, index=None):
         super().__init__(parent)
         self.setWindowTitle("Requirement Details"); self.setMinimumWidth(800); self.setMinimumHeight(500)
         self.existing_ids = existing_ids; self.full_db = full_db; self.current_project = current_project
+        self.index = index
         self.original_id = req_data.get('id', None) if req_data else None
         
-        self.req_data = req_data if req_data else {
-            'id': '', 'type': 'System', 'desc': '', 'parent_id': '', 'value': '', 'unit': '', 
-            'status': 'Draft', 'method': 'Analysis', 'last_modified': '', 'needs_review': False
-        }
+        self.req_data = req_data if req_data else new_req()
 
         main_layout = QVBoxLayout(self); main_layout.setSpacing(20); main_layout.setContentsMargins(20, 20, 20, 20)
         
@@ -106,7 +321,7 @@ class RequirementDialog(QDialog):
             self.inp_id.setText(self.req_data['id'])
         # -----------------------------------------------------
 
-        self.inp_type = QComboBox(); self.inp_type.addItems(["System", "Functional", "Performance", "Interface", "Environmental", "Design", "Safety"])
+        self.inp_type = QComboBox(); self.inp_type.addItems(TYPE_OPTS)
         self.inp_parent = QLineEdit(); self.inp_parent.setPlaceholderText("Parent ID")
         lay_info.addWidget(QLabel("ID:"),0,0); lay_info.addWidget(self.inp_id,1,0)
         lay_info.addWidget(QLabel("Type:"),0,1); lay_info.addWidget(self.inp_type,1,1)
@@ -122,10 +337,10 @@ class RequirementDialog(QDialog):
         self.inp_value = QLineEdit(); self.inp_unit = QLineEdit()
         
         self.inp_status = QComboBox()
-        self.status_opts = ["Draft", "TBD (To Be Defined)", "TBC (To Be Confirmed)", "Verified", "Closed", "Obsolete"]
+        self.status_opts = STATUS_OPTS
         self.inp_status.addItems(self.status_opts)
         
-        self.inp_method = QComboBox(); self.inp_method.addItems(["Test", "Analysis", "Inspection", "Review of Design", "Similarity"])
+        self.inp_method = QComboBox(); self.inp_method.addItems(METHOD_OPTS)
         lay_det.addWidget(QLabel("Value:"),0,0); lay_det.addWidget(self.inp_value,1,0)
         lay_det.addWidget(QLabel("Unit:"),0,1); lay_det.addWidget(self.inp_unit,1,1)
         lay_det.addWidget(QLabel("Status:"),0,2); lay_det.addWidget(self.inp_status,1,2)
@@ -140,7 +355,7 @@ class RequirementDialog(QDialog):
 
         # Popolamento
         self.inp_type.setCurrentText(self.req_data['type'])
-        if '<' in self.req_data['desc']: self.inp_desc.setHtml(self.req_data['desc'])
+        if '<' in self.req_data['desc']: self.inp_desc.setHtml(rich_desc(self.req_data['desc']))
         else: self.inp_desc.setPlainText(self.req_data['desc'])
         
         self.inp_parent.setText(self.req_data['parent_id'])
@@ -154,47 +369,21 @@ class RequirementDialog(QDialog):
         
         self.inp_method.setCurrentText(self.req_data['method'])
 
+    @profiled("generate_next_id")
     def generate_next_id(self):
-        max_num = 0
-        pattern = re.compile(r'^REQ-(\d+)$', re.IGNORECASE)
-        for existing_id in self.existing_ids:
-            match = pattern.match(existing_id)
-            if match:
-                try:
-                    num = int(match.group(1))
-                    if num > max_num: max_num = num
-                except ValueError: continue
-        return f"REQ-{max_num + 1:03d}"
+        return self.index.next_req_id() if self.index is not None else next_req_id(self.existing_ids)
 
+    @profiled("check_circular_dependency")
     def check_circular_dependency(self, target_id, new_parent_id):
-        if not new_parent_id: return False
-        if target_id == new_parent_id: return True 
-        def find_req(rid):
-            for sub in self.full_db[self.current_project].values():
-                for r in sub:
-                    if r['id'] == rid: return r
-            return None
-        current = find_req(new_parent_id)
-        while current and current.get('parent_id'):
-            pid = current['parent_id']
-            if pid == target_id: return True 
-            current = find_req(pid)
-        return False
+        if self.index is not None: return creates_cycle(self.index.get, target_id, new_parent_id)
+        by_id = {r.get('id'): r for sub in self.full_db[self.current_project].values() for r in sub}
+        return creates_cycle(by_id.get, target_id, new_parent_id)
 
     def validate_and_accept(self):
         new_id = self.inp_id.text().strip()
         new_parent = self.inp_parent.text().strip()
-        
-        if not new_id: QMessageBox.warning(self, "Error", "ID mandatory."); return
-        if " " in new_id: QMessageBox.warning(self, "Error", "ID no spaces."); return
-        if new_id in self.existing_ids and new_id != self.original_id: QMessageBox.warning(self, "Error", "ID exists."); return
-        if new_parent == new_id: QMessageBox.warning(self, "Error", "Self-parenting."); return
-        
-        if new_parent:
-            if new_parent not in self.existing_ids:
-                QMessageBox.warning(self, "Error", f"Parent ID '{new_parent}' does not exist.")
-                return
-
+        err = req_id_error(new_id, new_parent, self.existing_ids, self.original_id)
+        if err: QMessageBox.warning(self, "Error", err); return
         if self.original_id and new_parent:
             if self.check_circular_dependency(self.original_id, new_parent):
                 QMessageBox.critical(self, "Error", "Circular Dependency detected!"); return
@@ -202,10 +391,10 @@ class RequirementDialog(QDialog):
     
     def get_data(self):
         is_new_req = self.original_id is None
-        return {
+        return Requirement({
             "id": self.inp_id.text().strip(), 
             "type": self.inp_type.currentText(), 
-            "desc": self.inp_desc.toHtml(), 
+            "desc": compact_desc(self.inp_desc.toHtml()), 
             "parent_id": self.inp_parent.text().strip(), 
             "value": self.inp_value.text(), 
             "unit": self.inp_unit.text(), 
@@ -213,75 +402,260 @@ class RequirementDialog(QDialog):
             "method": self.inp_method.currentText(), 
             "last_modified": get_timestamp(), 
             "needs_review": self.req_data.get('needs_review', False) if not is_new_req else False
-        }
+        })
 
-class ChildrenViewDialog(QDialog):
-    def __init__(self, parent, parent_id, children_data):
+class TraceDialog(QDialog):
+    """Tracciabilita' di un requisito: catena dei parent fino al livello missione, poi il sotto-albero dei
+    discendenti (anche in altri sottosistemi) creato un livello alla volta, quando si apre il nodo."""
+    LAZY = Qt.ItemDataRole.UserRole + 1
+    def __init__(self, parent, project, pindex, req):
         super().__init__(parent)
-        self.setWindowTitle(f"Children of {parent_id}"); self.resize(800, 450)
+        self.setWindowTitle(f"Trace {req['id']}"); self.resize(900, 550)
+        self.project = project; self.pindex = pindex; self.selected = None
         layout = QVBoxLayout(self)
-        
-        self.table = QTableWidget()
-        headers = ["ID", "Type", "Description", "Target", "Unit", "Status", "Method", "Parent"]
-        self.table.setColumnCount(len(headers))
-        self.table.setHorizontalHeaderLabels(headers)
+        down = pindex.descendants(req['id'])
+        subs = sorted({pindex.subsystem_of(r) for _, r in down})
+        layout.addWidget(QLabel(f"Impact: {len(down)} descendant(s), depth {max((d for d, _ in down), default=0)}"
+                                + (f" in {', '.join(subs)}" if subs else "") + "  —  double-click to open"))
+
+        self.tree = QTreeWidget(); self.tree.setHeaderLabels(["ID", "Subsystem", "Type", "Status", "Description"])
+        self.tree.setColumnWidth(0, 200); self.tree.setColumnWidth(1, 120)
+        self.tree.itemExpanded.connect(self.expand); self.tree.itemDoubleClicked.connect(self.open_item)
+        # catena degli antenati: solo il percorso, dall'alto verso il requisito
+        node = self.tree.invisibleRootItem(); up = pindex.ancestors(req['id'])
+        top_pid = (up[-1] if up else req).get('parent_id')
+        if top_pid and pindex.get(top_pid) is None:
+            node = QTreeWidgetItem(node, [top_pid, "", "", "", "(missing parent)"]); node.setForeground(0, QColor("#c62828"))
+        for r in reversed(up): node = self.add_item(node, r, lazy=False)
+        target = self.add_item(node, req); f = target.font(0); f.setBold(True); target.setFont(0, f)
+        self.tree.expandAll(); self.tree.setCurrentItem(target)
+        layout.addWidget(self.tree)
+        layout.addWidget(QPushButton("Close", clicked=self.reject))
+
+    def add_item(self, parent_item, r, lazy=True):
+        it = QTreeWidgetItem(parent_item, [r['id'], self.pindex.subsystem_of(r) or "", r.get('type', ''), r.get('status', ''),
+                                           clean_html_smart(r.get('desc', '')).replace("\n", " ")[:160]])
+        it.setData(0, Qt.ItemDataRole.UserRole, r); it.setData(0, self.LAZY, lazy)
+        if lazy and self.pindex.has_children(r['id']):
+            it.setChildIndicatorPolicy(QTreeWidgetItem.ChildIndicatorPolicy.ShowIndicator)
+        return it
+
+    def expand(self, item):
+        if not item.data(0, self.LAZY): return
+        item.setData(0, self.LAZY, False)
+        path = set(); x = item
+        while x is not None: path.add(x.text(0)); x = x.parent()
+        for r in sorted(self.pindex.children_of(item.text(0)), key=lambda r: r['id']):
+            if r['id'] in path:  # ciclo: lo si mostra ma non si espande
+                QTreeWidgetItem(item, [r['id'], "", "", "", "(cycle)"]).setForeground(0, QColor("#c62828"))
+            else: self.add_item(item, r)
+
+    def open_item(self, item, col):
+        r = item.data(0, Qt.ItemDataRole.UserRole)
+        if r is None: return
+        self.selected = (self.project, self.pindex.subsystem_of(r), r); self.accept()
+
+class QueryResultsModel(ReqTableModel):
+    """ReqTableModel con Project/Subsystem in testa; righe (project, subsystem, record)."""
+    def __init__(self, parent, results):
+        super().__init__(parent)
+        self.locs = [(p, s) for p, s, _ in results]
+        self.set_reqs([r for _, _, r in results])
+
+    def columnCount(self, parent=QModelIndex()): return 0 if parent.isValid() else self.n_cols + 2
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid(): return None
+        if index.column() < 2: return self.locs[index.row()][index.column()] if role == Qt.ItemDataRole.DisplayRole else None
+        return super().data(self.index(index.row(), index.column() - 2), role)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return ["Project", "Subsystem"][section] if section < 2 else self.HEADERS[section - 2]
+        return None
+
+class QueryResultsDialog(QDialog):
+    def __init__(self, parent, query_text, results, elapsed_ms):
+        super().__init__(parent)
+        self.setWindowTitle(f"Query: {query_text}"); self.resize(1000, 500)
+        self.results = results; self.selected = None
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel(f"{len(results)} requirement(s) in {elapsed_ms:.1f} ms  —  double-click to open"))
+        self.table = ReqTableView()
+        self.model = QueryResultsModel(self, results)
+        self.table.setModel(self.model)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
-        self.table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
-        self.table.setAlternatingRowColors(False)
+        self.table.horizontalHeader().setSectionResizeMode(4, QHeaderView.ResizeMode.Stretch)
         self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
         self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
-        self.table.setWordWrap(True) 
-
-        self.populate_table(children_data)
+        self.table.setWordWrap(True)
+        self.table.doubleClicked.connect(self.open_result)
         layout.addWidget(self.table)
-        layout.addWidget(QPushButton("Close", clicked=self.accept))
-    
-    def populate_table(self, data):
-        self.table.setRowCount(0)
-        for r_idx, req in enumerate(data):
-            self.table.insertRow(r_idx)
-            def mk_item(txt):
-                it = QTableWidgetItem(str(txt))
-                it.setFlags(it.flags() ^ Qt.ItemFlag.ItemIsEditable) 
-                return it
-
-            self.table.setItem(r_idx, 0, mk_item(req['id']))
-            self.table.setItem(r_idx, 1, mk_item(req.get('type', '-')))
-            self.table.setItem(r_idx, 2, mk_item(clean_html_smart(req.get('desc', ''))))
-            self.table.setItem(r_idx, 3, mk_item(req.get('value', '')))
-            self.table.setItem(r_idx, 4, mk_item(req.get('unit', '')))
-            
-            st_item = mk_item(req.get('status', ''))
-            st_val = req.get('status', '')
-            if "Verified" in st_val: st_item.setForeground(QColor("#006600"))
-            elif "TBD" in st_val or "TBC" in st_val: st_item.setForeground(QColor("#cc0000"))
-            elif "Closed" in st_val or "Obsolete" in st_val: st_item.setForeground(QColor("#666666"))
-            self.table.setItem(r_idx, 5, st_item)
+        layout.addWidget(QPushButton("Close", clicked=self.reject))
+
+    def open_result(self, index):
+        self.selected = self.results[index.row()]; self.accept()
+
+class CsvColumnsDialog(QDialog):
+    def __init__(self, parent, selected):
+        super().__init__(parent)
+        self.setWindowTitle("CSV Columns")
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel("Columns to export:"))
+        self.checks = []
+        for h, _ in CSV_COLUMNS:
+            cb = QCheckBox(h); cb.setChecked(h in selected); self.checks.append(cb); layout.addWidget(cb)
+        btn_box = QHBoxLayout()
+        ok_btn = QPushButton("Export"); ok_btn.clicked.connect(self.validate_and_accept)
+        cancel_btn = QPushButton("Cancel"); cancel_btn.clicked.connect(self.reject)
+        btn_box.addWidget(cancel_btn); btn_box.addWidget(ok_btn)
+        layout.addLayout(btn_box)
+    def validate_and_accept(self):
+        if not self.get_data(): QMessageBox.warning(self, "Error", "Select at least one column."); return
+        self.accept()
+    def get_data(self): return [cb.text() for cb in self.checks if cb.isChecked()]
+
+class ImportReportDialog(QDialog):
+    def __init__(self, parent, file_name, n_ok, errors):
+        super().__init__(parent)
+        self.setWindowTitle(f"Import: {file_name}"); self.resize(700, 450)
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel(f"{n_ok} row(s) valid, {len(errors)} rejected:"))
+        report = QTextEdit(); report.setReadOnly(True)
+        report.setPlainText("\n".join(f"Row {line}: {rid or '-'}: {msg}" for line, rid, msg in errors))
+        layout.addWidget(report)
+        btn_box = QHBoxLayout()
+        cancel_btn = QPushButton("Cancel"); cancel_btn.clicked.connect(self.reject)
+        ok_btn = QPushButton(f"Import {n_ok} valid row(s)"); ok_btn.clicked.connect(self.accept); ok_btn.setEnabled(n_ok > 0)
+        btn_box.addWidget(cancel_btn); btn_box.addWidget(ok_btn)
+        layout.addLayout(btn_box)
+
+class IntegrityReportDialog(QDialog):
+    def __init__(self, parent, issues):
+        super().__init__(parent)
+        self.setWindowTitle("Integrity Check"); self.resize(900, 450)
+        self.issues = issues; self.selected = None
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel(f"{len(issues)} issue(s), affected requirements are marked for review  —  double-click to open"
+                                if issues else "No issues: IDs are unique, every parent exists and there are no cycles."))
+        self.tree = QTreeWidget(); self.tree.setRootIsDecorated(False)
+        self.tree.setHeaderLabels(["Project", "Subsystem", "ID", "Issue"]); self.tree.setColumnWidth(2, 140)
+        for k, it in enumerate(issues):
+            QTreeWidgetItem(self.tree, [it['project'], it['subsystem'], it['id'] or "-", it['message']]).setData(0, Qt.ItemDataRole.UserRole, k)
+        self.tree.itemDoubleClicked.connect(self.open_issue)
+        layout.addWidget(self.tree)
+        layout.addWidget(QPushButton("Close", clicked=self.reject))
+
+    def open_issue(self, item, col):
+        self.selected = self.issues[item.data(0, Qt.ItemDataRole.UserRole)]; self.accept()
+
+class BaselineDiffDialog(QDialog):
+    """Confronto tra due baseline, o tra una baseline e la copia di lavoro: aggiunti, rimossi e modificati
+    (con i campi cambiati) per sottosistema."""
+    WORKING = "Working copy"
+    def __init__(self, parent, baselines, data):
+        super().__init__(parent)
+        self.setWindowTitle("Compare Baselines"); self.resize(900, 550)
+        self.baselines = baselines; self.data = data; self.selected = None
+        layout = QVBoxLayout(self)
+        names = [b['name'] for b in baselines.names()]
+        row = QHBoxLayout()
+        self.cb_a = QComboBox(); self.cb_a.addItems(names)
+        self.cb_b = QComboBox(); self.cb_b.addItems(names + [self.WORKING]); self.cb_b.setCurrentText(self.WORKING)
+        for w in (QLabel("From:"), self.cb_a, QLabel("To:"), self.cb_b): row.addWidget(w)
+        row.addWidget(QPushButton("Compare", clicked=self.compare)); row.addStretch()
+        layout.addLayout(row)
+        self.lbl = QLabel(""); layout.addWidget(self.lbl)
+        self.tree = QTreeWidget(); self.tree.setHeaderLabels(["Change", "Fields"]); self.tree.setColumnWidth(0, 320)
+        self.tree.itemDoubleClicked.connect(self.open_item)
+        layout.addWidget(self.tree)
+        layout.addWidget(QPushButton("Close", clicked=self.reject))
+        if names: self.compare()
 
-            self.table.setItem(r_idx, 6, mk_item(req.get('method', '')))
-            self.table.setItem(r_idx, 7, mk_item(req.get('parent_id', '')))
-        self.table.resizeRowsToContents()
+    def compare(self):
+        a = self.cb_a.currentText(); b = self.cb_b.currentText()
+        if not a: return
+        t0 = time.perf_counter()
+        changes = self.baselines.diff(a, self.data if b == self.WORKING else b)
+        self.tree.clear(); n = 0
+        for ch in changes:
+            node = QTreeWidgetItem(self.tree, [f"{ch['project']} / {ch['subsystem']}", f"+{len(ch['added'])}  −{len(ch['removed'])}  ~{len(ch['modified'])}"])
+            for sign, ids in (("+", ch['added']), ("−", ch['removed'])):
+                for rid in ids: self.add(node, ch, f"{sign} {rid}", "", rid if sign == "+" else None)
+            for rid, fields in ch['modified']: self.add(node, ch, f"~ {rid}", ", ".join(fields), rid)
+            n += len(ch['added']) + len(ch['removed']) + len(ch['modified'])
+        self.tree.expandToDepth(0)
+        self.lbl.setText(f"{n} change(s) in {len(changes)} subsystem(s), {(time.perf_counter() - t0) * 1000:.0f} ms"
+                         + ("  —  double-click to open" if b == self.WORKING else ""))
+
+    def add(self, node, ch, text, fields, rid):
+        it = QTreeWidgetItem(node, [text, fields])
+        if rid and self.cb_b.currentText() == self.WORKING: it.setData(0, Qt.ItemDataRole.UserRole, (ch['project'], ch['subsystem'], rid))
+
+    def open_item(self, item, col):
+        loc = item.data(0, Qt.ItemDataRole.UserRole)
+        if not loc: return
+        p, s, rid = loc; r = next((x for x in self.data.get(p, {}).get(s, []) if x.get('id') == rid), None)
+        if r is not None: self.selected = (p, s, r); self.accept()
 
 # --- MAIN APP ---
 class SatReqManager(QMainWindow):
+    remote_event = pyqtSignal(object)  # eventi del server, emessi dal thread di ascolto di RemoteStore
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle(f"SatReq Manager {VERSION}")
         if os.path.exists(ICON_NAME): self.setWindowIcon(QIcon(ICON_NAME))
         self.resize(1200, 750)
-        self.data = {}; self.current_project = None; self.current_subsystem = None; self.db_path = None
+        self.data = {}; self.current_project = None; self.current_subsystem = None; self.db_path = None; self.store = None
+        self.t_start = time.perf_counter(); self.loader = None; self.loading = False
+        self.export_worker = None; self.report_cache = ReportCache()
+        self.tree_nodes = {}  # project -> (nodo progetto, {subsystem: nodo}), mantenuto da apply_ops
+        self.undo_log = UndoLog()
+        self.remote_event.connect(self.on_remote_event); self.reload_pending = False
+        self.index = DatabaseIndex(self.data)
         self.setup_ui()
-        QTimer.singleShot(100, self.check_and_load_startup)
+        self.saver = PersistenceWorker(self, self.read_config().get("save_debounce_ms", SAVE_DEBOUNCE_MS))
+        self.saver.saved.connect(self.on_saved); self.saver.failed.connect(self.on_save_failed)
+        self.saver.start()
+        QTimer.singleShot(0, self.check_and_load_startup)
 
     def setup_ui(self):
         mb = self.menuBar(); fm = mb.addMenu('File')
         fm.addAction(QAction('Open...', self, triggered=self.open_existing_db_dialog))
         fm.addAction(QAction('New...', self, triggered=self.create_new_db_dialog))
+        fm.addAction(QAction('Connect to Server...', self, triggered=self.connect_server_dialog))
         fm.addSeparator()
         self.act_save = QAction('Save', self, triggered=self.save_database); fm.addAction(self.act_save)
         self.act_csv = QAction('Export CSV', self, triggered=self.export_csv); fm.addAction(self.act_csv)
         self.act_pdf = QAction('Export PDF', self, triggered=self.export_pdf); fm.addAction(self.act_pdf)
-        self.act_csv.setEnabled(False); self.act_pdf.setEnabled(False)
+        self.act_import = QAction('Import CSV/ReqIF...', self, triggered=self.import_requirements); fm.addAction(self.act_import)
+        fm.addSeparator()
+        self.act_migrate = QAction('Migrate to SQLite...', self, triggered=self.migrate_to_sqlite); fm.addAction(self.act_migrate)
+        self.act_shard = QAction('Split into Shards...', self, triggered=self.migrate_to_shards); fm.addAction(self.act_shard)
+        self.act_csv.setEnabled(False); self.act_pdf.setEnabled(False); self.act_import.setEnabled(False)
+
+        em = mb.addMenu('Edit')
+        self.act_undo = QAction('Undo', self, shortcut=QKeySequence.StandardKey.Undo, triggered=self.undo); em.addAction(self.act_undo)
+        self.act_redo = QAction('Redo', self, shortcut=QKeySequence.StandardKey.Redo, triggered=self.redo); em.addAction(self.act_redo)
+        self.act_undo.setEnabled(False); self.act_redo.setEnabled(False)
+
+        bm = mb.addMenu('Baselines')
+        self.act_baseline = QAction('Create Baseline...', self, triggered=self.create_baseline); bm.addAction(self.act_baseline)
+        self.act_compare = QAction('Compare...', self, triggered=self.compare_baselines); bm.addAction(self.act_compare)
+        self.act_del_baseline = QAction('Delete Baseline...', self, triggered=self.delete_baseline); bm.addAction(self.act_del_baseline)
+
+        rm = mb.addMenu('Trace')
+        rm.addAction(QAction('Orphans in Project...', self, triggered=lambda: self.show_trace_report("orphans")))
+        rm.addAction(QAction('Leaves in Project...', self, triggered=lambda: self.show_trace_report("leaves")))
+
+        tm = mb.addMenu('Tools')
+        tm.addAction(QAction('Check Integrity...', self, triggered=self.check_integrity))
+        tm.addAction(QAction('Compact Descriptions...', self, triggered=self.compact_descriptions)); tm.addSeparator()
+        self.act_prof = QAction('Profiling', self, checkable=True, checked=PROFILER.enabled, toggled=self.toggle_profiling); tm.addAction(self.act_prof)
+        self.act_cprof = QAction('Record cProfile', self, checkable=True, checked=PROFILER.cprof is not None, toggled=self.toggle_cprofile); tm.addAction(self.act_cprof)
+        tm.addAction(QAction('Export Timings...', self, triggered=self.export_timings))
+        tm.addAction(QAction('Reset Timings', self, triggered=lambda: (PROFILER.reset(), self.lbl_prof.setText(""))))
 
         mw = QWidget(); self.setCentralWidget(mw); main_layout = QHBoxLayout(mw)
         splitter = QSplitter(Qt.Orientation.Horizontal)
@@ -310,8 +684,13 @@ class SatReqManager(QMainWindow):
         right = QWidget(); rv = QVBoxLayout(right)
         rbar = QHBoxLayout()
         self.lbl_title = QLabel("Dashboard"); self.lbl_title.setStyleSheet("font-size: 18px; font-weight: bold;")
-        self.search = QLineEdit(); self.search.setPlaceholderText("Search all columns..."); self.search.setFixedWidth(250)
-        self.search.textChanged.connect(self.apply_filter); self.search.setEnabled(False)
+        self.search = QLineEdit(); self.search.setPlaceholderText("Search... (Enter: query all, e.g. status:TBD type:Perf*)"); self.search.setFixedWidth(320)
+        self.search.returnPressed.connect(self.run_global_query)
+        self.search.setEnabled(False)
+        # debounce: il filtro parte solo quando si smette di digitare
+        self.filter_timer = QTimer(self); self.filter_timer.setSingleShot(True); self.filter_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.filter_timer.timeout.connect(lambda: self.apply_filter(self.search.text()))
+        self.search.textChanged.connect(self.filter_timer.start); self.filter_state = None
         
         self.btn_nr = QPushButton("+ Req"); self.btn_nr.setEnabled(False); self.btn_nr.clicked.connect(self.add_requirement)
         
@@ -329,10 +708,10 @@ class SatReqManager(QMainWindow):
         rbar.addWidget(self.btn_nr); rbar.addWidget(self.btn_dr)
         rv.addLayout(rbar)
 
-        self.table = QTableWidget()
-        self.table_headers = ["ID", "Type", "Description", "Target", "Unit", "Status", "Method", "Parent", "Review"]
-        self.table.setColumnCount(len(self.table_headers))
-        self.table.setHorizontalHeaderLabels(self.table_headers)
+        self.table = ReqTableView()
+        self.model = ReqTableModel(self)
+        self.table.setModel(self.model)
+        self.model.modelReset.connect(self.reset_filter_state)
         
         self.table.setAlternatingRowColors(False)
         self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
@@ -342,7 +721,7 @@ class SatReqManager(QMainWindow):
         self.table.setWordWrap(True)
 
         self.table.doubleClicked.connect(self.edit_requirement)
-        self.table.itemSelectionChanged.connect(self.update_ui_state)
+        self.table.selectionModel().selectionChanged.connect(self.update_ui_state)
         self.table.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.table.customContextMenuRequested.connect(self.context_menu)
 
@@ -354,13 +733,19 @@ class SatReqManager(QMainWindow):
         splitter.addWidget(left); splitter.addWidget(right); splitter.setSizes([280, 920])
         main_layout.addWidget(splitter)
 
+        self.lbl_save = QLabel(""); self.statusBar().addPermanentWidget(self.lbl_save)
+        # readout del profiler: ultima operazione misurata, aggiornato solo a profiling attivo
+        self.lbl_prof = QLabel(""); self.statusBar().addPermanentWidget(self.lbl_prof)
+        self.prof_timer = QTimer(self); self.prof_timer.setInterval(500); self.prof_timer.timeout.connect(self.show_last_timing)
+        if PROFILER.enabled: self.prof_timer.start()
+
     # --- UI STATE MANAGEMENT ---
     def update_ui_state(self):
         has_proj = self.current_project is not None
         has_sub = self.current_subsystem is not None
-        has_row_sel = len(self.table.selectedItems()) > 0
-        curr_row = self.table.currentRow()
-        row_count = self.table.rowCount()
+        has_row_sel = self.table.selectionModel().hasSelection()
+        curr_row = self.current_row()
+        row_count = self.model.rowCount()
         is_searching = self.search.text() != ""
         
         self.btn_ep.setEnabled(has_proj)
@@ -368,6 +753,11 @@ class SatReqManager(QMainWindow):
         self.btn_add_sub.setEnabled(has_proj)
         self.act_csv.setEnabled(has_proj)
         self.act_pdf.setEnabled(has_proj)
+        self.act_import.setEnabled(has_proj)
+        local = self.store is not None and not isinstance(self.store, RemoteStore)
+        for act in (self.act_baseline, self.act_compare, self.act_del_baseline): act.setEnabled(local)
+        self.act_migrate.setEnabled(local and not isinstance(self.store, SqliteStore))
+        self.act_shard.setEnabled(local and not isinstance(self.store, ShardedStore))
         
         self.btn_ren_sub.setEnabled(has_sub)
         self.btn_del_sub.setEnabled(has_sub)
@@ -381,79 +771,123 @@ class SatReqManager(QMainWindow):
         self.btn_down.setEnabled(can_move and curr_row < row_count - 1)
 
     # --- LOGIC ---
+    def current_row(self):
+        return self.table.currentIndex().row() if self.table.selectionModel().hasSelection() else -1
+
+    @profiled("load_table", lambda res, self: self.model.rowCount())
     def load_table(self):
         if not self.current_project or not self.current_subsystem: 
-            self.table.setRowCount(0); return
-
-        reqs = self.data[self.current_project].get(self.current_subsystem, [])
-        self.table.setRowCount(0) 
+            self.model.set_reqs([]); return
 
-        for r_idx, req in enumerate(reqs):
-            self.table.insertRow(r_idx)
+        self.model.set_reqs(self.data[self.current_project].get(self.current_subsystem, []))
 
-            def create_item(text, align=Qt.AlignmentFlag.AlignLeft):
-                item = QTableWidgetItem(str(text))
-                item.setTextAlignment(Qt.AlignmentFlag.AlignVCenter | align)
-                return item
-
-            item_id = create_item(req['id'])
-            item_id.setData(Qt.ItemDataRole.UserRole, req) 
-            self.table.setItem(r_idx, 0, item_id)
-
-            self.table.setItem(r_idx, 1, create_item(req.get('type', '-')))
-            self.table.setItem(r_idx, 2, create_item(clean_html_smart(req.get('desc', ''))))
-            self.table.setItem(r_idx, 3, create_item(req.get('value', '')))
-            self.table.setItem(r_idx, 4, create_item(req.get('unit', '')))
-            
-            item_status = create_item(req.get('status', ''))
-            st = req.get('status', '')
-            if "Verified" in st: item_status.setForeground(QColor("#006600")) 
-            if "TBD" in st or "TBC" in st: item_status.setForeground(QColor("#cc0000")) 
-            if "Closed" in st or "Obsolete" in st: item_status.setForeground(QColor("#666666")) 
-            self.table.setItem(r_idx, 5, item_status)
-
-            self.table.setItem(r_idx, 6, create_item(req.get('method', '')))
-            self.table.setItem(r_idx, 7, create_item(req.get('parent_id', '')))
-
-            # Review column
-            needs_review = req.get('needs_review', False)
-            item_review = create_item("YES" if needs_review else "NO")
-            if needs_review: 
-                item_review.setBackground(QColor("#FFCCCC")) 
-                item_review.setToolTip("Richiede Revisione: ID o Parent ID modificato.")
-            self.table.setItem(r_idx, 8, item_review)
-            
         self.table.resizeColumnToContents(0) 
         self.table.resizeColumnToContents(1) 
         self.table.resizeColumnToContents(8) 
-        self.table.resizeRowsToContents()
         
         if self.search.text(): self.apply_filter(self.search.text())
 
+    def reset_filter_state(self):
+        self.filter_state = None
+
+    @profiled("apply_filter", lambda res, self, text: self.model.rowCount())
     def apply_filter(self, text):
-        text = text.lower()
-        rows = self.table.rowCount()
-        cols = self.table.columnCount()
-        for r in range(rows):
-            match = False
-            for c in range(cols):
-                item = self.table.item(r, c)
-                if item and text in item.text().lower(): match = True; break
-            self.table.setRowHidden(r, not match)
+        text = text.lower(); prev = self.filter_state
+        q = self.compile_search(text)
+        # se la query si allunga bastano le righe che gia' corrispondevano (solo ricerca semplice)
+        narrowing = q is None and prev is not None and text.startswith(prev[0])
+        rows = prev[1] if narrowing else range(self.model.rowCount())
+        if q is not None:
+            pidx = self.index.project(self.current_project); reqs = self.model.reqs
+            matches = {r for r in rows if q.match(self.current_project, self.current_subsystem, reqs[r], pidx)}
+            text = ""  # niente restringimento incrementale sulle query strutturate
+        else: matches = set(self.model.match_rows(text, rows)) if text else None
+        self.table.setUpdatesEnabled(False)
+        for r in rows:
+            hide = matches is not None and r not in matches
+            if self.table.isRowHidden(r) != hide: self.table.setRowHidden(r, hide)
+        self.table.setUpdatesEnabled(True)
+        self.filter_state = (text, sorted(matches)) if text else None
+        self.table.schedule_fit()
         self.update_ui_state()
 
+    def compile_search(self, text):
+        """Query strutturata dalla casella di ricerca, o None per la ricerca semplice."""
+        self.search.setStyleSheet(""); self.search.setToolTip("")
+        if not is_structured_query(text): return None
+        try: return compile_query(text)
+        except QueryError as e:
+            self.search.setStyleSheet("color: #cc0000;"); self.search.setToolTip(str(e)); return None
+
+    @profiled("global_query")
+    def run_global_query(self):
+        text = self.search.text().strip()
+        if not text or not self.data: return
+        try: q = compile_query(text)
+        except QueryError as e: QMessageBox.warning(self, "Query Error", str(e)); return
+        t0 = time.perf_counter(); results = q.run(self.index)
+        d = QueryResultsDialog(self, text, results, (time.perf_counter() - t0) * 1000)
+        if d.exec() and d.selected: self.goto_requirement(*d.selected)
+
+    def goto_requirement(self, project, subsystem, req):
+        s_node = self.tree_nodes.get(project, (None, {}))[1].get(subsystem)
+        if s_node is None: return
+        self.tree.setCurrentItem(s_node); self.search.blockSignals(True); self.search.clear(); self.search.blockSignals(False)
+        self.on_tree_click(s_node, 0)
+        row = next((k for k, r in enumerate(self.model.reqs) if r is req), -1)
+        if row >= 0: self.table.selectRow(row); self.table.scrollTo(self.model.index(row, 0))
+
     # --- TREE ACTIONS ---
+    # Ricostruzione completa solo al caricamento; dopo, apply_ops tocca soltanto i nodi delle operazioni
+    # (tree_apply + contatori), quindi selezione, espansione e scroll dell'albero restano dove sono.
+    @profiled("refresh_tree", lambda res, self: self.tree.topLevelItemCount())
     def refresh_tree(self):
-        self.tree.clear()
-        for proj_name, subsystems in self.data.items():
-            p_node = QTreeWidgetItem(self.tree); p_node.setText(0, f"📦 {proj_name}"); p_node.setData(0, Qt.ItemDataRole.UserRole, proj_name) 
-            p_node.setFont(0, QFont("Segoe UI", 13, QFont.Weight.Bold))
-            std_order = ["Mission","Payload","AOCS","EPS","TCS","COMMS","OBDH","Structure"]
-            sorted_keys = sorted(subsystems.keys(), key=lambda x: (std_order.index(x) if x in std_order else 99, x))
-            for sub in sorted_keys:
-                s_node = QTreeWidgetItem(p_node); s_node.setText(0, f"{sub} ({len(subsystems[sub])})")
-                s_node.setData(0, Qt.ItemDataRole.UserRole, sub)
-            p_node.setExpanded(True)
+        self.tree.clear(); self.tree_nodes = {}
+        for proj_name in self.data: self.tree_add_project(proj_name)
+
+    def tree_add_project(self, p):
+        p_node = QTreeWidgetItem(self.tree); p_node.setText(0, f"📦 {p}"); p_node.setData(0, Qt.ItemDataRole.UserRole, p)
+        p_node.setFont(0, QFont("Segoe UI", 13, QFont.Weight.Bold))
+        subs = {}; self.tree_nodes[p] = (p_node, subs)
+        for sub in sorted(self.data[p], key=sub_sort_key): subs[sub] = self.tree_sub_node(p, sub)
+        p_node.addChildren(list(subs.values())); p_node.setExpanded(True)
+
+    def tree_sub_node(self, p, sub):
+        # con un database a shard il conteggio viene dal manifest: il sottosistema si carica al click
+        s_node = QTreeWidgetItem([f"{sub} ({sub_count(self.data[p], sub)})"]); s_node.setData(0, Qt.ItemDataRole.UserRole, sub)
+        return s_node
+
+    def tree_insert_sub(self, p, s_node):
+        """Inserisce s_node al suo posto nell'ordine dei sottosistemi (costo proporzionale ai soli sottosistemi di p)."""
+        p_node, subs = self.tree_nodes[p]; key = sub_sort_key(s_node.data(0, Qt.ItemDataRole.UserRole))
+        pos = next((k for k in range(p_node.childCount()) if sub_sort_key(p_node.child(k).data(0, Qt.ItemDataRole.UserRole)) > key), p_node.childCount())
+        p_node.insertChild(pos, s_node); subs[s_node.data(0, Qt.ItemDataRole.UserRole)] = s_node
+
+    def tree_update_count(self, p, sub):
+        s_node = self.tree_nodes.get(p, (None, {}))[1].get(sub)
+        if s_node is not None: s_node.setText(0, f"{sub} ({sub_count(self.data[p], sub)})")
+
+    def tree_apply(self, op):
+        """Aggiorna solo i nodi toccati da un'operazione strutturale; i conteggi di ins/del li aggiorna apply_ops."""
+        k = op['op']; p = op['p']
+        if k == 'add_proj': self.tree_add_project(p)
+        elif k == 'del_proj':
+            p_node, _ = self.tree_nodes.pop(p); self.tree.takeTopLevelItem(self.tree.indexOfTopLevelItem(p_node))
+        elif k == 'ren_proj':
+            # come nei dati il progetto rinominato passa in coda
+            p_node, _ = self.tree_nodes[op['n']] = self.tree_nodes.pop(p); current = self.tree.currentItem()
+            self.tree.takeTopLevelItem(self.tree.indexOfTopLevelItem(p_node)); self.tree.addTopLevelItem(p_node)
+            p_node.setText(0, f"📦 {op['n']}"); p_node.setData(0, Qt.ItemDataRole.UserRole, op['n']); p_node.setExpanded(True)
+            if current is not None: self.tree.setCurrentItem(current)
+        elif k == 'add_sub': self.tree_insert_sub(p, self.tree_sub_node(p, op['s']))
+        elif k == 'del_sub':
+            s_node = self.tree_nodes[p][1].pop(op['s']); s_node.parent().removeChild(s_node)
+        elif k == 'ren_sub':
+            p_node, subs = self.tree_nodes[p]; s_node = subs.pop(op['s']); was_current = self.tree.currentItem() is s_node
+            p_node.takeChild(p_node.indexOfChild(s_node))
+            s_node.setData(0, Qt.ItemDataRole.UserRole, op['n']); s_node.setText(0, f"{op['n']} ({sub_count(self.data[p], op['n'])})")
+            self.tree_insert_sub(p, s_node)
+            if was_current: self.tree.setCurrentItem(s_node)
 
     def on_tree_click(self, item, col):
         data = item.data(0, Qt.ItemDataRole.UserRole)
@@ -465,7 +899,7 @@ class SatReqManager(QMainWindow):
         else: 
             self.current_project = data; self.current_subsystem = None
             self.lbl_title.setText(f"Project: {self.current_project}")
-            self.table.setRowCount(0)
+            self.model.set_reqs([])
         self.update_ui_state()
 
     def add_subsystem(self):
@@ -474,7 +908,7 @@ class SatReqManager(QMainWindow):
         if ok and new_sub:
             new_sub = new_sub.strip()
             if new_sub in self.data[self.current_project]: QMessageBox.warning(self,"Error", "Subsystem already exists."); return
-            self.data[self.current_project][new_sub] = []; self.refresh_tree(); self.save_database()
+            self.apply_ops([{'op': 'add_sub', 'p': self.current_project, 's': new_sub}])
             self.update_ui_state()
     
     def rename_subsystem(self):
@@ -484,124 +918,108 @@ class SatReqManager(QMainWindow):
             new_name = new_name.strip()
             if new_name == self.current_subsystem: return
             if new_name in self.data[self.current_project]: QMessageBox.warning(self, "Error", "Name already exists."); return
-            self.data[self.current_project][new_name] = self.data[self.current_project].pop(self.current_subsystem)
+            self.apply_ops([{'op': 'ren_sub', 'p': self.current_project, 's': self.current_subsystem, 'n': new_name}])
             self.current_subsystem = new_name
-            self.save_database(); self.refresh_tree(); self.lbl_title.setText(f"{self.current_project}  /  {self.current_subsystem}")
+            self.lbl_title.setText(f"{self.current_project}  /  {self.current_subsystem}")
 
     def delete_subsystem(self):
         if not self.current_subsystem: return
         reqs = self.data[self.current_project][self.current_subsystem]
         
         # Check Orphans Risk
-        orphans_risk = []
-        ids_to_delete = {r['id'] for r in reqs}
-        for s_name, s_reqs in self.data[self.current_project].items():
-            if s_name == self.current_subsystem: continue
-            for r in s_reqs:
-                if r.get('parent_id') in ids_to_delete: orphans_risk.append(r['id'])
+        idx = self.index.project(self.current_project)
+        orphans_risk = [c for r in reqs for c in idx.children_of(r['id']) if idx.subsystem_of(c) != self.current_subsystem]
         
         msg = f"Delete '{self.current_subsystem}'?\nContains {len(reqs)} requirements."
-        if orphans_risk: msg += f"\n\n⚠️ WARNING: The following requirements will lose their parents:\n{', '.join(orphans_risk[:5])}..."
+        if orphans_risk: msg += f"\n\n⚠️ WARNING: The following requirements will lose their parents:\n{', '.join(c['id'] for c in orphans_risk[:5])}..."
 
         if QMessageBox.question(self, "Delete", msg, QMessageBox.StandardButton.Yes|QMessageBox.StandardButton.No) == QMessageBox.StandardButton.Yes:
-            if orphans_risk:
-                for s_reqs in self.data[self.current_project].values():
-                    for r in s_reqs:
-                        if r.get('parent_id') in ids_to_delete:
-                            r['parent_id'] = ""; r['needs_review'] = True
-
-            del self.data[self.current_project][self.current_subsystem]
+            ops = [self.parent_ref_op(c, "") for c in orphans_risk]
+            ops.append({'op': 'del_sub', 'p': self.current_project, 's': self.current_subsystem})
+            self.apply_ops(ops)
             self.current_subsystem = None 
-            self.table.setRowCount(0); self.lbl_title.setText(f"Project: {self.current_project}")
-            self.save_database(); self.refresh_tree(); self.update_ui_state()
+            self.model.set_reqs([]); self.lbl_title.setText(f"Project: {self.current_project}")
+            self.update_ui_state()
 
     def get_all_ids(self):
-        ids = set()
-        for s in self.data[self.current_project].values():
-            for r in s: ids.add(r['id'])
-        return ids
+        return self.index.project(self.current_project).ids()
 
     def add_requirement(self):
         if not self.current_subsystem: return
-        d = RequirementDialog(self, self.get_all_ids(), self.data, self.current_project)
+        d = RequirementDialog(self, self.get_all_ids(), self.data, self.current_project, index=self.index.project(self.current_project))
         if d.exec(): 
-            self.data[self.current_project][self.current_subsystem].append(d.get_data())
-            self.search.clear(); self.save_database(); self.load_table(); self.refresh_tree()
+            self.search.clear()
+            self.apply_ops([{'op': 'ins', 'p': self.current_project, 's': self.current_subsystem, 'i': self.model.rowCount(), 'r': d.get_data()}])
 
     def edit_requirement(self, index=None):
-        if self.table.currentRow() < 0: return
-        item = self.table.item(self.table.currentRow(), 0)
-        req_original = item.data(Qt.ItemDataRole.UserRole)
+        req_original = self.model.req_at(self.current_row())
         if not req_original: return
         
-        d = RequirementDialog(self, self.get_all_ids(), self.data, self.current_project, req_original)
+        d = RequirementDialog(self, self.get_all_ids(), self.data, self.current_project, req_original, index=self.index.project(self.current_project))
         if d.exec():
             new_data = d.get_data()
-            req_list = self.data[self.current_project][self.current_subsystem]
-            target_index = -1
-            for i, r in enumerate(req_list):
-                if r['id'] == req_original['id']:
-                    target_index = i
-                    break
+            row = self.current_row()
+            target_index = row if self.model.req_at(row) is req_original else -1
             
             if target_index != -1:
-                if new_data['id'] != req_original['id']: 
-                    self.update_parent_refs(req_original['id'], new_data['id'])
+                ops = []
+                if req_original.get('id') and new_data['id'] != req_original['id']:
+                    ops += self.update_parent_refs(req_original['id'], new_data['id'])
                 
                 new_data['needs_review'] = False 
-                req_list[target_index] = new_data
-                self.save_database(); self.load_table(); self.refresh_tree()
+                ops.append({'op': 'set', 'p': self.current_project, 's': self.current_subsystem, 'i': target_index, 'r': new_data})
+                self.apply_ops(ops)
+                if self.search.text(): self.apply_filter(self.search.text())
             else:
                  QMessageBox.critical(self, "Error", "Could not find requirement to update.")
 
     def delete_requirement(self):
-        if self.table.currentRow() < 0: return
-        item = self.table.item(self.table.currentRow(), 0)
-        req = item.data(Qt.ItemDataRole.UserRole)
+        req = self.model.req_at(self.current_row())
+        if not req: return
         
-        orphans = self.check_orphans(req['id'])
-        msg = f"Delete '{req['id']}'?"
+        rid = req.get('id', '')
+        orphans = self.check_orphans(rid) if rid else []
+        msg = f"Delete '{rid or '(no ID)'}'?"
         if orphans: msg += f"\nWarning: Has {len(orphans)} children."
         if QMessageBox.question(self, "Delete", msg, QMessageBox.StandardButton.Yes|QMessageBox.StandardButton.No) == QMessageBox.StandardButton.Yes:
-            if orphans: self.clean_orphans(req['id'])
-            req_list = self.data[self.current_project][self.current_subsystem]
-            req_list[:] = [r for r in req_list if r['id'] != req['id']]
-            self.save_database(); self.load_table(); self.refresh_tree(); self.update_ui_state()
+            ops = self.clean_orphans(rid) if orphans else []
+            # senza ID si cancella solo il record selezionato, non tutti quelli senza ID
+            for i in reversed([i for i, r in enumerate(self.model.reqs) if r is req or (rid and r.get('id') == rid)]):
+                ops.append({'op': 'del', 'p': self.current_project, 's': self.current_subsystem, 'i': i})
+            self.apply_ops(ops); self.update_ui_state()
 
+    # update_parent_refs / clean_orphans ritornano le operazioni, il chiamante le applica con apply_ops
     def update_parent_refs(self, old, new):
-        for s in self.data[self.current_project].values():
-            for r in s: 
-                if r.get('parent_id')==old: r['parent_id']=new; r['needs_review']=True
+        return reparent_ops(self.data, self.index.project(self.current_project), self.current_project, old, new)
+
+    def parent_ref_op(self, r, new_parent):
+        return parent_ref_op(self.data, self.index.project(self.current_project), self.current_project, r, new_parent)
 
     def check_orphans(self, pid):
-        return [r['id'] for s in self.data[self.current_project].values() for r in s if r.get('parent_id')==pid]
+        return [r['id'] for r in self.index.project(self.current_project).children_of(pid)]
     
     def clean_orphans(self, pid):
-        for s in self.data[self.current_project].values():
-            for r in s: 
-                if r.get('parent_id')==pid: r['parent_id']=""; r['needs_review']=True
+        return self.update_parent_refs(pid, "")
 
     def move_requirement_up(self):
-        row = self.table.currentRow()
+        row = self.current_row()
         if row <= 0: return
-        req_list = self.data[self.current_project][self.current_subsystem]
-        req_list[row], req_list[row-1] = req_list[row-1], req_list[row]
-        self.save_database(); self.load_table(); self.table.selectRow(row-1)
+        self.apply_ops([{'op': 'swap', 'p': self.current_project, 's': self.current_subsystem, 'i': row, 'j': row-1}])
+        self.table.selectRow(row-1)
     
     def move_requirement_down(self):
-        row = self.table.currentRow()
-        req_list = self.data[self.current_project][self.current_subsystem]
-        if row >= len(req_list) - 1: return
-        req_list[row], req_list[row+1] = req_list[row+1], req_list[row]
-        self.save_database(); self.load_table(); self.table.selectRow(row+1)
+        row = self.current_row()
+        if row < 0 or row >= self.model.rowCount() - 1: return
+        self.apply_ops([{'op': 'swap', 'p': self.current_project, 's': self.current_subsystem, 'i': row, 'j': row+1}])
+        self.table.selectRow(row+1)
 
     def add_project(self):
         d = NewProjectDialog(self)
         if d.exec():
             n, std, s = d.get_data()
             if n in self.data: QMessageBox.warning(self, "Error", "Project name already exists."); return
-            self.data[n] = {k:[] for k in ["Mission","Payload","AOCS","EPS","TCS","COMMS","OBDH","Structure"]} if std else {s:[]}
-            self.save_database(); self.refresh_tree(); self.update_ui_state()
+            subs = {k:[] for k in STANDARD_SUBSYSTEMS} if std else {s:[]}
+            self.apply_ops([{'op': 'add_proj', 'p': n, 'subs': subs}]); self.update_ui_state()
     
     def rename_project(self):
         if not self.current_project: return
@@ -610,163 +1028,430 @@ class SatReqManager(QMainWindow):
             n = n.strip()
             if n == self.current_project: return
             if n in self.data: QMessageBox.warning(self, "Error", "Project name already exists."); return
-            self.data[n] = self.data.pop(self.current_project)
+            self.apply_ops([{'op': 'ren_proj', 'p': self.current_project, 'n': n}])
             self.current_project = n 
-            self.save_database(); self.refresh_tree(); self.lbl_title.setText(f"Project: {self.current_project}")
+            self.lbl_title.setText(f"Project: {self.current_project}")
 
     def delete_project(self):
         if not self.current_project: return
         if QMessageBox.question(self,"Delete","Delete entire Project and all requirements?",QMessageBox.StandardButton.Yes|QMessageBox.StandardButton.No)==QMessageBox.StandardButton.Yes:
-            del self.data[self.current_project]
+            self.apply_ops([{'op': 'del_proj', 'p': self.current_project}])
             self.current_project = None; self.current_subsystem = None
-            self.save_database(); self.refresh_tree(); self.table.setRowCount(0); self.lbl_title.setText("Dashboard")
+            self.model.set_reqs([]); self.lbl_title.setText("Dashboard")
             self.update_ui_state()
 
+    @profiled("apply_ops", lambda res, self, ops, *a: len(ops))
+    def apply_ops(self, ops, bulk=False, label=None, record=True, persist=True):
+        """Unico punto di modifica di self.data: aggiorna la tabella riga per riga e passa le operazioni allo store.
+        bulk: niente aggiornamenti riga per riga, la tabella si ricarica una volta sola alla fine (import).
+        record: le inverse diventano un passo di undo (etichetta: label o l'ultima operazione). Ritorna le inverse.
+        persist=False per le operazioni arrivate dal server, che sono gia' scritte, o se poi si salva tutto (save_database)."""
+        if not ops: return []
+        touched = False; counts = set(); invs = []
+        for op in ops:
+            on_table = op['p'] == self.current_project and op.get('s') == self.current_subsystem
+            if on_table: self.filter_state = None; touched = True
+            if on_table and not bulk: self.model.before_op(op)
+            inv = apply_op(self.data, op); invs.append(inv)
+            self.index.apply(op, inv)
+            if on_table and not bulk: self.model.after_op(op)
+            if op['op'] in ('ins', 'del'): counts.add((op['p'], op['s']))
+            elif op['p'] in self.tree_nodes or op['op'] == 'add_proj': self.tree_apply(op)
+            self.follow_op(op)
+        for p, s in counts: self.tree_update_count(p, s)
+        if bulk and touched: self.load_table()
+        if self.store and persist:
+            self.saver.submit(self.store, ops); self.lbl_save.setText("Saving...")
+        if record: self.undo_log.push(label or op_label(ops[-1], invs[-1]), invs); self.update_history_actions()
+        return invs
+
+    def follow_op(self, op):
+        """Tiene current_project/current_subsystem allineati a rinomine ed eliminazioni (anche da undo/redo)."""
+        k = op['op']
+        if op['p'] != self.current_project: return
+        if k == 'ren_proj': self.current_project = op['n']
+        elif k == 'del_proj': self.current_project = None; self.current_subsystem = None
+        elif op.get('s') != self.current_subsystem: return
+        elif k == 'ren_sub': self.current_subsystem = op['n']
+        elif k == 'del_sub': self.current_subsystem = None
+
+    # --- UNDO / REDO ---
+    # Passi del log = inverse delle operazioni, riapplicate con apply_ops: tabella, albero e indice si aggiornano
+    # in modo incrementale e lo store riceve solo le operazioni del passo (journal / SQLite, nessuna riscrittura).
+    def undo(self):
+        st = self.undo_log.pop(self.undo_log.undo)
+        if st is None: return
+        label, ops = st
+        self.undo_log.push_redo(label, self.apply_ops(ops, bulk=len(ops) > 50, record=False)); self.after_history(f"Undone: {label}")
+
+    def redo(self):
+        st = self.undo_log.pop(self.undo_log.redo)
+        if st is None: return
+        label, ops = st
+        self.undo_log.push(label, self.apply_ops(ops, bulk=len(ops) > 50, record=False), keep_redo=True); self.after_history(f"Redone: {label}")
+
+    def after_history(self, msg):
+        if self.current_subsystem is None: self.model.set_reqs([])
+        elif self.search.text(): self.apply_filter(self.search.text())
+        node = self.tree_nodes.get(self.current_project)
+        if node is None: self.tree.setCurrentItem(None); self.lbl_title.setText("Dashboard")
+        elif self.current_subsystem is None: self.tree.setCurrentItem(node[0]); self.lbl_title.setText(f"Project: {self.current_project}")
+        else:
+            self.tree.setCurrentItem(node[1][self.current_subsystem]); self.lbl_title.setText(f"{self.current_project}  /  {self.current_subsystem}")
+        self.statusBar().showMessage(msg, 4000)
+        self.update_history_actions(); self.update_ui_state()
+
+    def update_history_actions(self):
+        for act, name, stack in ((self.act_undo, "Undo", self.undo_log.undo), (self.act_redo, "Redo", self.undo_log.redo)):
+            label = self.undo_log.label(stack)
+            act.setEnabled(label is not None); act.setText(f"{name} {label}" if label else name)
+
+    def on_saved(self, n_ops, ms):
+        what = f"{n_ops} change(s)" if n_ops else "full database"
+        self.lbl_save.setStyleSheet(""); self.lbl_save.setText(f"Saved {what} · {ms:.1f} ms")
+
+    def on_save_failed(self, err):
+        self.lbl_save.setStyleSheet("color: #cc0000; font-weight: bold;"); self.lbl_save.setText(f"Save error: {err}")
+        # con un server la copia locale non e' piu' quella del server: si riallinea ricaricando
+        if isinstance(self.store, RemoteStore): self.schedule_reload()
+
+    # --- BASELINES ---
+    def open_baselines(self):
+        return BaselineStore(baseline_path(self.db_path))
+
+    def create_baseline(self):
+        name, ok = QInputDialog.getText(self, "Create Baseline", "Baseline name (e.g. PDR, CDR):")
+        name = name.strip()
+        if not ok or not name: return
+        bs = self.open_baselines()
+        try:
+            if any(b['name'] == name for b in bs.names()) and QMessageBox.question(
+                    self, "Baseline", f"Replace baseline '{name}'?", QMessageBox.StandardButton.Yes|QMessageBox.StandardButton.No) != QMessageBox.StandardButton.Yes: return
+            QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+            try: new = bs.create(name, self.data, created=get_timestamp())
+            finally: QApplication.restoreOverrideCursor()
+        except Exception as e: QMessageBox.critical(self, "Baseline Error", str(e)); return
+        finally: bs.close()
+        self.statusBar().showMessage(f"Baseline '{name}' created, {new} new object(s) stored", 8000)
+
+    def compare_baselines(self):
+        bs = self.open_baselines()
+        try:
+            if not bs.names(): QMessageBox.information(self, "Baselines", "No baselines yet: use Baselines > Create Baseline..."); return
+            d = BaselineDiffDialog(self, bs, self.data)
+            if d.exec() and d.selected: self.goto_requirement(*d.selected)
+        finally: bs.close()
+
+    def delete_baseline(self):
+        bs = self.open_baselines()
+        try:
+            names = [b['name'] for b in bs.names()]
+            if not names: return
+            name, ok = QInputDialog.getItem(self, "Delete Baseline", "Baseline:", names, 0, False)
+            if ok and name: n = bs.delete(name); self.statusBar().showMessage(f"Baseline '{name}' deleted, {n} unused object(s) removed", 8000)
+        finally: bs.close()
+
+    # --- SERVER ---
+    def connect_server_dialog(self):
+        url, ok = QInputDialog.getText(self, "Connect to Server", "Server URL (python reqserver.py db.json):",
+                                       text=self.db_path if isinstance(self.store, RemoteStore) else "http://127.0.0.1:8765")
+        if ok and url.strip(): self.db_path = url.strip(); self.load_database()
+
+    def on_remote_event(self, ev):
+        """Modifiche di un altro client: applicate come quelle locali ma senza rispedirle al server.
+        Le posizioni dei passi di undo non valgono piu', quindi la storia si azzera."""
+        if not isinstance(self.store, RemoteStore): return
+        if ev.get('resync'): self.schedule_reload(); return
+        self.apply_ops(ev['ops'], bulk=len(ev['ops']) > 50, record=False, persist=False)
+        self.store.seen(ev)
+        self.undo_log.clear(); self.update_history_actions()
+        if self.current_subsystem is None: self.model.set_reqs([])
+        elif self.search.text(): self.apply_filter(self.search.text())
+        self.statusBar().showMessage(f"{len(ev['ops'])} change(s) from another user", 4000); self.update_ui_state()
+
+    def schedule_reload(self):
+        if self.reload_pending: return
+        self.reload_pending = True
+        QTimer.singleShot(0, self.reload_remote)
+
+    def reload_remote(self):
+        self.reload_pending = False
+        project, sub = self.current_project, self.current_subsystem
+        self.load_database()
+        if project in self.tree_nodes:
+            self.current_project = project; self.current_subsystem = sub if sub in self.data[project] else None
+            self.after_history("Reloaded from the server after a conflicting change")
+            if self.current_subsystem: self.load_table()
+
+    # --- PROFILING ---
+    def toggle_profiling(self, on):
+        PROFILER.enabled = on
+        if on: self.prof_timer.start()
+        else: self.prof_timer.stop(); self.lbl_prof.setText("")
+
+    def toggle_cprofile(self, on):
+        if on: PROFILER.start_cprofile(); return
+        p,_ = QFileDialog.getSaveFileName(self, "Save cProfile Dump", "satreq.prof", "cProfile (*.prof)")
+        PROFILER.stop_cprofile(p or None)
+
+    def show_last_timing(self):
+        if not PROFILER.last: return
+        name, ms, n = PROFILER.last
+        self.lbl_prof.setText(f"⏱ {name} {ms:.1f} ms" + (f" · {n} rec" if n else ""))
+
+    def export_timings(self):
+        p,_ = QFileDialog.getSaveFileName(self, "Export Timings", "satreq_timings.json", "JSON (*.json)")
+        if not p: return
+        try: PROFILER.dump_json(p)
+        except OSError as e: QMessageBox.critical(self, "Export Error", str(e))
+
     # --- FILE I/O (SAFE) ---
+    def read_config(self):
+        try:
+            with open(CONFIG_FILE, encoding='utf-8') as f: return json.load(f)
+        except Exception: return {}
+
     def check_and_load_startup(self):
-        lp=None
-        if os.path.exists(CONFIG_FILE):
-            try: lp=json.load(open(CONFIG_FILE)).get("last_db_path")
-            except: pass
-        if lp and os.path.exists(lp): self.db_path=lp; self.load_database()
+        lp=self.read_config().get("last_db_path")
+        if lp and (os.path.exists(lp) or lp.startswith(("http://", "https://"))): self.db_path=lp; self.load_database(background=True)
         else:
             d = StartupDialog(self)
             if d.exec(): 
                 if d.choice=="OPEN": self.open_existing_db_dialog()
                 elif d.choice=="NEW": self.create_new_db_dialog()
                 
+    @profiled("save_database")
     def save_database(self):
-        if self.db_path:
+        """Salvataggio completo (menu Save, chiusura): riscrive tutto lo store."""
+        if self.store:
             try:
-                tmp = self.db_path+".tmp"
-                with open(tmp,'w', encoding='utf-8') as f: json.dump(self.data, f, indent=4)
-                shutil.move(tmp, self.db_path)
-                with open(CONFIG_FILE,'w', encoding='utf-8') as f: json.dump({"last_db_path":self.db_path}, f)
-            except Exception as e: QMessageBox.critical(self,"Save Error",f"Impossibile salvare il database: {str(e)}")
+                t0 = time.perf_counter()
+                self.saver.flush()
+                self.store.save_all(self.data)
+                self.on_saved(0, (time.perf_counter() - t0) * 1000)
+            except Exception as e: self.on_save_failed(str(e))
+
+    def remember_db_path(self):
+        self.update_config(last_db_path=self.db_path)
+
+    def update_config(self, **values):
+        cfg = self.read_config(); cfg.update(values)
+        try:
+            with open(CONFIG_FILE,'w', encoding='utf-8') as f: json.dump(cfg, f)
+        except OSError: pass
                 
-    def load_database(self):
+    def load_database(self, background=False):
+        """Apre self.db_path. Con background=True (avvio) la lettura gira in un LoaderWorker: l'albero compare
+        subito dallo scheletro della cache binaria e la finestra resta bloccata, ma viva, finche' i dati non arrivano."""
         try:
-            if os.path.exists(self.db_path): shutil.copy2(self.db_path, self.db_path+".bak")
-            with open(self.db_path, 'r', encoding='utf-8') as f: self.data = json.load(f)
-            self.refresh_tree(); self.setWindowTitle(f"SatReq Manager {VERSION} - {os.path.basename(self.db_path)}"); self.update_ui_state() 
-        except Exception as e: QMessageBox.critical(self,"Load Error",f"Impossibile caricare il database: {str(e)}")
+            self.saver.flush()
+            if self.store: self.store.close()
+            self.store = open_store(self.db_path)
+        except Exception as e: QMessageBox.critical(self,"Load Error",f"Impossibile caricare il database: {str(e)}"); return
+        if self.loader: self.loader.deleteLater()
+        self.loader = LoaderWorker(self.store, self)
+        self.loader.loaded.connect(self.on_loaded); self.loader.failed.connect(self.on_load_failed)
+        if not background: self.loader.run(); return  # stesso percorso, nel GUI thread
+        self.set_loading(True)
+        skel = self.store.cache.skeleton() if type(self.store) is JsonStore else None
+        if skel: self.tree_skeleton(skel)
+        else: self.tree.clear(); self.tree_nodes = {}; QTreeWidgetItem(self.tree, [f"Loading {self.db_name()}..."])
+        self.loader.start()
+
+    def set_loading(self, on):
+        self.loading = on
+        self.menuBar().setEnabled(not on); self.centralWidget().setEnabled(not on)
+        if on: self.statusBar().showMessage(f"Loading {self.db_name()}...")
+
+    def tree_skeleton(self, skel):
+        """Albero provvisorio (progetti, sottosistemi, conteggi) dall'intestazione della cache, senza i record."""
+        self.tree.clear(); self.tree_nodes = {}
+        for p, subs in skel.items():
+            p_node = QTreeWidgetItem(self.tree); p_node.setText(0, f"📦 {p}"); p_node.setFont(0, QFont("Segoe UI", 13, QFont.Weight.Bold))
+            p_node.addChildren([QTreeWidgetItem([f"{s} ({n})"]) for s, n in sorted(subs, key=lambda sn: sub_sort_key(sn[0]))])
+            p_node.setExpanded(True)
+
+    def on_loaded(self, store, data, index, issues, ms):
+        if store is not self.store: return  # database cambiato nel frattempo
+        t0 = time.perf_counter(); startup = self.loading and self.t_start is not None  # primo caricamento dell'avvio
+        self.set_loading(False)
+        self.data = data; self.index = index
+        self.undo_log.clear(); self.update_history_actions()
+        if isinstance(self.store, RemoteStore): self.store.listen(self.remote_event.emit)
+        self.remember_db_path()
+        self.refresh_tree(); self.setWindowTitle(f"SatReq Manager {VERSION} - {self.db_name()}"); self.update_ui_state()
+        # tempi di apertura: "cache" = avvio a caldo, "json" = a freddo (la cache viene riscritta)
+        n = sum(sub_count(subs, s) for subs in data.values() for s in subs)
+        ms += (time.perf_counter() - t0) * 1000
+        src = {"cache": "binary cache", "json": "JSON, cache rebuilt"}.get(getattr(store, 'loaded_from', None))
+        if PROFILER.enabled: PROFILER.record("load_database", ms, n)
+        msg = f"Opened {self.db_name()}: {n} requirements in {ms:.0f} ms" + (f" ({src})" if src else "")
+        if startup: msg += f", ready {(time.perf_counter() - self.t_start) * 1000:.0f} ms after launch"
+        self.t_start = None
+        self.statusBar().showMessage(msg, 15000)
+        if issues is not None: self.check_integrity(on_load=True, issues=issues)
+
+    def on_load_failed(self, err):
+        if self.loading: self.set_loading(False); self.refresh_tree()
+        QMessageBox.critical(self,"Load Error",f"Impossibile caricare il database: {err}")
+
+    def check_integrity(self, on_load=False, issues=None):
+        """Validazione dell'intero database (ID, parent, cicli). Al caricamento (la validazione l'ha gia' fatta il
+        LoaderWorker) solo un avviso nella status bar, senza toccare i dati: niente passo di undo ne' scritture che
+        l'utente non ha fatto. Dal menu marca needs_review sui record coinvolti e apre il report completo."""
+        if issues is None: issues = validate(self.data)
+        if on_load:
+            if issues: self.statusBar().showMessage(f"{len(issues)} integrity issue(s) found (Tools > Check Integrity to review and mark them)", 15000)
+            return
+        self.apply_ops(review_ops(self.data, issues), bulk=True, label="Mark for Review")
+        d = IntegrityReportDialog(self, issues)
+        if d.exec() and d.selected:
+            it = d.selected; s, i = it['at'][-1]
+            self.goto_requirement(it['project'], s, self.data[it['project']][s][i])
+
+    def compact_descriptions(self):
+        """Migrazione dei database scritti prima delle descrizioni compatte: una sola operazione annullabile."""
+        ops = compact_ops(self.data)
+        if not ops: QMessageBox.information(self, "Compact Descriptions", "All descriptions are already compact."); return
+        saved = sum(len(self.data[op['p']][op['s']][op['i']]['desc']) - len(op['r']['desc']) for op in ops)
+        if QMessageBox.question(self, "Compact Descriptions", f"Rewrite {len(ops)} description(s) in compact form ({saved / 1024:.0f} KiB less)?") != QMessageBox.StandardButton.Yes: return
+        # in locale una riscrittura completa costa meno di un journal con un record per descrizione
+        remote = isinstance(self.store, RemoteStore)
+        self.apply_ops(ops, bulk=True, label="Compact Descriptions", persist=remote)
+        if not remote: self.save_database()
+        self.statusBar().showMessage(f"{len(ops)} description(s) compacted, {saved / 1024:.0f} KiB less", 8000)
+
+    def db_name(self):
+        if isinstance(self.store, RemoteStore): return self.store.url
+        if isinstance(self.store, ShardedStore): return os.path.basename(os.path.dirname(os.path.abspath(self.db_path)))
+        return os.path.basename(self.db_path)
 
     def open_existing_db_dialog(self):
-        p,_=QFileDialog.getOpenFileName(self,"Open","","JSON (*.json)"); 
-        if p: self.db_path=p; self.load_database(); self.save_database()
+        p,_=QFileDialog.getOpenFileName(self,"Open","",DB_FILTER); 
+        if p: self.db_path=p; self.load_database()
         
     def create_new_db_dialog(self):
-        p,_=QFileDialog.getSaveFileName(self,"New","","JSON (*.json)"); 
-        if p: self.db_path=p; self.data={}; self.save_database(); self.load_database()
+        p,_=QFileDialog.getSaveFileName(self,"New","",DB_FILTER); 
+        if p:
+            self.saver.flush()
+            if self.store: self.store.close()
+            self.db_path=p; self.data={}; self.index = DatabaseIndex(self.data); self.store = open_store(p)
+            self.save_database(); self.load_database()
+
+    def migrate_to_sqlite(self):
+        if isinstance(self.store, SqliteStore): return
+        p,_=QFileDialog.getSaveFileName(self,"Migrate to SQLite",os.path.splitext(self.db_path)[0]+".sqlite","SQLite (*.sqlite *.sqlite3 *.db)")
+        if p: self.convert_database(p)
+
+    def migrate_to_shards(self):
+        if isinstance(self.store, ShardedStore): return
+        d = QFileDialog.getExistingDirectory(self, "Split into Shards (empty folder)")
+        if d: self.convert_database(os.path.join(d, ShardedStore.MANIFEST))
+
+    def convert_database(self, p):
+        try:
+            self.saver.flush()
+            n = convert_store(self.db_path, p)
+        except Exception as e: QMessageBox.critical(self,"Migration Error",str(e)); return
+        self.db_path = p; self.load_database()
+        QMessageBox.information(self,"OK",f"{n} requirements migrated to {self.db_name()}")
+
+    def closeEvent(self, event):
+        # scrive le modifiche in coda e fonde il journal residuo nel file principale prima di uscire;
+        # durante il caricamento self.data non e' ancora il database (e il journal lo ha gia' fuso load())
+        if self.loader: self.loader.wait()
+        self.saver.flush()
+        if self.store and self.store.pending() and not self.loading: self.save_database()
+        self.saver.stop()
+        if self.store: self.store.close()
+        super().closeEvent(event)
     
     def context_menu(self, pos):
-        item = self.table.itemAt(pos)
-        if not item: return
-        row = item.row()
-        req_item = self.table.item(row, 0)
-        req = req_item.data(Qt.ItemDataRole.UserRole)
+        req = self.model.req_at(self.table.indexAt(pos).row())
+        if not req: return
         m = QMenu(); 
-        act = QAction(f"Trace Children: {req['id']}", self)
-        act.triggered.connect(lambda: ChildrenViewDialog(self, req['id'], [r for s in self.data[self.current_project].values() for r in s if r.get('parent_id')==req['id']]).exec())
+        act = QAction(f"Trace: {req['id']}", self)
+        act.triggered.connect(lambda: self.show_trace(req))
         m.addAction(act); m.exec(self.table.viewport().mapToGlobal(pos))
+
+    def show_trace(self, req):
+        d = TraceDialog(self, self.current_project, self.index.project(self.current_project), req)
+        if d.exec() and d.selected: self.goto_requirement(*d.selected)
+
+    def show_trace_report(self, kind):
+        """Orfani o foglie dell'intero progetto corrente, in una lista come quella delle query."""
+        if not self.current_project: return
+        pidx = self.index.project(self.current_project)
+        t0 = time.perf_counter(); found = pidx.orphans() if kind == "orphans" else pidx.leaves()
+        results = sorted(((self.current_project, pidx.subsystem_of(r), r) for r in found), key=lambda x: (x[1], x[2]['id']))
+        d = QueryResultsDialog(self, kind, results, (time.perf_counter() - t0) * 1000)
+        if d.exec() and d.selected: self.goto_requirement(*d.selected)
     
+    def run_export(self, title, job, on_done):
+        """Lancia job su un ExportWorker con una barra di progresso modale e il pulsante Cancel."""
+        if self.export_worker and self.export_worker.isRunning(): return
+        self.saver.flush()
+        dlg = QProgressDialog(title, "Cancel", 0, 100, self)
+        dlg.setWindowTitle(title); dlg.setWindowModality(Qt.WindowModality.WindowModal)
+        dlg.setMinimumDuration(0); dlg.setAutoClose(False); dlg.setAutoReset(False); dlg.setValue(0)
+        w = self.export_worker = ExportWorker(job, self)
+        dlg.canceled.connect(w.cancel)
+        w.progress.connect(lambda n, tot: (dlg.setValue(n * 100 // tot if tot else 100), dlg.setLabelText(f"{title}  {n}/{tot}")))
+        def finish(result):
+            dlg.canceled.disconnect(); dlg.close(); on_done(result)
+        def fail(err):
+            dlg.canceled.disconnect(); dlg.close(); QMessageBox.critical(self, "Export Error", err)
+        w.done.connect(finish); w.failed.connect(fail)
+        w.start()
+
+    def import_requirements(self):
+        if not self.current_project: return
+        p,_ = QFileDialog.getOpenFileName(self, "Import Requirements", "", "CSV / ReqIF (*.csv *.reqif *.xml);;CSV (*.csv);;ReqIF (*.reqif *.xml)")
+        if not p: return
+        try: rows = read_import_rows(p)
+        except Exception as e: QMessageBox.critical(self, "Import Error", f"Cannot read {os.path.basename(p)}: {e}"); return
+        sub = self.current_subsystem
+        if not sub and not all(row.get('subsystem') for _, row in rows):
+            subs = list(self.data[self.current_project])
+            sub, ok = QInputDialog.getItem(self, "Import", "Subsystem for rows without one:", subs, 0, True)
+            if not ok or not sub.strip(): return
+            sub = sub.strip()
+        ops, errors = plan_import(self.data, self.current_project, rows, sub, get_timestamp())
+        n = len(rows) - len(errors)
+        if errors and not ImportReportDialog(self, os.path.basename(p), n, errors).exec(): return
+        if not n: return
+        self.search.clear()
+        # una sola transazione: un batch per il saver, un refresh di tabella e albero
+        self.apply_ops(ops, bulk=True, label=f"Import {n} Requirement(s)"); self.update_ui_state()
+        QMessageBox.information(self, "Import", f"{n} requirement(s) imported.")
+
+    def export_snapshot(self, project):
+        """Copia delle liste dei requisiti per il thread di export: modifiche dell'utente o eventi dal server
+        durante l'export cambiano le liste vive, non quelle che il worker sta leggendo (i record si sostituiscono, non si modificano)."""
+        return {s: list(reqs) for s, reqs in self.data[project].items()}
+
     def export_csv(self):
         if not self.current_project: return
+        d = CsvColumnsDialog(self, self.read_config().get("csv_columns", CSV_DEFAULT))
+        if not d.exec(): return
+        columns = d.get_data(); self.update_config(csv_columns=columns)
         p,_ = QFileDialog.getSaveFileName(self, "Export CSV", f"{self.current_project}.csv", "CSV (*.csv)")
-        if p:
-            # utf-8-sig per compatibilità Excel
-            with open(p,'w',newline='',encoding='utf-8-sig') as f:
-                w=csv.writer(f); 
-                w.writerow(["ID","Type","Desc","Val","Unit","Status","Parent", "Needs Review"])
-                for s in self.data[self.current_project].values():
-                    for r in s: w.writerow([r['id'],r.get('type',''),clean_html_smart(r.get('desc','')),r.get('value',''),r.get('unit',''),r.get('status',''),r.get('parent_id',''), "YES" if r.get('needs_review', False) else "NO"])
-            QMessageBox.information(self,"OK","CSV Saved")
+        if not p: return
+        subs = self.export_snapshot(self.current_project)
+        self.run_export("Exporting CSV", lambda progress, cancelled: write_csv(p, subs, columns, progress, cancelled),
+                        lambda n: QMessageBox.information(self, "OK", f"CSV Saved ({n} requirements)") if n is not None else None)
             
     def export_pdf(self):
         if not self.current_project: return
         p, _ = QFileDialog.getSaveFileName(self, "Export PDF", f"{self.current_project}_Executive.pdf", "PDF (*.pdf)")
-        if p:
-            try:
-                # CSS per stile Executive (Formale e Pulito)
-                css = """
-                <style>
-                    body { font-family: Helvetica, Arial, sans-serif; }
-                    h1 { color: #2c3e50; font-size: 24pt; margin-bottom: 5px; }
-                    p.meta { color: #7f8c8d; font-size: 10pt; margin-bottom: 20px; }
-                    h2 { color: #34495e; border-bottom: 2px solid #34495e; margin-top: 25px; font-size: 16pt; }
-                    
-                    table { border-collapse: collapse; width: 100%; font-size: 11pt; }
-                    th { background-color: #ecf0f1; border: 1px solid #bdc3c7; padding: 8px; font-weight: bold; text-align: left; color: #2c3e50; }
-                    td { border: 1px solid #bdc3c7; padding: 8px; vertical-align: top; }
-                    
-                    .status-draft { color: #95a5a6; font-style: italic; }
-                    .status-ver { color: #27ae60; font-weight: bold; }
-                    .status-tbd { color: #c0392b; font-weight: bold; }
-                    .status-closed { color: #34495e; text-decoration: line-through; }
-                </style>
-                """
-                
-                html_c = f"{css}<h1>Project: {self.current_project}</h1><p class='meta'>Report • Generated: {get_timestamp()}</p>"
-                
-                # Itera sui sottosistemi ordinati
-                for sub in sorted(self.data[self.current_project].keys()):
-                    reqs = self.data[self.current_project][sub]
-                    if not reqs: continue
-                    
-                    html_c += f"<h2>{sub}</h2>"
-                    html_c += """
-                    <table>
-                        <tr>
-                            <th>ID</th>
-                            <th>Type</th>
-                            <th>Description</th>
-                            <th>Target</th>
-                            <th>Unit</th>
-                            <th>Status</th>
-                            <th>Method</th>
-                            <th>Parent</th>
-                        </tr>
-                    """
-                    
-                    for r in reqs:
-                        desc = clean_html_smart(r.get('desc',''))
-                        st = r.get('status','')
-                        
-                        st_class = ""
-                        if "Verified" in st: st_class = "status-ver"
-                        elif "TBD" in st or "TBC" in st: st_class = "status-tbd"
-                        elif "Draft" in st: st_class = "status-draft"
-                        elif "Closed" in st or "Obsolete" in st: st_class = "status-closed"
-                        
-                        html_c += f"""
-                        <tr>
-                            <td><b>{r['id']}</b></td>
-                            <td>{r.get('type','')}</td>
-                            <td>{desc}</td>
-                            <td>{r.get('value','')}</td>
-                            <td>{r.get('unit','')}</td>
-                            <td class='{st_class}'>{st}</td>
-                            <td>{r.get('method','')}</td>
-                            <td>{r.get('parent_id','')}</td>                            
-                        </tr>
-                        """
-                    html_c += "</table>"
-
-                printer = QPrinter(QPrinter.PrinterMode.HighResolution)
-                printer.setOutputFormat(QPrinter.OutputFormat.PdfFormat)
-                printer.setOutputFileName(p)
-                
-                # --- CORREZIONE QUI ---
-                printer.setPageOrientation(QPageLayout.Orientation.Landscape)
-                # ----------------------
-                
-                doc = QTextDocument()
-                doc.setHtml(html_c)
-                doc.print(printer)
-                QMessageBox.information(self,"Success","PDF exported successfully.")
-                
-            except Exception as e:
-                QMessageBox.critical(self, "Export Error", str(e))
+        if not p: return
+        project = self.current_project; subs = self.export_snapshot(project)
+        header = report_header_html(project, get_timestamp())
+        def job(progress, cancelled):
+            # HTML dei sottosistemi invariati dall'ultimo export riusato dalla cache
+            return print_report(p, header, self.report_cache.sections(project, subs, cancelled), progress, cancelled)
+        self.run_export("Exporting PDF", job,
+                        lambda n: QMessageBox.information(self,"Success","PDF exported successfully.") if n is not None else None)
 
 
 if __name__ == '__main__':
@@ -776,9 +1461,13 @@ if __name__ == '__main__':
     if hasattr(Qt.ApplicationAttribute, 'AA_UseHighDpiPixmaps'):
         QApplication.setAttribute(Qt.ApplicationAttribute.AA_UseHighDpiPixmaps, True)
 
+    # SATREQ_PROFILE=cprofile: cProfile dall'avvio, dump in satreq.prof all'uscita
+    if os.environ.get("SATREQ_PROFILE") == "cprofile": PROFILER.start_cprofile()
     app = QApplication(sys.argv)
     app.setStyle("Fusion")
-    app.setStyleSheet("QTableWidget{font-size:14px;}") 
+    app.setStyleSheet("QTableView{font-size:14px;}") 
     w = SatReqManager()
     w.showMaximized()
-    sys.exit(app.exec())
\ No newline at end of file
+    rc = app.exec()
+    PROFILER.stop_cprofile("satreq.prof")
+    sys.exit(rc)
\ No newline at end of file
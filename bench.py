@@ -0,0 +1,168 @@
+"""Benchmark di SatReq Manager su database sintetici, headless (piattaforma Qt offscreen).
+
+    python bench.py --projects 2 --subsystems 8 --reqs 2000 --depth 6 --desc-words 40 -o bench.json
+    python bench.py ... --compare old_bench.json
+
+Misura i percorsi reali della GUI (load/save, tabella, filtro, dialog, export) e scrive i tempi in JSON.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import tempfile
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+WORDS = ("thermal power margin attitude orbit sensor telemetry payload shall provide nominal safe mode "
+         "battery voltage current antenna downlink uplink pointing accuracy mass budget structure panel").split()
+TYPES = ["System", "Functional", "Performance", "Interface", "Environmental", "Design", "Safety"]
+STATUSES = ["Draft", "TBD (To Be Defined)", "TBC (To Be Confirmed)", "Verified", "Closed", "Obsolete"]
+METHODS = ["Test", "Analysis", "Inspection", "Review of Design", "Similarity"]
+
+def rich_text(rng, n_words):
+    """Descrizione come la salva QTextEdit.toHtml(): boilerplate Qt + paragrafi."""
+    words = [rng.choice(WORDS) for _ in range(n_words)]
+    paras = "".join(f"<p style=\" margin-top:0px; margin-bottom:0px;\">{' '.join(words[i:i + 12])}</p>" for i in range(0, n_words, 12))
+    return ("<!DOCTYPE HTML PUBLIC \"-//W3C//DTD HTML 4.0//EN\" \"http://www.w3.org/TR/REC-html40/strict.dtd\">\n"
+            "<html><head><meta name=\"qrichtext\" content=\"1\" /><style type=\"text/css\">\np, li { white-space: pre-wrap; }\n</style></head>"
+            f"<body style=\" font-family:'Segoe UI'; font-size:9pt;\">{paras}</body></html>")
+
+def generate(projects=1, subsystems=8, reqs=1000, depth=5, desc_words=30, seed=1):
+    """Database sintetico: reqs requisiti per sottosistema, alberi di parent profondi al massimo depth livelli."""
+    rng = random.Random(seed); data = {}
+    for p in range(projects):
+        subs = data[f"Project-{p + 1}"] = {}; n = 0; levels = [[] for _ in range(depth)]
+        for s in range(subsystems):
+            lst = subs[f"Subsystem-{s + 1}"] = []
+            for _ in range(reqs):
+                n += 1; rid = f"REQ-{n:05d}"
+                lvl = rng.randrange(depth) if n > 1 else 0
+                parent = rng.choice(levels[lvl - 1]) if lvl and levels[lvl - 1] else ""
+                levels[lvl if parent or not lvl else 0].append(rid)
+                lst.append({"id": rid, "type": rng.choice(TYPES), "desc": rich_text(rng, desc_words), "parent_id": parent,
+                            "value": str(rng.randint(1, 1000)), "unit": rng.choice(["kg", "W", "V", "deg", "s", ""]),
+                            "status": rng.choice(STATUSES), "method": rng.choice(METHODS),
+                            "last_modified": "2024-01-01 12:00:00", "needs_review": rng.random() < 0.05})
+    return data
+
+def timed(fn, repeat):
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter(); fn(); runs.append((time.perf_counter() - t0) * 1000)
+    return {"min_ms": round(min(runs), 3), "median_ms": round(statistics.median(runs), 3), "runs": len(runs)}
+
+def run(args):
+    from PyQt6.QtWidgets import QApplication, QMessageBox, QFileDialog
+    from PyQt6.QtCore import QT_VERSION_STR
+    app = QApplication.instance() or QApplication(sys.argv)
+    import ReqManager as RM
+    import reqcore
+
+    # nessun dialog modale durante il benchmark
+    for name in ("information", "warning", "critical"): setattr(QMessageBox, name, staticmethod(lambda *a, **k: None))
+    QMessageBox.question = staticmethod(lambda *a, **k: QMessageBox.StandardButton.Yes)
+    RM.CsvColumnsDialog.exec = lambda self: 1
+    RM.StartupDialog.exec = lambda self: 0
+    work = tempfile.mkdtemp(prefix="satreq_bench_"); out = {}
+    QFileDialog.getSaveFileName = staticmethod(lambda parent, title, name, *a, **k: (os.path.join(work, os.path.basename(name)), ""))
+    os.chdir(work)  # satreq_config.json del benchmark resta nella cartella temporanea
+
+    data = generate(args.projects, args.subsystems, args.reqs, args.depth, args.desc_words, args.seed)
+    db = os.path.join(work, {"json": "bench.json", "sqlite": "bench.sqlite", "shards": "shards/manifest.json"}[args.format])
+    if args.format == "json":
+        with open(db, 'w', encoding='utf-8') as f: json.dump(data, f, indent=4)
+    else:
+        with open(os.path.join(work, "src.json"), 'w', encoding='utf-8') as f: json.dump(data, f)
+        reqcore.convert_store(os.path.join(work, "src.json"), db)
+    total = sum(len(r) for subs in data.values() for r in subs.values()); del data
+
+    def pump():
+        for _ in range(3): app.processEvents()
+
+    w = RM.SatReqManager(); w.resize(1400, 900); w.show(); pump()
+    w.db_path = db
+    def cold():
+        if os.path.exists(db + ".cache"): os.remove(db + ".cache")  # avvio a freddo: JSON + riscrittura della cache
+        w.load_database(); pump()
+    def startup():
+        w.load_database(background=True)
+        while w.loading: app.processEvents(); time.sleep(0.001)
+        pump()
+    out["load_database_cold"] = timed(cold, args.repeat)
+    out["load_database"] = timed(lambda: (w.load_database(), pump()), args.repeat)
+    out["startup_background"] = timed(startup, args.repeat)
+    project = next(iter(w.data)); sub = next(iter(w.data[project]))
+    w.current_project, w.current_subsystem = project, sub
+    out["load_table"] = timed(lambda: (w.load_table(), pump()), args.repeat)
+    out["apply_filter_text"] = timed(lambda: (w.reset_filter_state(), w.apply_filter("battery voltage"), pump()), args.repeat)
+    out["apply_filter_structured"] = timed(lambda: (w.reset_filter_state(), w.apply_filter("status:ver type:perf"), pump()), args.repeat)
+    w.apply_filter(""); pump()
+    out["global_query"] = timed(lambda: reqcore.query(w.data, "status:TBD method:test", w.index), args.repeat)
+
+    pidx = w.index.project(project); reqs = w.data[project][sub]
+    d = RM.RequirementDialog(w, w.get_all_ids(), w.data, project, reqs[-1], index=pidx)
+    def chain(r):
+        n = 0
+        while r and r.get('parent_id') and n < 1000: r = pidx.get(r['parent_id']); n += 1
+        return n
+    leaf = max(reqs, key=chain)  # il caso peggiore: la catena di parent piu' lunga
+    roots = [r['id'] for r in reqs if not r.get('parent_id')][:50]
+    out["check_circular_dependency_x50"] = timed(lambda: [d.check_circular_dependency(leaf['id'], rid) for rid in roots], args.repeat)
+    out["generate_next_id"] = timed(d.generate_next_id, args.repeat)
+    d_noidx = RM.RequirementDialog(w, w.get_all_ids(), w.data, project, reqs[-1])
+    out["generate_next_id_scan"] = timed(d_noidx.generate_next_id, args.repeat)
+
+    def export(fn):
+        fn(); w.export_worker.wait(); pump()
+    out["export_csv"] = timed(lambda: export(w.export_csv), args.repeat)
+    if not args.skip_pdf: out["export_pdf"] = timed(lambda: export(w.export_pdf), args.repeat)
+
+    # una modifica (journal / SQLite) poi il salvataggio completo
+    w.apply_ops([{'op': 'swap', 'p': project, 's': sub, 'i': 0, 'j': 1}])
+    out["save_database"] = timed(w.save_database, args.repeat)
+    w.close(); pump()
+
+    return {"version": RM.VERSION, "python": platform.python_version(), "qt": QT_VERSION_STR, "platform": platform.platform(),
+            "params": {k: getattr(args, k) for k in ("projects", "subsystems", "reqs", "depth", "desc_words", "seed", "format", "repeat")},
+            "requirements": total, "results": out}
+
+def compare(new, old_path):
+    with open(old_path, encoding='utf-8') as f: old = json.load(f)
+    print(f"{'benchmark':<32}{'old ms':>12}{'new ms':>12}{'ratio':>8}")
+    for name, r in new["results"].items():
+        o = old.get("results", {}).get(name)
+        if not o: print(f"{name:<32}{'-':>12}{r['median_ms']:>12.1f}"); continue
+        ratio = r['median_ms'] / o['median_ms'] if o['median_ms'] else float('inf')
+        print(f"{name:<32}{o['median_ms']:>12.1f}{r['median_ms']:>12.1f}{ratio:>8.2f}{'  <-- slower' if ratio > 1.2 else ''}")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="SatReq Manager benchmark")
+    ap.add_argument("--projects", type=int, default=1)
+    ap.add_argument("--subsystems", type=int, default=8)
+    ap.add_argument("--reqs", type=int, default=1000, help="requirements per subsystem")
+    ap.add_argument("--depth", type=int, default=5, help="max parent tree depth")
+    ap.add_argument("--desc-words", type=int, default=30, help="words per rich-text description")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--format", choices=("json", "sqlite", "shards"), default="json")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--skip-pdf", action="store_true")
+    ap.add_argument("-o", "--output", help="write results to this JSON file")
+    ap.add_argument("--compare", help="previous results JSON to compare against")
+    args = ap.parse_args(argv)
+    here = os.path.dirname(os.path.abspath(__file__)); sys.path.insert(0, here)
+    if args.output: args.output = os.path.abspath(args.output)
+    if args.compare: args.compare = os.path.abspath(args.compare)
+    res = run(args)
+    text = json.dumps(res, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f: f.write(text)
+    else: print(text)
+    if args.compare: compare(res, args.compare)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""Export batch di SatReq Manager: CSV, PDF e HTML di ogni progetto (o sottosistema) di uno o piu' database in una
+cartella, in parallelo su un pool di processi. I PDF si impaginano nei worker con QTextDocument/QPrinter sulla
+piattaforma Qt offscreen (con --jobs 1, o un solo shard da fare, li impagina il processo stesso).
+
+    python reqbatch.py db.json other.sqlite -o reports/ [--formats csv pdf html] [--per subsystem] [--jobs 4] [--force]
+
+Uscita: reports/<database>/<progetto>.<formato> (con --per subsystem: reports/<database>/<progetto>/<sottosistema>.*)
+e reports/manifest.json con file, conteggio e digest del contenuto di ogni shard. Al giro successivo uno shard con lo
+stesso digest e i file ancora presenti non viene riesportato; gli shard spariti dai database vengono rimossi.
+"""
+import re
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import reqcore
+
+MANIFEST = "manifest.json"
+FORMATS = ("csv", "pdf", "html")
+RENDER_VERSION = 1  # da incrementare se cambia l'impaginazione dei report: tutti gli shard vengono rifatti
+
+def safe_name(name):
+    """Nome di file valido ovunque; se bisogna cambiarlo si aggiunge un pezzo di hash, cosi' due nomi non collidono."""
+    safe = re.sub(r'[^\w.-]+', '_', name).strip('._')
+    return safe if safe == name else f"{safe or '_'}-{hashlib.sha1(name.encode('utf-8')).hexdigest()[:6]}"
+
+def db_label(path):
+    path = os.path.abspath(path)
+    if os.path.basename(path) == reqcore.ShardedStore.MANIFEST: return os.path.basename(os.path.dirname(path))
+    return os.path.splitext(os.path.basename(path))[0]
+
+def read_manifest(out):
+    try:
+        with open(os.path.join(out, MANIFEST), encoding='utf-8') as f: m = json.load(f)
+    except (OSError, ValueError): return {}
+    return m.get('shards', {}) if m.get('format') == 'satreq-batch' else {}
+
+def plan(db_paths, per, columns):
+    """Shard di tutti i database: [{key, db, project, subsystem, subs, count, digest}], i piu' grandi per primi."""
+    shards = []; labels = {}
+    for db in db_paths:
+        label = safe_name(db_label(db))
+        if label in labels: raise SystemExit(f"reqbatch: '{db}' and '{labels[label]}' would write to the same folder")
+        labels[label] = db
+        store = reqcore.open_store(db)
+        try: data = store.load(readonly=True)
+        finally: store.close()
+        for p, subs in data.items():
+            parts = [(s, {s: subs[s]}) for s in subs] if per == "subsystem" else [(None, {s: subs[s] for s in subs})]
+            for s, part in parts:
+                key = "/".join([label, safe_name(p)] + ([safe_name(s)] if s is not None else []))
+                # il digest copre tutto cio' che finisce nei file, tranne la data nell'intestazione
+                digest = reqcore.content_digest([RENDER_VERSION, reqcore.REPORT_CSS, columns, p, part])
+                shards.append({'key': key, 'db': os.path.abspath(db), 'project': p, 'subsystem': s, 'subs': part,
+                               'count': reqcore.count_reqs(part), 'digest': digest})
+    shards.sort(key=lambda sh: -sh['count'])
+    return shards
+
+def remove_files(out, files):
+    for rel in files.values():
+        path = os.path.join(out, rel)
+        if os.path.exists(path): os.remove(path)
+
+def init_worker():
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+def export_shard(out, key, project, subs, formats, columns, timestamp):
+    """Nel worker: scrive i formati richiesti di uno shard. Ritorna ({formato: file relativo a out}, ms)."""
+    t0 = time.perf_counter(); files = {}
+    base = os.path.join(out, *key.split("/"))
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    sections = None
+    for fmt in formats:
+        path = f"{base}.{fmt}"
+        if fmt == "csv": reqcore.write_csv(path, subs, columns)
+        else:
+            header = reqcore.report_header_html(project, timestamp)
+            if sections is None: sections = reqcore.ReportCache().sections(project, subs)
+            if fmt == "html":
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(reqcore.REPORT_CSS); f.write(header)
+                    for _, _, frag in sections: f.write(frag)
+            else:
+                import reqrender  # solo QtGui: il worker non carica la GUI; l'applicazione nasce al primo PDF
+                reqrender.qt_app(); reqrender.print_report(path, header, sections)
+        files[fmt] = os.path.relpath(path, out).replace(os.sep, "/")
+    return files, (time.perf_counter() - t0) * 1000
+
+def run(db_paths, out, formats=("csv", "pdf"), per="project", jobs=None, force=False, columns=None, log=None):
+    """Esporta tutti gli shard cambiati e riscrive il manifest. Ritorna {'exported', 'unchanged', 'failed': [(key, errore)]}."""
+    out = os.path.abspath(out); os.makedirs(out, exist_ok=True)
+    old = read_manifest(out)  # anche con --force: servono le voci degli altri database e la pulizia degli shard spariti
+    shards = plan(db_paths, per, columns)
+    dbs = {os.path.abspath(db) for db in db_paths}; planned = {sh['key'] for sh in shards}
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    manifest = {k: v for k, v in old.items() if v.get('db') not in dbs}  # shard di altri database: intatti
+    todo = []; unchanged = 0
+    for sh in shards:
+        prev = old.get(sh['key'], {})
+        changed = prev.get('digest') != sh['digest']; same = not (force or changed)
+        need = [f for f in formats if not (same and f in prev.get('files', {}) and os.path.exists(os.path.join(out, prev['files'][f])))]
+        if not need: manifest[sh['key']] = prev; unchanged += 1; continue
+        if changed: remove_files(out, {f: rel for f, rel in prev.get('files', {}).items() if f not in formats})  # contenuto vecchio
+        todo.append((sh, need, {} if changed else dict(prev.get('files', {}))))
+    failed = []; t0 = time.perf_counter()
+
+    def done(sh, files, ms):
+        manifest[sh['key']] = {'db': sh['db'], 'project': sh['project'], 'subsystem': sh['subsystem'], 'count': sh['count'],
+                               'digest': sh['digest'], 'files': files, 'ms': round(ms, 1)}
+        if log: log(f"{sh['key']}: {sh['count']} requirements, {', '.join(sorted(files))} in {ms:.0f} ms")
+
+    if jobs == 1 or len(todo) <= 1:
+        for sh, need, files in todo:
+            try: new, ms = export_shard(out, sh['key'], sh['project'], sh['subs'], need, columns, timestamp)
+            except Exception as e: failed.append((sh['key'], str(e))); continue
+            done(sh, {**files, **new}, ms)
+    else:
+        # spawn: un fork del processo con Qt gia' inizializzato non e' sicuro
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn"), initializer=init_worker) as pool:
+            futures = {pool.submit(export_shard, out, sh['key'], sh['project'], sh['subs'], need, columns, timestamp): (sh, files)
+                       for sh, need, files in todo}
+            for fut in as_completed(futures):
+                sh, files = futures[fut]
+                try: new, ms = fut.result()
+                except Exception as e: failed.append((sh['key'], str(e))); continue
+                done(sh, {**files, **new}, ms)
+
+    # shard spariti dai database esportati: via i loro file (quelli falliti restano, si riprovano al prossimo giro)
+    for key, entry in old.items():
+        if entry.get('db') in dbs and key not in planned: remove_files(out, entry.get('files', {}))
+    reqcore.write_json_atomic(os.path.join(out, MANIFEST), {'format': 'satreq-batch', 'version': 1, 'generated': timestamp,
+                                                           'shards': dict(sorted(manifest.items()))})
+    return {'exported': len(todo) - len(failed), 'unchanged': unchanged, 'failed': failed, 'ms': (time.perf_counter() - t0) * 1000}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="reqbatch", description="SatReq Manager batch export")
+    ap.add_argument("db", nargs="+", help="databases (.json, .sqlite or <dir>/manifest.json)")
+    ap.add_argument("-o", "--output", required=True, help="target directory (manifest.json goes here)")
+    ap.add_argument("--formats", nargs="+", choices=FORMATS, default=["csv", "pdf"])
+    ap.add_argument("--per", choices=("project", "subsystem"), default="project", help="one file per project or per subsystem")
+    ap.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    ap.add_argument("--columns", nargs="+", help="CSV columns: " + ", ".join(h for h, _ in reqcore.CSV_COLUMNS))
+    ap.add_argument("--force", action="store_true", help="re-export every shard even if its digest is unchanged")
+    ap.add_argument("-q", "--quiet", action="store_true")
+    args = ap.parse_args(argv)
+    for db in args.db:
+        if not os.path.exists(db): raise SystemExit(f"reqbatch: '{db}' not found")
+    bad = [c for c in args.columns or [] if c not in dict(reqcore.CSV_COLUMNS)]
+    if bad: raise SystemExit(f"reqbatch: unknown column(s) {', '.join(bad)}")
+    res = run(args.db, args.output, args.formats, args.per, args.jobs, args.force, args.columns,
+              None if args.quiet else (lambda msg: print(msg, file=sys.stderr)))
+    for key, err in res['failed']: print(f"{key}: {err}", file=sys.stderr)
+    print(f"{res['exported']} shard(s) exported, {res['unchanged']} unchanged, {len(res['failed'])} failed "
+          f"in {res['ms'] / 1000:.1f} s -> {os.path.abspath(args.output)}", file=sys.stderr)
+    return 1 if res['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
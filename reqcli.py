@@ -0,0 +1,211 @@
+"""SatReq Manager da riga di comando (Qt solo per l'export PDF), pensato per la CI:
+
+    python reqcli.py validate db.json [--mark]
+    python reqcli.py stats db.json [--json]
+    python reqcli.py query db.json "status:TBD type:Performance" [--json]
+    python reqcli.py export db.json --project P -o out.csv [--columns ID Type Desc]
+    python reqcli.py export db.json --project P -o report.html
+    python reqcli.py export db.json --project P -o report.pdf     (richiede PyQt6, impagina offscreen)
+    python reqcli.py convert db.json shards/manifest.json
+    python reqcli.py import db.json reqs.csv --project P --subsystem EPS [--dry-run]
+    python reqcli.py trace db.json REQ-001 --project P [--up] [--json]
+    python reqcli.py trace db.json --project P --orphans | --leaves
+    python reqcli.py baseline db.json create PDR | list | diff PDR [CDR] [--json] | delete PDR
+    python reqcli.py compact db.json [--dry-run]
+
+Con SATREQ_PROFILE=1 i tempi delle funzioni strumentate finiscono su stderr.
+"""
+import sys
+import json
+import os
+import argparse
+from datetime import datetime
+
+import reqcore
+
+def load(path):
+    if not os.path.exists(path): raise SystemExit(f"reqmanager: '{path}' not found")
+    store = reqcore.open_store(path)
+    try: return store.load(readonly=True)
+    finally: store.close()
+
+def cmd_validate(args):
+    if not os.path.exists(args.db): raise SystemExit(f"reqmanager: '{args.db}' not found")
+    store = reqcore.open_store(args.db)
+    try:
+        data = store.load(readonly=not args.mark)
+        issues = reqcore.validate(data)
+        ops = reqcore.review_ops(data, issues) if args.mark else []
+        if ops:
+            for op in ops: reqcore.apply_op(data, op)
+            store.commit([store.encode(ops)])
+    finally: store.close()
+    if args.json: print(json.dumps(issues, indent=2, ensure_ascii=False))
+    else:
+        for it in issues: print(f"{it['project']}/{it['subsystem']}: {it['id'] or '-'}: {it['message']}")
+        print(f"{len(issues)} issue(s)" + (f", {len(ops)} requirement(s) marked for review" if args.mark else ""), file=sys.stderr)
+    return 1 if issues else 0
+
+def cmd_stats(args):
+    st = reqcore.stats(load(args.db))
+    if args.json: print(json.dumps(st, indent=2, ensure_ascii=False)); return 0
+    for p, x in st.items():
+        print(f"{p}: {x['total']} requirements, {x['needs_review']} need review")
+        for s, n in x['subsystems'].items(): print(f"  {s:<20} {n}")
+        print("  status: " + ", ".join(f"{k or '-'}={n}" for k, n in sorted(x['status'].items())))
+    return 0
+
+def cmd_query(args):
+    data = load(args.db)
+    try: res = reqcore.query(data, args.expr)
+    except reqcore.QueryError as e: raise SystemExit(f"reqmanager: {e}")
+    if args.json: print(json.dumps([dict(r, project=p, subsystem=s) for p, s, r in res], indent=2, ensure_ascii=False))
+    else:
+        for p, s, r in res: print(f"{p}/{s}\t{r.get('id') or '-'}\t{r.get('status', '')}\t{reqcore.clean_html_smart(r.get('desc', ''))[:80]}")
+    return 0
+
+def cmd_export(args):
+    data = load(args.db)
+    if args.project not in data: raise SystemExit(f"reqmanager: project '{args.project}' not found")
+    subs = data[args.project]
+    if args.output.lower().endswith(('.html', '.htm', '.pdf')):
+        header = reqcore.report_header_html(args.project, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        sections = reqcore.ReportCache().sections(args.project, subs)
+        if args.output.lower().endswith('.pdf'):
+            import reqrender
+            reqrender.qt_app(); reqrender.print_report(args.output, header, sections)
+        else:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(reqcore.REPORT_CSS); f.write(header)
+                for _, _, frag in sections: f.write(frag)
+        n = reqcore.count_reqs(subs)
+    else:
+        bad = [c for c in args.columns or [] if c not in dict(reqcore.CSV_COLUMNS)]
+        if bad: raise SystemExit(f"reqmanager: unknown column(s) {', '.join(bad)}")
+        n = reqcore.write_csv(args.output, subs, args.columns)
+    print(f"{n} requirements -> {args.output}", file=sys.stderr)
+    return 0
+
+def cmd_convert(args):
+    n = reqcore.convert_store(args.db, args.dest)
+    print(f"{n} requirements -> {args.dest}", file=sys.stderr)
+    return 0
+
+def cmd_import(args):
+    store = reqcore.open_store(args.db)
+    try:
+        data = store.load(readonly=args.dry_run)
+        if args.project not in data: raise SystemExit(f"reqmanager: project '{args.project}' not found")
+        rows = reqcore.read_import_rows(args.file)
+        ops, errors = reqcore.plan_import(data, args.project, rows, args.subsystem, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        for line, rid, msg in errors: print(f"row {line}: {rid or '-'}: {msg}")
+        n = len(rows) - len(errors)
+        if not args.dry_run and ops:
+            for op in ops: reqcore.apply_op(data, op)
+            store.commit([store.encode(ops)])
+        print(f"{n} row(s) {'valid' if args.dry_run else 'imported'}, {len(errors)} rejected", file=sys.stderr)
+    finally: store.close()
+    return 1 if errors else 0
+
+def cmd_trace(args):
+    data = load(args.db)
+    if args.project not in data: raise SystemExit(f"reqmanager: project '{args.project}' not found")
+    pidx = reqcore.ProjectIndex(data[args.project])
+    if args.orphans or args.leaves: rows = [(0, r) for r in (pidx.orphans() if args.orphans else pidx.leaves())]
+    elif not args.id: raise SystemExit("reqmanager: trace needs a requirement ID, --orphans or --leaves")
+    elif pidx.get(args.id) is None: raise SystemExit(f"reqmanager: '{args.id}' not found in '{args.project}'")
+    elif args.up: rows = list(enumerate(pidx.ancestors(args.id), 1))
+    else: rows = pidx.descendants(args.id)
+    if args.json:
+        print(json.dumps([dict(r, subsystem=pidx.subsystem_of(r), depth=d) for d, r in rows], indent=2, ensure_ascii=False))
+    else:
+        for d, r in rows: print(f"{d}\t{pidx.subsystem_of(r)}\t{r.get('id') or '-'}\t{r.get('status', '')}\t{reqcore.clean_html_smart(r.get('desc', ''))[:80]}")
+    print(f"{len(rows)} requirement(s)", file=sys.stderr)
+    return 0
+
+def cmd_baseline(args):
+    bs = reqcore.BaselineStore(reqcore.baseline_path(args.db))
+    try:
+        if args.action == "list":
+            for b in bs.names(): print(f"{b['name']}\t{b['created']}\t{b['count']} requirements")
+            return 0
+        if not args.names: raise SystemExit(f"reqmanager: baseline {args.action} needs a baseline name")
+        if args.action == "create":
+            new = bs.create(args.names[0], load(args.db), created=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            print(f"baseline '{args.names[0]}': {new} new object(s)", file=sys.stderr); return 0
+        if args.action == "delete":
+            print(f"{bs.delete(args.names[0])} unused object(s) removed", file=sys.stderr); return 0
+        # diff: baseline contro baseline, o contro la copia di lavoro se c'e' un solo nome
+        try: changes = bs.diff(args.names[0], args.names[1] if len(args.names) > 1 else load(args.db))
+        except KeyError as e: raise SystemExit(f"reqmanager: {e.args[0]}")
+    finally: bs.close()
+    if args.json: print(json.dumps(changes, indent=2, ensure_ascii=False)); return 0
+    for ch in changes:
+        print(f"{ch['project']}/{ch['subsystem']}:")
+        for rid in ch['added']: print(f"  + {rid}")
+        for rid in ch['removed']: print(f"  - {rid}")
+        for rid, fields in ch['modified']: print(f"  ~ {rid} ({', '.join(fields)})")
+    return 0
+
+def cmd_compact(args):
+    if not os.path.exists(args.db) and not args.db.startswith(("http://", "https://")): raise SystemExit(f"reqmanager: '{args.db}' not found")
+    store = reqcore.open_store(args.db)
+    try:
+        data = store.load(readonly=args.dry_run)
+        ops = reqcore.compact_ops(data)
+        saved = sum(len(data[op['p']][op['s']][op['i']]['desc']) - len(op['r']['desc']) for op in ops)
+        if ops and not args.dry_run:
+            for op in ops: reqcore.apply_op(data, op)
+            # un server applica le operazioni; in locale si riscrive tutto invece di appendere al journal
+            if isinstance(store, reqcore.RemoteStore): store.commit([store.encode(ops)])
+            else: store.save_all(data)
+    finally: store.close()
+    print(f"{len(ops)} description(s) {'to compact' if args.dry_run else 'compacted'}, {saved / 1024:.0f} KiB less", file=sys.stderr)
+    return 0
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="reqmanager", description="SatReq Manager command line")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    for name, fn, help_ in (("validate", cmd_validate, "integrity checks, exit code 1 on issues"),
+                            ("stats", cmd_stats, "counts per project, subsystem and status"),
+                            ("query", cmd_query, "structured query across all projects"),
+                            ("export", cmd_export, "export a project to CSV or HTML"),
+                            ("convert", cmd_convert, "copy to another format (.json, .sqlite, <dir>/manifest.json)"),
+                            ("import", cmd_import, "bulk import from CSV or ReqIF, exit code 1 if rows were rejected"),
+                            ("trace", cmd_trace, "descendants, ancestors (--up), orphans or leaves of a project"),
+                            ("baseline", cmd_baseline, "named baselines and their diffs"),
+                            ("compact", cmd_compact, "rewrite full Qt HTML descriptions in compact form")):
+        p = sub.add_parser(name, help=help_); p.set_defaults(fn=fn)
+        p.add_argument("db", help="database (.json or .sqlite)")
+        if name == "query": p.add_argument("expr", help="e.g. 'status:TBD type:Performance'")
+        if name == "convert": p.add_argument("dest", help="target database; the format follows the name"); continue
+        if name == "import":
+            p.add_argument("file", help=".csv (export_csv columns) or .reqif")
+            p.add_argument("--project", required=True)
+            p.add_argument("--subsystem", help="for rows without a Subsystem column")
+            p.add_argument("--dry-run", action="store_true", help="validate only"); continue
+        if name == "compact": p.add_argument("--dry-run", action="store_true", help="only count"); continue
+        if name == "baseline":
+            p.add_argument("action", choices=("create", "list", "diff", "delete"))
+            p.add_argument("names", nargs="*", help="baseline name(s); diff with one name compares with the database")
+        if name == "validate": p.add_argument("--mark", action="store_true", help="set needs_review on the affected requirements")
+        if name == "trace":
+            p.add_argument("id", nargs="?", help="requirement ID")
+            p.add_argument("--project", required=True)
+            g = p.add_mutually_exclusive_group()
+            g.add_argument("--up", action="store_true", help="ancestor chain instead of descendants")
+            g.add_argument("--orphans", action="store_true", help="requirements with a missing parent or no links at all")
+            g.add_argument("--leaves", action="store_true", help="traced requirements without children")
+        if name == "export":
+            p.add_argument("--project", required=True)
+            p.add_argument("-o", "--output", required=True, help=".csv, .html or .pdf")
+            p.add_argument("--columns", nargs="+", help="CSV columns: " + ", ".join(h for h, _ in reqcore.CSV_COLUMNS))
+        else: p.add_argument("--json", action="store_true", help="machine-readable output")
+    args = ap.parse_args(argv)
+    rc = args.fn(args)
+    # SATREQ_PROFILE=1: tempi per funzione su stderr, fuori dall'output del comando
+    if reqcore.PROFILER.enabled: print(json.dumps(reqcore.PROFILER.report(), indent=2), file=sys.stderr)
+    return rc
+
+if __name__ == '__main__':
+    sys.exit(main())
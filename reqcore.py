@@ -0,0 +1,1605 @@
+"""Core senza dipendenze Qt di SatReq Manager: storage, operazioni sul database, indici, regole, query ed export.
+Usato sia dalla GUI (ReqManager.py) sia dalla riga di comando (reqcli.py); non deve mai importare PyQt6."""
+import re
+import os
+import sys
+import csv
+import json
+import sqlite3
+import gc
+import hashlib
+import marshal
+import mmap
+import threading
+import uuid
+import urllib.request
+import urllib.error
+from collections import Counter, deque
+from collections.abc import Mapping, MutableMapping
+from xml.etree import ElementTree
+import html
+import shlex
+import time
+import cProfile
+from fnmatch import fnmatchcase
+from functools import lru_cache, wraps
+from contextlib import contextmanager
+
+PLAIN_TEXT_CACHE_SIZE = 50000  # descrizioni pulite tenute in cache
+EXPORT_CHUNK_ROWS = 2000       # righe scritte per blocco durante l'export
+
+# --- UTILS ---
+CLEANR_STYLE = re.compile('<style.*?>.*?</style>', re.DOTALL)
+CLEANR_TAGS = re.compile('<.*?>')
+
+# Cache LRU limitata indicizzata sul contenuto: una descrizione invariata viene pulita una sola volta,
+# una nuova versione (nuovo HTML da RequirementDialog.get_data) e' semplicemente una nuova chiave.
+@lru_cache(maxsize=PLAIN_TEXT_CACHE_SIZE)
+def clean_html_smart(raw_html):
+    """Pulisce l'HTML per l'export mantenendo spazi corretti."""
+    if not raw_html: return ""
+    text = CLEANR_STYLE.sub('', raw_html)
+    text = text.replace('</div>', ' ').replace('</p>', ' ').replace('<br>', ' ').replace('<br/>', ' ')
+    text = CLEANR_TAGS.sub('', text)
+    text = html.unescape(text)
+    return " ".join(text.split())
+
+# Descrizioni compatte: QTextEdit.toHtml() avvolge anche una parola in un documento completo (DOCTYPE, meta, <style>,
+# stile del body, margini a 0 su ogni paragrafo). Si salva solo il contenuto del body senza le dichiarazioni di default,
+# o il testo semplice quando non c'e' formattazione: come per gli import, una descrizione senza '<' e' testo semplice.
+QT_DEFAULT_DECLS = frozenset(('margin-top:0px', 'margin-bottom:0px', 'margin-left:0px', 'margin-right:0px', '-qt-block-indent:0', 'text-indent:0px'))
+DESC_BODY = re.compile(r'<body[^>]*>(.*)</body>', re.DOTALL)
+DESC_STYLE = re.compile(r' style="([^"]*)"')
+DESC_PLAIN = re.compile(r'(?:<p>(?:[^<]|<br />)*</p>|<p style="-qt-paragraph-type:empty;"><br /></p>)+')
+DESC_PARA = re.compile(r'<p>((?:[^<]|<br />)*)</p>|<p style="-qt-paragraph-type:empty;"><br /></p>')
+# i default tolti da compact_desc, per QTextEdit.setHtml (un <p> nudo avrebbe i margini HTML di 12px)
+DESC_HTML_HEAD = '<html><head><style type="text/css">p, li { white-space: pre-wrap; margin-top:0px; margin-bottom:0px; }</style></head><body>'
+
+def _style_attr(m):
+    decls = [f"{k.strip()}:{v.strip()}" for k, _, v in (d.partition(':') for d in m.group(1).split(';')) if k.strip()]
+    decls = [d for d in decls if d not in QT_DEFAULT_DECLS]
+    return f' style="{"; ".join(decls)};"' if decls else ''
+
+def compact_desc(desc):
+    """Forma compatta di una descrizione (idempotente): testo semplice se non c'e' formattazione, altrimenti il body
+    di toHtml() senza boilerplate. Le descrizioni gia' compatte o in testo semplice tornano invariate."""
+    if not desc or '<' not in desc: return desc
+    m = DESC_BODY.search(desc)
+    body = DESC_STYLE.sub(_style_attr, m.group(1).replace('>\n<', '><').strip('\n') if m else desc)
+    if DESC_PLAIN.fullmatch(body):
+        text = html.unescape("\n".join(p.replace('<br />', '\n') for p in DESC_PARA.findall(body)))
+        if '<' not in text: return text
+    return body
+
+def rich_desc(desc):
+    """Documento per QTextEdit.setHtml da una descrizione compatta (quelle vecchie, documenti completi, passano intatte)."""
+    return desc if '<body' in desc else DESC_HTML_HEAD + desc + '</body></html>'
+
+@contextmanager
+def no_gc():
+    """Garbage collector sospeso: caricando milioni di oggetti senza cicli le raccolte sono solo tempo perso."""
+    was = gc.isenabled(); gc.disable()
+    try: yield
+    finally:
+        if was: gc.enable()
+
+# --- PROFILING ---
+# Strumentazione opt-in (variabile d'ambiente SATREQ_PROFILE=1, o =cprofile, oppure menu Tools): tempo, chiamate e
+# record elaborati per ogni funzione decorata con @profiled. Da spenta costa un solo controllo di attributo per chiamata.
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.stats = {}     # nome -> {'calls', 'total_ms', 'max_ms', 'last_ms', 'records'}
+        self.last = None    # (nome, ms, record) dell'ultima chiamata misurata
+        self.lock = threading.Lock()
+        self.cprof = None
+
+    def record(self, name, ms, records=None):
+        with self.lock:
+            st = self.stats.get(name)
+            if st is None: st = self.stats[name] = {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'last_ms': 0.0, 'records': 0}
+            st['calls'] += 1; st['total_ms'] += ms; st['last_ms'] = ms; st['max_ms'] = max(st['max_ms'], ms)
+            if records: st['records'] += records
+            self.last = (name, ms, records)
+
+    def reset(self):
+        with self.lock: self.stats = {}; self.last = None
+
+    def report(self):
+        """Statistiche ordinate per tempo totale, con la media per chiamata."""
+        with self.lock: items = [(k, dict(v)) for k, v in self.stats.items()]
+        items.sort(key=lambda kv: -kv[1]['total_ms'])
+        for _, st in items: st['avg_ms'] = st['total_ms'] / st['calls']
+        return {k: {f: round(v, 3) if isinstance(v, float) else v for f, v in st.items()} for k, st in items}
+
+    def dump_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f: json.dump(self.report(), f, indent=2)
+
+    def start_cprofile(self):
+        if self.cprof is None: self.cprof = cProfile.Profile(); self.cprof.enable()
+
+    def stop_cprofile(self, path=None):
+        """Ferma cProfile e salva il dump (leggibile con pstats / snakeviz) se path e' dato."""
+        if self.cprof is None: return
+        self.cprof.disable()
+        if path: self.cprof.dump_stats(path)
+        self.cprof = None
+
+PROFILER = Profiler()
+PROFILER.enabled = bool(os.environ.get("SATREQ_PROFILE"))
+
+def profiled(name, records=None):
+    """Decoratore: misura fn sotto il nome dato; records(risultato, *args) -> numero di record elaborati."""
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kw):
+            if not PROFILER.enabled: return fn(*args, **kw)
+            t0 = time.perf_counter()
+            try: res = fn(*args, **kw)
+            finally: ms = (time.perf_counter() - t0) * 1000
+            PROFILER.record(name, ms, records(res, *args) if records else None)
+            return res
+        return wrapper
+    return deco
+
+# --- RECORD ---
+REQ_FIELDS = ('id', 'type', 'desc', 'parent_id', 'value', 'unit', 'status', 'method', 'last_modified', 'needs_review')
+INTERNED_FIELDS = frozenset(('type', 'unit', 'status', 'method', 'parent_id'))  # pochi valori ripetuti ovunque
+_FIELD_SET = frozenset(REQ_FIELDS)
+
+class Requirement(MutableMapping):
+    """Requisito compatto: uno slot per campo dello schema JSON invece di un dict per record, con le stringhe
+    dei campi enumerati internate (una sola copia di "Draft", "Analysis", ... in tutto il database).
+    Si usa come il dict di prima (r['id'], r.get(...), dict(r, ...)); un campo assente nel JSON resta assente,
+    le chiavi fuori schema finiscono in _extra, quindi to_dict()/from_dict() fanno round-trip senza perdite."""
+    __slots__ = REQ_FIELDS + ('_extra',)
+
+    def __init__(self, *args, **fields):
+        self._extra = None
+        for k, v in dict(*args, **fields).items(): self[k] = v
+
+    @classmethod
+    def from_dict(cls, d):
+        r = cls.__new__(cls); r._extra = None; setters = _SETTERS
+        for k, v in d.items():
+            set_ = setters.get(k)
+            if set_ is None: r._extra = r._extra or {}; r._extra[k] = v
+            else: set_(r, sys.intern(v) if k in INTERNED_FIELDS and type(v) is str else v)
+        return r
+
+    def to_dict(self):
+        d = {}
+        for k in REQ_FIELDS:
+            v = getattr(self, k, _MISSING)
+            if v is not _MISSING: d[k] = v
+        if self._extra: d.update(self._extra)
+        return d
+
+    def __getitem__(self, k):
+        if k in _FIELD_SET:
+            try: return getattr(self, k)
+            except AttributeError: raise KeyError(k) from None
+        if self._extra and k in self._extra: return self._extra[k]
+        raise KeyError(k)
+
+    def get(self, k, default=None):
+        if k in _FIELD_SET: return getattr(self, k, default)
+        return self._extra.get(k, default) if self._extra else default
+
+    def __setitem__(self, k, v):
+        if k in INTERNED_FIELDS and type(v) is str: setattr(self, k, sys.intern(v))
+        elif k in _FIELD_SET: setattr(self, k, v)
+        else: self._extra = self._extra or {}; self._extra[k] = v
+
+    def __delitem__(self, k):
+        if k in _FIELD_SET:
+            try: delattr(self, k)
+            except AttributeError: raise KeyError(k) from None
+        elif self._extra and k in self._extra: del self._extra[k]
+        else: raise KeyError(k)
+
+    def __iter__(self):
+        for k in REQ_FIELDS:
+            if hasattr(self, k): yield k
+        if self._extra: yield from self._extra
+
+    def __len__(self):
+        return sum(hasattr(self, k) for k in REQ_FIELDS) + len(self._extra or ())
+
+    def __contains__(self, k):
+        return hasattr(self, k) if k in _FIELD_SET else bool(self._extra) and k in self._extra
+
+    def __eq__(self, other):
+        if isinstance(other, Requirement): return self.get('id') == other.get('id') and self.to_dict() == other.to_dict()
+        if isinstance(other, Mapping): return self.to_dict() == dict(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Requirement({self.to_dict()!r})"
+
+    def __reduce__(self):
+        return (Requirement.from_dict, (self.to_dict(),))
+
+_MISSING = object()
+_SETTERS = {k: getattr(Requirement, k).__set__ for k in REQ_FIELDS}  # descrittori degli slot, piu' veloci di setattr
+
+def as_req(r):
+    return r if isinstance(r, Requirement) else Requirement.from_dict(r)
+
+def as_reqs(data):
+    """Converte in Requirement i record di un database appena letto (progetti non ancora caricati esclusi)."""
+    for subs in data.values():
+        if isinstance(subs, LazyProject): continue  # convertiti da LazyProject al caricamento
+        for s, reqs in subs.items(): subs[s] = [as_req(r) for r in reqs]
+    return data
+
+# --- CHANGE OPS ---
+# Ogni modifica al database e' un'operazione elementare (dict JSON) applicata da apply_op:
+#   ins/set/del {p, s, i, r}   swap {p, s, i, j}
+#   add_sub {p, s, reqs?}  del_sub {p, s}  ren_sub {p, s, n}
+#   add_proj {p, subs?}    del_proj {p}    ren_proj {p, n}
+# I record che entrano nel database diventano Requirement qui, dentro l'op stessa: op['r'] e' l'oggetto memorizzato.
+def apply_op(data, op):
+    """Applica op a data e ritorna l'operazione inversa."""
+    k = op['op']; p = op['p']; s = op.get('s')
+    if 'r' in op: op['r'] = as_req(op['r'])
+    elif op.get('reqs'): op['reqs'] = [as_req(r) for r in op['reqs']]
+    elif op.get('subs') and not isinstance(op['subs'], LazyProject):
+        op['subs'] = {sub: [as_req(r) for r in reqs] for sub, reqs in op['subs'].items()}
+    if k == 'ins':
+        data[p][s].insert(op['i'], op['r']); return {'op': 'del', 'p': p, 's': s, 'i': op['i']}
+    if k == 'set':
+        reqs = data[p][s]; old = reqs[op['i']]; reqs[op['i']] = op['r']
+        return {'op': 'set', 'p': p, 's': s, 'i': op['i'], 'r': old}
+    if k == 'del':
+        return {'op': 'ins', 'p': p, 's': s, 'i': op['i'], 'r': data[p][s].pop(op['i'])}
+    if k == 'swap':
+        reqs = data[p][s]; i, j = op['i'], op['j']; reqs[i], reqs[j] = reqs[j], reqs[i]
+        return dict(op)
+    if k == 'add_sub':
+        data[p][s] = op.get('reqs') or []; return {'op': 'del_sub', 'p': p, 's': s}
+    if k == 'del_sub':
+        return {'op': 'add_sub', 'p': p, 's': s, 'reqs': data[p].pop(s)}
+    if k == 'ren_sub':
+        data[p][op['n']] = data[p].pop(s); return {'op': 'ren_sub', 'p': p, 's': op['n'], 'n': s}
+    if k == 'add_proj':
+        data[p] = op.get('subs') or {}; return {'op': 'del_proj', 'p': p}
+    if k == 'del_proj':
+        subs = data.pop(p)
+        # gli shard di un progetto lazy spariscono al prossimo salvataggio: l'inversa (undo) deve avere i requisiti
+        if isinstance(subs, LazyProject): subs = dict(subs.items())
+        return {'op': 'add_proj', 'p': p, 'subs': subs}
+    if k == 'ren_proj':
+        subs = data.pop(p)
+        if isinstance(subs, LazyProject) and subs.BY_NAME: subs = dict(subs.items())  # le righe SQLite cambiano nome dopo
+        data[op['n']] = subs; return {'op': 'ren_proj', 'p': op['n'], 'n': p}
+    raise ValueError(f"Unknown op '{k}'")
+
+OP_LABELS = {'ins': "Add {id}", 'set': "Edit {id}", 'del': "Delete {id}", 'swap': "Move",
+             'add_sub': "Add Subsystem {s}", 'del_sub': "Delete Subsystem {s}", 'ren_sub': "Rename Subsystem {s}",
+             'add_proj': "Add Project {p}", 'del_proj': "Delete Project {p}", 'ren_proj': "Rename Project {p}"}
+
+def op_label(op, inv):
+    """Descrizione breve di un'operazione gia' applicata (inv e' la sua inversa), per il menu Undo."""
+    r = op.get('r') or inv.get('r')
+    return OP_LABELS[op['op']].format(id=r.get('id', '') if r else "", s=op.get('s', ''), p=op['p'])
+
+class UndoLog:
+    """Undo/redo come log di comandi: ogni passo e' (etichetta, operazioni inverse gia' in ordine di applicazione,
+    peso), mai una copia dei dati. I record tenuti vivi sono solo quelli sostituiti o rimossi dal passo stesso;
+    il log si accorcia dal passo piu' vecchio oltre max_steps passi o max_records record trattenuti."""
+    def __init__(self, max_steps=1000, max_records=100000):
+        self.max_steps = max_steps; self.max_records = max_records
+        self.undo = deque(); self.redo = []; self.records = 0
+
+    def clear(self):
+        self.undo.clear(); self.redo.clear(); self.records = 0
+
+    @staticmethod
+    def weight(ops):
+        n = 0
+        for op in ops:
+            subs = op.get('subs')
+            n += 1 + len(op.get('reqs') or ()) + (sum(sub_count(subs, s) for s in subs) if subs else 0)
+        return n
+
+    def step(self, label, inverses):
+        return (label, inverses[::-1], self.weight(inverses))
+
+    def push(self, label, inverses, keep_redo=False):
+        """Nuovo passo annullabile; una modifica normale (non un redo) svuota la pila di redo."""
+        st = self.step(label, inverses); self.undo.append(st); self.records += st[2]
+        if not keep_redo:
+            self.records -= sum(w for _, _, w in self.redo); self.redo.clear()
+        while len(self.undo) > self.max_steps or (self.records > self.max_records and len(self.undo) > 1):
+            self.records -= self.undo.popleft()[2]
+
+    def push_redo(self, label, inverses):
+        st = self.step(label, inverses); self.redo.append(st); self.records += st[2]
+
+    def pop(self, stack):
+        """(etichetta, operazioni) dall'ultimo passo di undo o di redo, None se la pila e' vuota."""
+        if not stack: return None
+        label, ops, w = stack.pop(); self.records -= w
+        return label, ops
+
+    def label(self, stack): return stack[-1][0] if stack else None
+
+# --- STORAGE (JSON + JOURNAL, SQLITE, SHARD) ---
+SQLITE_EXTS = (".sqlite", ".sqlite3", ".db")
+
+def json_default(o):
+    if isinstance(o, Requirement): return o.to_dict()
+    if isinstance(o, LazyProject): return dict(o.items())
+    raise TypeError(f"{type(o).__name__} is not JSON serializable")
+
+def write_json_atomic(path, data, indent=4):
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=indent, default=json_default); f.flush(); os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+class JsonStore:
+    """Database JSON con journal append-only accanto (<db>.journal): una riga JSON per operazione.
+
+    La compattazione sigilla il journal attivo (<db>.journal.old) e lo fonde nel file principale
+    in un thread separato, leggendo solo da disco: il GUI thread continua ad appendere sul nuovo journal.
+    """
+    COMPACT_BYTES = 4 * 1024 * 1024
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.main = db_path  # file il cui digest finisce nel marker .applied
+        self.path = db_path + ".journal"
+        self.sealed = self.path + ".old"
+        self.marker = self.sealed + ".applied"
+        self.cache = LoadCache(db_path)
+        self.loaded_from = None  # "cache" o "json": da dove e' arrivato l'ultimo load()
+        self.lock = threading.Lock()
+        self.compactor = None
+
+    def load(self, readonly=False):
+        """readonly: journal riapplicato solo in memoria e cache binaria solo letta, mai scritta (CLI, CI).
+        Le copie storiche sono le baseline (BaselineStore)."""
+        data = self.cache.load(); self.loaded_from = "cache"
+        if data is None:
+            with open(self.db_path, 'rb') as f: raw = f.read()
+            with no_gc(): data = as_reqs(json.loads(raw))
+            self.loaded_from = "json"
+            if not readonly: self.cache.save(data, hashlib.sha1(raw).hexdigest())
+        # Crash recovery: le modifiche rimaste nel journal vengono riapplicate e fuse nel file
+        if self.pending() and self.replay(data) and not readonly: self.save_all(data)
+        return data
+
+    def save_all(self, data):
+        """Salvataggio completo: riscrive il file principale e svuota il journal."""
+        self.wait()
+        write_json_atomic(self.db_path, data)
+        self.cache.save(data, self.file_digest(self.db_path))
+        self.reset()
+
+    @staticmethod
+    def encode(ops):
+        return "".join(json.dumps(op, ensure_ascii=False, default=json_default) + "\n" for op in ops)
+
+    def commit(self, payloads):
+        self.write("".join(payloads))
+
+    def write(self, lines):
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(lines); f.flush(); os.fsync(f.fileno())
+        if self.size() > self.COMPACT_BYTES: self.compact_async()
+
+    def size(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def pending(self):
+        return os.path.exists(self.path) or os.path.exists(self.sealed)
+
+    @staticmethod
+    def read_ops(path):
+        ops = []
+        if not os.path.exists(path): return ops
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try: ops.append(json.loads(line))
+                except ValueError: break  # ultima riga troncata da un crash
+        return ops
+
+    @staticmethod
+    def file_digest(path):
+        with open(path, 'rb') as f: return hashlib.sha1(f.read()).hexdigest()
+
+    def replay(self, data):
+        """Crash recovery: riapplica su data le operazioni non ancora compattate. Ritorna quante."""
+        n = 0
+        if os.path.exists(self.sealed):
+            already = os.path.exists(self.marker) and open(self.marker).read().strip() == self.file_digest(self.main)
+            if not already:
+                for op in self.read_ops(self.sealed): apply_op(data, op); n += 1
+        for op in self.read_ops(self.path): apply_op(data, op); n += 1
+        return n
+
+    def compact_async(self):
+        with self.lock:
+            if self.compactor and self.compactor.is_alive(): return
+            if not os.path.exists(self.sealed):
+                if not os.path.exists(self.path): return
+                os.replace(self.path, self.sealed)
+        self.compactor = threading.Thread(target=self.compact_sealed, daemon=True)
+        self.compactor.start()
+
+    def compact_sealed(self):
+        with open(self.db_path, 'r', encoding='utf-8') as f: data = json.load(f)
+        for op in self.read_ops(self.sealed): apply_op(data, op)
+        tmp = self.db_path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=4, default=json_default); f.flush(); os.fsync(f.fileno())
+        # il marker rende idempotente il replay se si crasha tra replace e remove
+        digest = self.file_digest(tmp)
+        with open(self.marker, 'w') as f: f.write(digest); f.flush(); os.fsync(f.fileno())
+        os.replace(tmp, self.db_path)
+        os.remove(self.sealed); os.remove(self.marker)
+        self.cache.save(data, digest)
+
+    def wait(self):
+        if self.compactor: self.compactor.join()
+
+    def close(self):
+        self.wait()
+
+    def reset(self):
+        """Da chiamare dopo un salvataggio completo: il file principale contiene gia' tutto."""
+        self.wait()
+        with self.lock:
+            for path in (self.path, self.sealed, self.marker):
+                if os.path.exists(path): os.remove(path)
+
+_ABSENT = ...  # campo assente nella cache binaria: marshal lo sa scrivere e nessun valore JSON gli e' uguale
+
+def pack_req(r):
+    if type(r) is not Requirement: r = Requirement.from_dict(r)  # record JSON grezzo (compattazione)
+    return tuple(getattr(r, k, _ABSENT) for k in REQ_FIELDS) + (r._extra,)
+
+def unpack_req(t, new=Requirement.__new__, setters=tuple(_SETTERS.values())):
+    if type(t) is not tuple or len(t) != len(setters) + 1: raise ValueError("bad cache record")
+    r = new(Requirement); r._extra = t[-1]
+    for set_, v in zip(setters, t):
+        if v is not _ABSENT: set_(r, v)
+    return r
+
+class LoadCache:
+    """Copia binaria (<db>.cache) di un database JSON gia' convertito in Requirement: all'avvio evita json.load
+    e from_dict. Vale solo se dimensione, mtime e SHA-1 del file JSON sono quelli registrati; il journal
+    non c'entra, load() lo riapplica sopra come dopo json.load.
+
+    Formato: MAGIC, un'intestazione JSON su una riga (firma del JSON e scheletro {progetto: [[sottosistema, n]]},
+    leggibile da sola per disegnare subito l'albero), poi i record come tuple di slot (pack_req) in marshal.
+    Niente pickle: la cache sta accanto al database, anche in cartelle condivise, e leggerla non deve poter
+    eseguire codice; marshal ricostruisce solo valori (e load() controlla la forma di ogni record)."""
+    MAGIC = b"SATREQ-CACHE2\n"
+    FORMAT = 2
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.path = db_path + ".cache"
+
+    def header(self, f):
+        if f.read(len(self.MAGIC)) != self.MAGIC: return None
+        h = json.loads(f.readline())
+        if not isinstance(h, dict) or h.get('format') != self.FORMAT: return None
+        try: st = os.stat(self.db_path)
+        except OSError: return None
+        return h if (h['size'], h['mtime']) == (st.st_size, st.st_mtime_ns) else None
+
+    def skeleton(self):
+        """Progetti e sottosistemi con i conteggi senza leggere i record, None se la cache manca o e' vecchia.
+        Controlla solo dimensione e mtime: il digest lo verifica load()."""
+        try:
+            with open(self.path, 'rb') as f: h = self.header(f)
+        except Exception: return None
+        return h and h['skeleton']
+
+    def load(self):
+        """Il database dalla cache, o None se manca o non corrisponde piu' al file JSON.
+        Lo SHA-1 del JSON si calcola in un thread mentre si legge la cache (hashlib rilascia il GIL)."""
+        digest = []
+        hasher = threading.Thread(target=lambda: digest.append(JsonStore.file_digest(self.db_path)), daemon=True)
+        try:
+            with open(self.path, 'rb') as f, no_gc():
+                h = self.header(f)
+                if not h: return None
+                hasher.start()
+                # marshal.load(f) leggerebbe il file un oggetto alla volta: si decodifica la mappa del file, senza copie
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as mv:
+                    body = marshal.loads(mv[f.tell():])
+                data = {p: {s: [unpack_req(t) for t in reqs] for s, reqs in subs.items()} for p, subs in body.items()}
+        except Exception: return None  # cache troncata o di un'altra versione: si riparte dal JSON
+        finally:
+            if hasher.is_alive(): hasher.join()
+        return data if digest == [h['sha1']] else None
+
+    def save(self, data, digest):
+        """Scrive la cache del file JSON (gia' su disco) con questo digest. Senza permessi di scrittura
+        resta semplicemente la cache vecchia, che non passera' la verifica."""
+        try:
+            st = os.stat(self.db_path)
+            head = {'format': self.FORMAT, 'size': st.st_size, 'mtime': st.st_mtime_ns, 'sha1': digest,
+                    'skeleton': {p: [(s, len(reqs)) for s, reqs in subs.items()] for p, subs in data.items()}}
+            tmp = self.path + ".tmp"
+            with open(tmp, 'wb') as f:
+                f.write(self.MAGIC); f.write(json.dumps(head, ensure_ascii=False).encode('utf-8') + b"\n")
+                marshal.dump({p: {s: [pack_req(r) for r in reqs] for s, reqs in subs.items()} for p, subs in data.items()}, f)
+            os.replace(tmp, self.path)
+        except OSError: pass
+
+class SqliteStore:
+    """Backend SQLite opzionale: una riga per requisito con colonne indicizzate (id, parent_id,
+    status, type, subsystem) e il record completo in 'body', cosi' il round-trip resta lossless.
+    load() legge solo la struttura, i requisiti arrivano per sottosistema (SqliteProject); una volta
+    caricati, le ricerche per ID e parent passano dal ProjectIndex in memoria come per gli altri store.
+    Ogni commit() applica le operazioni in una sola transazione."""
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS projects (name TEXT PRIMARY KEY, ord INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS subsystems (project TEXT NOT NULL, name TEXT NOT NULL, ord INTEGER NOT NULL,
+                                               PRIMARY KEY (project, name));
+        CREATE TABLE IF NOT EXISTS reqs (project TEXT NOT NULL, subsystem TEXT NOT NULL, pos INTEGER NOT NULL,
+                                         id TEXT, parent_id TEXT, type TEXT, status TEXT, method TEXT,
+                                         needs_review INTEGER, body TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS idx_reqs_loc ON reqs (project, subsystem, pos);
+        CREATE INDEX IF NOT EXISTS idx_reqs_id ON reqs (project, id);
+        CREATE INDEX IF NOT EXISTS idx_reqs_parent ON reqs (project, parent_id);
+        CREATE INDEX IF NOT EXISTS idx_reqs_status ON reqs (status);
+        CREATE INDEX IF NOT EXISTS idx_reqs_type ON reqs (type);
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL"); self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.lock, self.conn: self.conn.executescript(self.SCHEMA)
+
+    @staticmethod
+    def row(p, s, pos, r):
+        return (p, s, pos, r.get('id'), r.get('parent_id'), r.get('type'), r.get('status'), r.get('method'),
+                int(bool(r.get('needs_review', False))), json.dumps(r, ensure_ascii=False, default=json_default))
+
+    def load(self, readonly=False):
+        """Solo progetti, sottosistemi e conteggi (COUNT su idx_reqs_loc): i requisiti di un sottosistema si leggono
+        al primo accesso (SqliteProject), quindi l'apertura non dipende dalla dimensione del database.
+        readonly: copia completa in una sola query, perche' chi la chiede (CLI, CI, convert) chiude subito lo store."""
+        if readonly: return self.read_all()
+        with self.lock:
+            counts = {(p, s): n for p, s, n in self.conn.execute("SELECT project, subsystem, COUNT(*) FROM reqs GROUP BY project, subsystem")}
+            projects = [p for (p,) in self.conn.execute("SELECT name FROM projects ORDER BY ord")]
+            subs = {}
+            for p, s in self.conn.execute("SELECT project, name FROM subsystems ORDER BY project, ord"):
+                subs.setdefault(p, []).append({'name': s, 'file': None, 'count': counts.get((p, s), 0)})
+        return {p: SqliteProject(self, p, subs.get(p, ())) for p in projects}
+
+    def read_all(self):
+        data = {}
+        with self.lock:
+            for (p,) in self.conn.execute("SELECT name FROM projects ORDER BY ord"): data[p] = {}
+            for p, s in self.conn.execute("SELECT project, name FROM subsystems ORDER BY project, ord"): data[p][s] = []
+            for p, s, body in self.conn.execute("SELECT project, subsystem, body FROM reqs ORDER BY project, subsystem, pos"):
+                data[p][s].append(Requirement.from_dict(json.loads(body)))
+        return data
+
+    def read_subsystem(self, p, s):
+        with self.lock:
+            rows = self.conn.execute("SELECT body FROM reqs WHERE project = ? AND subsystem = ? ORDER BY pos", (p, s)).fetchall()
+        return [Requirement.from_dict(json.loads(b)) for (b,) in rows]
+
+    def save_all(self, data):
+        # le righe vengono riscritte tutte: prima si leggono i sottosistemi non ancora caricati
+        for subs in data.values():
+            if isinstance(subs, LazyProject): subs.load_all()
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM reqs"); self.conn.execute("DELETE FROM subsystems"); self.conn.execute("DELETE FROM projects")
+            for n, (p, subs) in enumerate(data.items()): self.insert_project(p, subs, n)
+
+    def insert_project(self, p, subs, ord_):
+        self.conn.execute("INSERT INTO projects VALUES (?, ?)", (p, ord_))
+        for n, (s, reqs) in enumerate(subs.items()): self.insert_subsystem(p, s, reqs, n)
+
+    def insert_subsystem(self, p, s, reqs, ord_):
+        self.conn.execute("INSERT INTO subsystems VALUES (?, ?, ?)", (p, s, ord_))
+        self.conn.executemany("INSERT INTO reqs VALUES (?,?,?,?,?,?,?,?,?,?)", [self.row(p, s, i, r) for i, r in enumerate(reqs)])
+
+    def next_ord(self, table, where="", args=()):
+        return self.conn.execute(f"SELECT COALESCE(MAX(ord), -1) + 1 FROM {table} {where}", args).fetchone()[0]
+
+    @staticmethod
+    def encode(ops):
+        # snapshot sul GUI thread: i record vengono serializzati ora, non quando il worker scrive
+        return json.dumps(ops, ensure_ascii=False, default=json_default)
+
+    def commit(self, payloads):
+        with self.lock, self.conn:
+            for payload in payloads:
+                for op in json.loads(payload): self.apply(op)
+
+    def apply(self, op):
+        k = op['op']; p = op['p']; s = op.get('s'); ex = self.conn.execute
+        loc = "project = ? AND subsystem = ?"
+        if k == 'ins':
+            ex(f"UPDATE reqs SET pos = pos + 1 WHERE {loc} AND pos >= ?", (p, s, op['i']))
+            ex("INSERT INTO reqs VALUES (?,?,?,?,?,?,?,?,?,?)", self.row(p, s, op['i'], op['r']))
+        elif k == 'set':
+            r = op['r']
+            ex(f"UPDATE reqs SET id=?, parent_id=?, type=?, status=?, method=?, needs_review=?, body=? WHERE {loc} AND pos = ?",
+               self.row(p, s, op['i'], r)[3:] + (p, s, op['i']))
+        elif k == 'del':
+            ex(f"DELETE FROM reqs WHERE {loc} AND pos = ?", (p, s, op['i']))
+            ex(f"UPDATE reqs SET pos = pos - 1 WHERE {loc} AND pos > ?", (p, s, op['i']))
+        elif k == 'swap':
+            ex(f"UPDATE reqs SET pos = CASE pos WHEN ? THEN ? ELSE ? END WHERE {loc} AND pos IN (?, ?)",
+               (op['i'], op['j'], op['i'], p, s, op['i'], op['j']))
+        elif k == 'add_sub':
+            self.insert_subsystem(p, s, op.get('reqs') or [], self.next_ord("subsystems", "WHERE project = ?", (p,)))
+        elif k == 'del_sub':
+            ex(f"DELETE FROM reqs WHERE {loc}", (p, s)); ex("DELETE FROM subsystems WHERE project = ? AND name = ?", (p, s))
+        elif k == 'ren_sub':
+            # come dict.pop + assegnazione: il sottosistema rinominato va in coda
+            ex("UPDATE subsystems SET name = ?, ord = ? WHERE project = ? AND name = ?",
+               (op['n'], self.next_ord("subsystems", "WHERE project = ?", (p,)), p, s))
+            ex(f"UPDATE reqs SET subsystem = ? WHERE {loc}", (op['n'], p, s))
+        elif k == 'add_proj':
+            self.insert_project(p, op.get('subs') or {}, self.next_ord("projects"))
+        elif k == 'del_proj':
+            for t in ("reqs", "subsystems"): ex(f"DELETE FROM {t} WHERE project = ?", (p,))
+            ex("DELETE FROM projects WHERE name = ?", (p,))
+        elif k == 'ren_proj':
+            ex("UPDATE projects SET name = ?, ord = ? WHERE name = ?", (op['n'], self.next_ord("projects"), p))
+            for t in ("reqs", "subsystems"): ex(f"UPDATE {t} SET project = ? WHERE project = ?", (op['n'], p))
+        else: raise ValueError(f"Unknown op '{k}'")
+
+    def pending(self): return False
+    def wait(self): pass
+
+    def close(self):
+        with self.lock: self.conn.close()
+
+class LazyProject(MutableMapping):
+    """Progetto di un database a shard: sottosistema -> lista di requisiti, letta dal suo file
+    solo al primo accesso. Il numero di requisiti dei sottosistemi non caricati viene dal manifest."""
+    BY_NAME = False  # True se la lettura dipende dal nome del progetto (apply_op lo carica prima di rinominarlo)
+
+    def __init__(self, root, entries=()):
+        self.root = root
+        self.files = {}   # sottosistema -> (file relativo o None, conteggio dal manifest), in ordine
+        self.loaded = {}  # sottosistema -> lista di requisiti
+        for e in entries: self.files[e['name']] = (e['file'], e['count'])
+
+    def __getitem__(self, s):
+        if s in self.loaded: return self.loaded[s]
+        reqs = self.loaded[s] = self.fetch(s)
+        return reqs
+
+    def fetch(self, s):
+        f, _ = self.files[s]
+        with open(os.path.join(self.root, f), 'r', encoding='utf-8') as fh: return [Requirement.from_dict(r) for r in json.load(fh)]
+
+    def load_all(self):
+        for s in self.files: self[s]
+
+    def __setitem__(self, s, reqs):
+        self.files[s] = (None, len(reqs)); self.loaded[s] = reqs
+
+    def __delitem__(self, s):
+        del self.files[s]; self.loaded.pop(s, None)
+
+    def __iter__(self): return iter(self.files)
+    def __len__(self): return len(self.files)
+    def __contains__(self, s): return s in self.files
+
+    def count(self, s):
+        return len(self.loaded[s]) if s in self.loaded else self.files[s][1]
+
+class SqliteProject(LazyProject):
+    """Progetto di un database SQLite: ogni sottosistema si legge con una query su idx_reqs_loc al primo accesso."""
+    BY_NAME = True
+
+    def __init__(self, store, project, entries=()):
+        super().__init__(None, entries)
+        self.store = store; self.project = project
+
+    def fetch(self, s):
+        return self.store.read_subsystem(self.project, s)
+
+def sub_count(subsystems, s):
+    """Numero di requisiti di un sottosistema senza caricarlo."""
+    return subsystems.count(s) if isinstance(subsystems, LazyProject) else len(subsystems[s])
+
+class ShardedStore(JsonStore):
+    """Database a shard: <dir>/manifest.json con l'elenco di progetti e sottosistemi (e i conteggi),
+    un file JSON per sottosistema in <dir>/shards/ e il journal in <dir>/journal.
+
+    load() legge solo il manifest; i requisiti si caricano per sottosistema (LazyProject). Il journal funziona
+    come in JsonStore; la compattazione riscrive solo gli shard toccati dalle operazioni, poi il manifest.
+    Il manifest e' il punto di commit: gli shard non piu' referenziati vengono cancellati dopo."""
+    MANIFEST = "manifest.json"
+
+    def __init__(self, db_path):
+        super().__init__(db_path)
+        self.root = os.path.dirname(os.path.abspath(db_path))
+        self.path = os.path.join(self.root, "journal")
+        self.sealed = self.path + ".old"
+        self.marker = self.sealed + ".applied"
+
+    def read(self):
+        if not os.path.exists(self.main): return {}
+        with open(self.main, 'r', encoding='utf-8') as f: m = json.load(f)
+        return {p['name']: LazyProject(self.root, p['subsystems']) for p in m['projects']}
+
+    def load(self, readonly=False):
+        data = self.read()
+        if self.pending() and self.replay(data) and not readonly: self.save_all(data)
+        return data
+
+    def save_all(self, data):
+        self.wait()
+        self.write_shards(data)
+        self.reset()
+
+    def compact_sealed(self):
+        data = self.read()
+        for op in self.read_ops(self.sealed): apply_op(data, op)
+        self.write_shards(data, marker=True)
+        os.remove(self.sealed); os.remove(self.marker)
+
+    def write_shards(self, data, marker=False):
+        """Scrive gli shard caricati (o nuovi) su file nuovi, poi il manifest; quelli non caricati restano dove sono."""
+        os.makedirs(os.path.join(self.root, "shards"), exist_ok=True)
+        projects = []
+        for p, subs in data.items():
+            lazy = isinstance(subs, LazyProject) and subs.root == self.root
+            entries = []
+            for s in subs:
+                if lazy and s not in subs.loaded: f, n = subs.files[s]
+                else:
+                    reqs = subs[s]; n = len(reqs); f = f"shards/{uuid.uuid4().hex}.json"
+                    write_json_atomic(os.path.join(self.root, f), reqs, indent=None)
+                    if lazy: subs.files[s] = (f, n)
+                entries.append({'name': s, 'file': f, 'count': n})
+            projects.append({'name': p, 'subsystems': entries})
+        tmp = self.main + ".tmp"
+        write_json_atomic(tmp, {'format': 'satreq-shards', 'version': 1, 'projects': projects})
+        if marker:
+            with open(self.marker, 'w') as f: f.write(self.file_digest(tmp)); f.flush(); os.fsync(f.fileno())
+        os.replace(tmp, self.main)
+        live = {e['file'] for pr in projects for e in pr['subsystems']}
+        for name in os.listdir(os.path.join(self.root, "shards")):
+            if f"shards/{name}" not in live: os.remove(os.path.join(self.root, "shards", name))
+
+# --- STORAGE (REMOTE) ---
+class RemoteError(Exception):
+    pass
+
+class RemoteStore:
+    """Database servito da reqserver.py: stessa interfaccia degli store locali, le operazioni vanno in POST /api/ops.
+    Ogni batch porta la versione del server su cui e' stato calcolato (base): se nel frattempo un altro client ha
+    scritto, il server risponde 409 e commit solleva RemoteError (il client deve ricaricare)."""
+    TIMEOUT = 30
+
+    def __init__(self, url):
+        self.db_path = self.url = url.rstrip("/")
+        self.client_id = uuid.uuid4().hex
+        self.version = 0
+        self.lock = threading.Lock()
+        self.listener = None; self.stopping = threading.Event()
+
+    def request(self, method, path, body=None):
+        data = None if body is None else json.dumps(body, ensure_ascii=False, default=json_default).encode('utf-8')
+        req = urllib.request.Request(self.url + path, data=data, method=method, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(req, timeout=self.TIMEOUT) as resp: return json.loads(resp.read() or b"null")
+        except urllib.error.HTTPError as e:
+            try: msg = json.loads(e.read()).get('error', e.reason)
+            except ValueError: msg = e.reason
+            raise RemoteError(f"{e.code}: {msg}") from None
+        except urllib.error.URLError as e: raise RemoteError(f"server unreachable: {e.reason}") from None
+
+    def load(self, readonly=False):
+        res = self.request("GET", "/api/db")
+        with self.lock: self.version = res['version']
+        return as_reqs(res['data'])
+
+    def save_all(self, data):
+        """Il server ha gia' tutto in memoria: gli si chiede solo di compattare il suo store."""
+        self.request("POST", "/api/save", {})
+
+    def encode(self, ops):
+        # la base si fissa quando l'operazione e' applicata in locale; ogni batch accettato vale +1 sul server
+        with self.lock: base = self.version; self.version += 1
+        return json.dumps({'base': base, 'client': self.client_id, 'ops': ops}, ensure_ascii=False, default=json_default)
+
+    def commit(self, payloads):
+        for p in payloads:
+            req = urllib.request.Request(self.url + "/api/ops", data=p.encode('utf-8'), method="POST", headers={'Content-Type': 'application/json'})
+            try:
+                with urllib.request.urlopen(req, timeout=self.TIMEOUT) as resp: resp.read()
+            except urllib.error.HTTPError as e:
+                raise RemoteError("conflict: the database was changed by another client" if e.code == 409 else f"{e.code}: {e.reason}") from None
+            except urllib.error.URLError as e: raise RemoteError(f"server unreachable: {e.reason}") from None
+
+    def listen(self, callback):
+        """Thread che segue GET /api/events (server-sent events) e chiama callback(evento) per le modifiche degli
+        altri client. Alla riconnessione, se la versione del server non e' quella attesa, arriva {'resync': True}.
+        Chi applica l'evento chiama poi seen(evento), nello stesso thread delle modifiche locali."""
+        def run():
+            while not self.stopping.is_set():
+                try:
+                    with urllib.request.urlopen(self.url + "/api/events", timeout=self.TIMEOUT) as resp:
+                        for line in resp:
+                            if self.stopping.is_set(): return
+                            if not line.startswith(b"data:"): continue
+                            ev = json.loads(line[5:])
+                            if ev.get('hello'):
+                                with self.lock: stale = ev['version'] != self.version
+                                if stale: callback({'resync': True})
+                            elif ev.get('client') != self.client_id: callback(ev)
+                except (OSError, ValueError):
+                    self.stopping.wait(2.0)
+        self.listener = threading.Thread(target=run, daemon=True); self.listener.start()
+
+    def seen(self, ev):
+        with self.lock: self.version = ev['version']
+
+    def pending(self): return False
+    def wait(self): pass
+
+    def close(self):
+        self.stopping.set()
+
+def open_store(db_path):
+    if db_path.startswith(("http://", "https://")): return RemoteStore(db_path)
+    if os.path.basename(db_path) == ShardedStore.MANIFEST: return ShardedStore(db_path)
+    return SqliteStore(db_path) if os.path.splitext(db_path)[1].lower() in SQLITE_EXTS else JsonStore(db_path)
+
+def convert_store(src_path, dst_path):
+    """Copia un database in un altro formato (JSON, SQLite o shard, dall'estensione/nome di dst_path)."""
+    src = open_store(src_path)
+    try: data = src.load(readonly=True)
+    finally: src.close()
+    # un manifest esistente viene sovrascritto da save_all (e gli shard vecchi rimossi)
+    if os.path.exists(dst_path) and os.path.basename(dst_path) != ShardedStore.MANIFEST: os.remove(dst_path)
+    dst = open_store(dst_path)
+    try: dst.save_all(data)
+    finally: dst.close()
+    return sum(sub_count(subs, s) for subs in data.values() for s in subs)
+
+# --- BASELINES ---
+# Baseline con nome (PDR, CDR, ...) in <db>.baselines.sqlite, indirizzate per contenuto come in git:
+#   oggetto record = JSON canonico del requisito, chiave sha1      (identico in N baseline -> salvato una volta)
+#   oggetto albero = [[id, hash record], ...] di un sottosistema   (sottosistema invariato -> nessuna riga nuova)
+#   baseline       = {project: {subsystem: hash albero}}
+# Una nuova baseline costa quindi solo i record cambiati, e il diff salta i sottosistemi con lo stesso albero.
+def baseline_path(db_path):
+    if os.path.basename(db_path) == ShardedStore.MANIFEST: return os.path.join(os.path.dirname(db_path), "baselines.sqlite")
+    return db_path + ".baselines.sqlite"
+
+def canonical_json(obj):
+    return json.dumps(obj.to_dict() if isinstance(obj, Requirement) else obj, sort_keys=True, ensure_ascii=False,
+                      separators=(',', ':'), default=json_default)
+
+def content_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def subsystem_tree(reqs):
+    """(hash albero, [[id, hash record]], {hash record: json}) di una lista di requisiti."""
+    entries = []; bodies = {}
+    for r in reqs:
+        body = canonical_json(r); h = content_hash(body)
+        bodies[h] = body; entries.append([r.get('id', ''), h])
+    return content_hash(canonical_json(entries)), entries, bodies
+
+def field_changes(a, b):
+    """Campi cambiati; le descrizioni si confrontano in forma compatta (la migrazione non e' una modifica)."""
+    return sorted(k for k in set(a) | set(b) if a.get(k) != b.get(k)
+                  and not (k == 'desc' and compact_desc(a.get(k) or '') == compact_desc(b.get(k) or '')))
+
+class BaselineStore:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS objects (hash TEXT PRIMARY KEY, body TEXT NOT NULL) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS baselines (name TEXT PRIMARY KEY, created TEXT, note TEXT, root TEXT NOT NULL, count INTEGER);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        with self.conn: self.conn.executescript(self.SCHEMA)
+
+    def close(self): self.conn.close()
+
+    def names(self):
+        return [dict(zip(('name', 'created', 'note', 'count'), row))
+                for row in self.conn.execute("SELECT name, created, note, count FROM baselines ORDER BY created, name")]
+
+    def has(self, h):
+        return self.conn.execute("SELECT 1 FROM objects WHERE hash = ?", (h,)).fetchone() is not None
+
+    def body(self, h):
+        row = self.conn.execute("SELECT body FROM objects WHERE hash = ?", (h,)).fetchone()
+        if row is None: raise KeyError(h)
+        return json.loads(row[0])
+
+    def root(self, name):
+        row = self.conn.execute("SELECT root FROM baselines WHERE name = ?", (name,)).fetchone()
+        if row is None: raise KeyError(f"baseline '{name}' not found")
+        return self.body(row[0])
+
+    def create(self, name, data, note="", created=""):
+        """Salva data come baseline name (sostituendo una baseline omonima). Ritorna gli oggetti nuovi scritti."""
+        root = {}; new = 0; total = 0
+        with self.conn:
+            for p, subs in data.items():
+                root[p] = {}
+                for s in subs:
+                    reqs = subs[s]; total += len(reqs)
+                    tree, entries, bodies = subsystem_tree(reqs); root[p][s] = tree
+                    if self.has(tree): continue  # sottosistema identico a una baseline precedente
+                    before = self.conn.total_changes
+                    self.conn.executemany("INSERT OR IGNORE INTO objects VALUES (?, ?)", bodies.items())
+                    self.conn.execute("INSERT OR IGNORE INTO objects VALUES (?, ?)", (tree, canonical_json(entries)))
+                    new += self.conn.total_changes - before
+            body = canonical_json(root); h = content_hash(body)
+            self.conn.execute("INSERT OR IGNORE INTO objects VALUES (?, ?)", (h, body))
+            self.conn.execute("INSERT OR REPLACE INTO baselines VALUES (?, ?, ?, ?, ?)", (name, created, note, h, total))
+        return new
+
+    def delete(self, name):
+        """Elimina la baseline e gli oggetti che nessun'altra baseline usa piu'."""
+        with self.conn:
+            self.conn.execute("DELETE FROM baselines WHERE name = ?", (name,))
+            live = set()
+            for (root_h,) in self.conn.execute("SELECT root FROM baselines").fetchall():
+                live.add(root_h)
+                for subs in self.body(root_h).values():
+                    for tree in subs.values():
+                        if tree in live: continue
+                        live.add(tree); live.update(h for _, h in self.body(tree))
+            dead = [h for (h,) in self.conn.execute("SELECT hash FROM objects") if h not in live]
+            self.conn.executemany("DELETE FROM objects WHERE hash = ?", ((h,) for h in dead))
+        return len(dead)
+
+    def load(self, name):
+        """Il database com'era alla baseline."""
+        return {p: {s: [Requirement.from_dict(self.body(h)) for _, h in self.body(tree)] for s, tree in subs.items()}
+                for p, subs in self.root(name).items()}
+
+    def side(self, x):
+        """Lato di un diff: nome di baseline o dati in memoria (copia di lavoro).
+        {project: {subsystem: (hash albero, entries o None se da leggere, {hash: record} per la copia di lavoro)}}"""
+        if isinstance(x, str): return {p: {s: (t, None, None) for s, t in subs.items()} for p, subs in self.root(x).items()}
+        out = {}
+        for p, subs in x.items():
+            out[p] = {}
+            for s in subs:
+                tree, entries, _ = subsystem_tree(subs[s])
+                out[p][s] = (tree, entries, {h: r for r, (_, h) in zip(subs[s], entries)})
+        return out
+
+    @profiled("baseline_diff")
+    def diff(self, a, b):
+        """Differenze da a a b (nome di baseline o dati della copia di lavoro), per sottosistema:
+        [{'project', 'subsystem', 'added': [id], 'removed': [id], 'modified': [(id, [campi])]}].
+        I sottosistemi con lo stesso albero si saltano senza leggerne i record."""
+        sa, sb = self.side(a), self.side(b); out = []
+        for p in list(sa) + [p for p in sb if p not in sa]:
+            subs_a, subs_b = sa.get(p, {}), sb.get(p, {})
+            for s in list(subs_a) + [s for s in subs_b if s not in subs_a]:
+                ta, tb = subs_a.get(s), subs_b.get(s)
+                if ta and tb and ta[0] == tb[0]: continue
+                ea = dict(ta[1] if ta and ta[1] is not None else self.body(ta[0]) if ta else [])
+                eb = dict(tb[1] if tb and tb[1] is not None else self.body(tb[0]) if tb else [])
+                rec_a = (lambda h: ta[2][h]) if ta and ta[2] else (lambda h: self.body(h))
+                rec_b = (lambda h: tb[2][h]) if tb and tb[2] else (lambda h: self.body(h))
+                added = [rid for rid in eb if rid not in ea]
+                removed = [rid for rid in ea if rid not in eb]
+                modified = [(rid, field_changes(rec_a(h), rec_b(eb[rid]))) for rid, h in ea.items() if rid in eb and eb[rid] != h]
+                modified = [(rid, fields) for rid, fields in modified if fields]  # nessun campo: cambiata solo la forma della descrizione
+                if added or removed or modified:
+                    out.append({'project': p, 'subsystem': s, 'added': added, 'removed': removed, 'modified': modified})
+        return out
+
+# --- INDEX ---
+REQ_ID_PATTERN = re.compile(r'^REQ-(\d+)$', re.IGNORECASE)
+INDEXED_FIELDS = ('status', 'type', 'method', 'needs_review')  # campi enumerati con indice secondario
+
+class ProjectIndex:
+    """Indice in memoria di un progetto, aggiornato a ogni operazione:
+    id -> record, parent_id -> figli, record -> sottosistema, campo enumerato -> valore -> record."""
+    def __init__(self, subsystems=None):
+        self.by_id = {}      # id -> [record, ...] (piu' di uno solo con ID duplicati)
+        self.children = {}   # parent_id -> {id(record): record}
+        self.sub_of = {}     # id(record) -> sottosistema
+        self.by_field = {f: {} for f in INDEXED_FIELDS}  # campo -> valore -> {id(record): record}
+        self.texts = {}      # id(record) -> testo di ricerca, calcolato alla prima query testuale
+        self.max_num = 0; self.max_dirty = False
+        for s, reqs in (subsystems or {}).items():
+            for r in reqs: self.add(s, r)
+
+    def add(self, s, r):
+        rid = r.get('id') or ''  # record senza ID (li segnala validate): indicizzati sotto ''
+        self.by_id.setdefault(rid, []).append(r)
+        pid = r.get('parent_id')
+        if pid: self.children.setdefault(pid, {})[id(r)] = r
+        self.sub_of[id(r)] = s
+        for f, values in self.by_field.items(): values.setdefault(r.get(f, ''), {})[id(r)] = r
+        m = rid and REQ_ID_PATTERN.match(rid)
+        if m and int(m.group(1)) > self.max_num: self.max_num = int(m.group(1))
+
+    def remove(self, r):
+        rid = r.get('id') or ''; same = self.by_id.get(rid, [])
+        for k, x in enumerate(same):
+            if x is r: del same[k]; break
+        if not same: self.by_id.pop(rid, None)
+        pid = r.get('parent_id')
+        if pid in self.children:
+            self.children[pid].pop(id(r), None)
+            if not self.children[pid]: del self.children[pid]
+        self.sub_of.pop(id(r), None); self.texts.pop(id(r), None)
+        for f, values in self.by_field.items():
+            bucket = values.get(r.get(f, ''))
+            if bucket is not None:
+                bucket.pop(id(r), None)
+                if not bucket: del values[r.get(f, '')]
+        m = rid and REQ_ID_PATTERN.match(rid)
+        if m and int(m.group(1)) == self.max_num: self.max_dirty = True
+
+    def get(self, rid):
+        same = self.by_id.get(rid)
+        return same[0] if same else None
+
+    def ids(self): return self.by_id.keys()
+    def children_of(self, pid): return list(self.children.get(pid, {}).values())
+    def subsystem_of(self, r): return self.sub_of.get(id(r))
+    def has_children(self, rid): return rid in self.children
+
+    # --- tracciabilita': visite iterative sulla mappa parent -> figli, nessuna ricorsione e nessun ciclo infinito ---
+    def descendants(self, rid, max_depth=None):
+        """Sotto-albero di rid in ampiezza, attraverso tutti i sottosistemi: [(profondita', record)]."""
+        out = []; seen = {rid}; frontier = [rid]; depth = 0
+        while frontier and (max_depth is None or depth < max_depth):
+            depth += 1; nxt = []
+            for pid in frontier:
+                for r in self.children.get(pid, {}).values():
+                    cid = r.get('id') or ''
+                    if cid in seen: continue
+                    seen.add(cid); nxt.append(cid); out.append((depth, r))
+            frontier = nxt
+        return out
+
+    def ancestors(self, rid):
+        """Catena dei parent di rid fino al livello missione (primo elemento = parent diretto).
+        Si ferma su un parent_id inesistente o su un ciclo."""
+        out = []; seen = {rid}; r = self.get(rid)
+        while r is not None:
+            pid = r.get('parent_id')
+            if not pid or pid in seen: break
+            seen.add(pid); r = self.get(pid)
+            if r is not None: out.append(r)
+        return out
+
+    def orphans(self):
+        """Requisiti senza traccia verso l'alto: parent_id che non esiste nel progetto, oppure isolati
+        (nessun parent e nessun figlio). Le radici con figli sono il livello missione, non orfani."""
+        out = []
+        for same in self.by_id.values():
+            for r in same:
+                pid = r.get('parent_id')
+                if (pid not in self.by_id) if pid else (r.get('id') not in self.children): out.append(r)
+        return out
+
+    def leaves(self):
+        """Requisiti tracciati a un parent ma senza figli: il fondo delle catene di derivazione."""
+        return [r for same in self.by_id.values() for r in same if r.get('parent_id') and r.get('id') not in self.children]
+
+    def text_of(self, r):
+        t = self.texts.get(id(r))
+        if t is None: t = self.texts[id(r)] = row_text(r)
+        return t
+
+    def next_req_id(self):
+        if self.max_dirty:
+            nums = [int(m.group(1)) for m in map(REQ_ID_PATTERN.match, self.by_id) if m]
+            self.max_num = max(nums, default=0); self.max_dirty = False
+        return f"REQ-{self.max_num + 1:03d}"
+
+    def apply(self, subsystems, op, inv):
+        k = op['op']; s = op.get('s')
+        if k == 'ins': self.add(s, op['r'])
+        elif k == 'set': self.remove(inv['r']); self.add(s, op['r'])
+        elif k == 'del': self.remove(inv['r'])
+        elif k == 'add_sub':
+            for r in subsystems[s]: self.add(s, r)
+        elif k == 'del_sub':
+            for r in inv['reqs']: self.remove(r)
+        elif k == 'ren_sub':
+            for r in subsystems[op['n']]: self.sub_of[id(r)] = op['n']
+
+class DatabaseIndex:
+    """Un ProjectIndex per progetto, costruito alla prima richiesta e poi mantenuto incrementalmente."""
+    def __init__(self, data):
+        self.data = data; self.projects = {}
+
+    def project(self, p):
+        if p not in self.projects: self.projects[p] = ProjectIndex(self.data[p])
+        return self.projects[p]
+
+    def apply(self, op, inv):
+        k = op['op']; p = op['p']
+        if k == 'del_proj': self.projects.pop(p, None)
+        elif k == 'ren_proj':
+            if p in self.projects: self.projects[op['n']] = self.projects.pop(p)
+        elif p in self.projects: self.projects[p].apply(self.data[p], op, inv)
+
+# --- RULES ---
+TYPE_OPTS = ["System", "Functional", "Performance", "Interface", "Environmental", "Design", "Safety"]
+STATUS_OPTS = ["Draft", "TBD (To Be Defined)", "TBC (To Be Confirmed)", "Verified", "Closed", "Obsolete"]
+METHOD_OPTS = ["Test", "Analysis", "Inspection", "Review of Design", "Similarity"]
+STANDARD_SUBSYSTEMS = ["Mission", "Payload", "AOCS", "EPS", "TCS", "COMMS", "OBDH", "Structure"]
+
+def new_req(**fields):
+    r = Requirement(id='', type='System', desc='', parent_id='', value='', unit='',
+                    status='Draft', method='Analysis', last_modified='', needs_review=False)
+    r.update(fields); return r
+
+def next_req_id(ids):
+    """REQ-<max+1> sugli ID nella forma REQ-nnn (senza indice: vedi ProjectIndex.next_req_id)."""
+    nums = [int(m.group(1)) for m in map(REQ_ID_PATTERN.match, ids) if m]
+    return f"REQ-{max(nums, default=0) + 1:03d}"
+
+def req_id_error(new_id, new_parent, existing_ids, original_id=None):
+    """Messaggio d'errore per ID/parent non validi, None se va bene."""
+    if not new_id: return "ID mandatory."
+    if " " in new_id: return "ID no spaces."
+    if new_id in existing_ids and new_id != original_id: return "ID exists."
+    if new_parent == new_id: return "Self-parenting."
+    if new_parent and new_parent not in existing_ids: return f"Parent ID '{new_parent}' does not exist."
+    return None
+
+ISSUE_KINDS = ('missing_id', 'duplicate', 'dangling', 'cycle')
+
+def creates_cycle(get, target_id, new_parent_id):
+    """True se assegnare new_parent_id a target_id chiude un ciclo. get(id) -> record o None."""
+    if not new_parent_id: return False
+    if target_id == new_parent_id: return True
+    current = get(new_parent_id); seen = {new_parent_id}
+    while current and current.get('parent_id'):
+        pid = current['parent_id']
+        if pid == target_id: return True
+        if pid in seen: return False  # ciclo preesistente che non coinvolge target
+        seen.add(pid); current = get(pid)
+    return False
+
+def position_of(reqs, r):
+    """Indice di r in reqs per identita': list.index confronterebbe i record campo per campo
+    e con due record uguali potrebbe restituire l'altro."""
+    return next(i for i, x in enumerate(reqs) if x is r)
+
+def parent_ref_op(data, pindex, project, r, new_parent):
+    s = pindex.subsystem_of(r)
+    return {'op': 'set', 'p': project, 's': s, 'i': position_of(data[project][s], r),
+            'r': dict(r, parent_id=new_parent, needs_review=True)}
+
+def reparent_ops(data, pindex, project, old, new):
+    """Operazioni che spostano i figli di old su new ("" = orfani), marcandoli needs_review."""
+    return [parent_ref_op(data, pindex, project, r, new) for r in pindex.children_of(old)]
+
+@profiled("validate", lambda issues, data: sum(len(r) for subs in data.values() for r in subs.values()))
+def validate(data):
+    """Controlli di integrita' dell'intero database in O(N): ID mancanti o duplicati e parent inesistenti con
+    tabelle hash, cicli con una sola visita a colori. Ritorna una lista di issue
+    {'project', 'subsystem', 'id', 'kind', 'message', 'at'}: kind in ISSUE_KINDS, at = [(subsystem, indice)]
+    dei record coinvolti (entrambi per un duplicato, tutto l'anello per un ciclo)."""
+    issues = []
+    def issue(p, s, rid, kind, msg, at):
+        issues.append({'project': p, 'subsystem': s, 'id': rid, 'kind': kind, 'message': msg, 'at': at})
+    for p, subs in data.items():
+        loc = {}; parent = {}
+        for s, reqs in subs.items():
+            for i, r in enumerate(reqs):
+                rid = r.get('id')
+                if not rid: issue(p, s, '', 'missing_id', "Missing ID", [(s, i)]); continue
+                if rid in loc: issue(p, s, rid, 'duplicate', f"Duplicate ID (also in {loc[rid][0]})", [loc[rid], (s, i)]); continue
+                loc[rid] = (s, i); parent[rid] = r.get('parent_id') or ''
+        for rid, pid in parent.items():
+            if pid and pid not in parent: issue(p, loc[rid][0], rid, 'dangling', f"Parent '{pid}' does not exist", [loc[rid]])
+        # colorazione: 0 = da visitare, 1 = sul cammino corrente, 2 = chiuso
+        color = dict.fromkeys(parent, 0); get = color.get
+        for start in parent:
+            if color[start]: continue
+            path = []; rid = start
+            while get(rid) == 0:
+                color[rid] = 1; path.append(rid); rid = parent[rid]
+            if get(rid) == 1:
+                cyc = path[path.index(rid):]
+                issue(p, loc[rid][0], rid, 'cycle', "Circular dependency: " + " -> ".join(cyc + [rid]), [loc[x] for x in cyc])
+            for x in path: color[x] = 2
+    return issues
+
+def review_ops(data, issues):
+    """Operazioni 'set' che marcano needs_review sui record coinvolti nelle issue, una per record non ancora marcato."""
+    ops = []; seen = set()
+    for it in issues:
+        p = it['project']
+        for s, i in it['at']:
+            if (p, s, i) in seen: continue
+            seen.add((p, s, i)); r = data[p][s][i]
+            if not r.get('needs_review'): ops.append({'op': 'set', 'p': p, 's': s, 'i': i, 'r': dict(r, needs_review=True)})
+    return ops
+
+def compact_ops(data):
+    """Migrazione: operazioni 'set' che riscrivono in forma compatta (compact_desc) le descrizioni salvate come
+    documenti toHtml() completi. Il resto del record, last_modified compreso, non cambia."""
+    ops = []
+    for p, subs in data.items():
+        for s, reqs in subs.items():
+            for i, r in enumerate(reqs):
+                d = r.get('desc')
+                if not d or '<' not in d: continue
+                c = compact_desc(d)
+                if c != d: ops.append({'op': 'set', 'p': p, 's': s, 'i': i, 'r': dict(r, desc=c)})
+    return ops
+
+def stats(data):
+    """{project: {'subsystems': {s: n}, 'status': {...}, 'type': {...}, 'needs_review': n, 'total': n}}"""
+    out = {}
+    for p, subs in data.items():
+        st = {'subsystems': {}, 'status': {}, 'type': {}, 'method': {}, 'needs_review': 0, 'total': 0}
+        for s, reqs in subs.items():
+            st['subsystems'][s] = len(reqs); st['total'] += len(reqs)
+            for r in reqs:
+                for f in ('status', 'type', 'method'): st[f][r.get(f, '')] = st[f].get(r.get(f, ''), 0) + 1
+                st['needs_review'] += bool(r.get('needs_review', False))
+        out[p] = st
+    return out
+
+# --- QUERY ---
+# Linguaggio: termini separati da spazi, tutti in AND.
+#   campo:valore   es. status:TBD type:Performance parent:REQ-0*   (valori con spazi tra virgolette)
+#   -campo:valore  negazione
+#   parola         sottostringa su tutte le colonne, come la ricerca della tabella
+# I valori con * o ? sono glob; senza, i campi enumerati confrontano il prefisso, id/parent il valore
+# esatto e i campi di testo la sottostringa. Tutti i confronti ignorano maiuscole/minuscole.
+QUERY_FIELDS = {'id': 'id', 'type': 'type', 'status': 'status', 'method': 'method', 'parent': 'parent_id',
+                'parent_id': 'parent_id', 'value': 'value', 'target': 'value', 'unit': 'unit', 'desc': 'desc',
+                'review': 'needs_review', 'project': 'project', 'subsystem': 'subsystem', 'sub': 'subsystem'}
+ENUM_FIELDS = ('type', 'status', 'method', 'project', 'subsystem')
+EXACT_FIELDS = ('id', 'parent_id')
+
+class QueryError(ValueError):
+    pass
+
+def is_structured_query(text):
+    return bool(re.search(r'(^|\s)-?[A-Za-z_]+:', text or ''))
+
+def row_text(r):
+    return "\n".join(str(x) for x in (r.get('id', ''), r.get('type', ''), clean_html_smart(r.get('desc', '')), r.get('value', ''),
+                                      r.get('unit', ''), r.get('status', ''), r.get('method', ''), r.get('parent_id', ''),
+                                      "YES" if r.get('needs_review', False) else "NO")).lower()
+
+class Term:
+    def __init__(self, field, value, negate=False):
+        self.field = field; self.value = value.lower(); self.negate = negate
+        self.glob = any(ch in value for ch in '*?')
+        if field == 'needs_review':
+            if self.value not in ('yes', 'no', 'true', 'false', '1', '0'): raise QueryError(f"review: expects yes/no, got '{value}'")
+            self.flag = self.value in ('yes', 'true', '1')
+
+    def test_value(self, v):
+        """Confronto sul singolo valore del campo (usato anche sulle chiavi degli indici)."""
+        if self.field == 'needs_review': return bool(v) == self.flag
+        v = str(v).lower()
+        if self.glob: return fnmatchcase(v, self.value)
+        if self.field in ENUM_FIELDS: return v.startswith(self.value)
+        if self.field in EXACT_FIELDS: return v == self.value
+        return self.value in v
+
+    def match(self, project, subsystem, r, pindex=None):
+        if self.field is None: hit = self.value in (pindex.text_of(r) if pindex is not None else row_text(r))
+        elif self.field == 'project': hit = self.test_value(project)
+        elif self.field == 'subsystem': hit = self.test_value(subsystem)
+        elif self.field == 'desc': hit = self.test_value(clean_html_smart(r.get('desc', '')))
+        else: hit = self.test_value(r.get(self.field, False if self.field == 'needs_review' else ''))
+        return hit != self.negate
+
+class Query:
+    def __init__(self, terms):
+        self.terms = terms
+
+    def match(self, project, subsystem, r, pindex=None):
+        return all(t.match(project, subsystem, r, pindex) for t in self.terms)
+
+    def indexed(self, t):
+        # parent_id usa la mappa dei figli dell'indice; '' (nessun parent) non e' indicizzato
+        return not t.negate and (t.field in INDEXED_FIELDS or (t.field == 'parent_id' and t.value))
+
+    def candidates(self, pindex):
+        """Intersezione dei record che soddisfano i termini indicizzati, o None se non ce ne sono."""
+        best = None
+        for t in self.terms:
+            if not self.indexed(t): continue
+            buckets = pindex.children if t.field == 'parent_id' else pindex.by_field[t.field]
+            hit = {}
+            for v, bucket in buckets.items():
+                if t.test_value(v): hit.update(bucket)
+            best = hit if best is None else {k: r for k, r in best.items() if k in hit}
+            if not best: break
+        return best
+
+    @profiled("query", lambda res, *a: len(res))
+    def run(self, index, projects=None):
+        """Esegue la query su un DatabaseIndex: ritorna [(project, subsystem, record), ...]."""
+        out = []
+        for p in (projects if projects is not None else list(index.data)):
+            if any(t.field == 'project' and not t.match(p, None, None) for t in self.terms): continue
+            pidx = index.project(p)
+            cands = self.candidates(pidx)
+            if cands is None:
+                rows = ((s, r) for s, reqs in index.data[p].items() for r in reqs); rest = self.terms
+            else:
+                rows = ((pidx.subsystem_of(r), r) for r in cands.values()); rest = [t for t in self.terms if not self.indexed(t)]
+            out.extend((p, s, r) for s, r in rows if all(t.match(p, s, r, pidx) for t in rest))
+        return out
+
+def compile_query(text):
+    try: tokens = shlex.split(text or '')
+    except ValueError as e: raise QueryError(str(e))
+    terms = []
+    for tok in tokens:
+        negate = tok.startswith('-') and ':' in tok
+        if negate: tok = tok[1:]
+        key, sep, value = tok.partition(':')
+        if not sep: terms.append(Term(None, tok)); continue
+        field = QUERY_FIELDS.get(key.lower())
+        if field is None: raise QueryError(f"Unknown field '{key}'. Valid: {', '.join(sorted(QUERY_FIELDS))}")
+        terms.append(Term(field, value, negate))
+    return Query(terms)
+
+def query(data, text, index=None):
+    """API Python: query(data, 'status:TBD type:Performance') -> [(project, subsystem, record), ...]."""
+    return compile_query(text).run(index if index is not None else DatabaseIndex(data))
+
+# --- EXPORT ---
+# (header, estrattore) nell'ordine in cui appaiono nel CSV; la selezione dell'utente e' una lista di header.
+CSV_COLUMNS = [
+    ("ID", lambda s, r: r.get('id', '')),
+    ("Subsystem", lambda s, r: s),
+    ("Type", lambda s, r: r.get('type', '')),
+    ("Desc", lambda s, r: clean_html_smart(r.get('desc', ''))),
+    ("Val", lambda s, r: r.get('value', '')),
+    ("Unit", lambda s, r: r.get('unit', '')),
+    ("Status", lambda s, r: r.get('status', '')),
+    ("Method", lambda s, r: r.get('method', '')),
+    ("Parent", lambda s, r: r.get('parent_id', '')),
+    ("Needs Review", lambda s, r: "YES" if r.get('needs_review', False) else "NO"),
+]
+CSV_DEFAULT = [h for h, _ in CSV_COLUMNS if h != "Subsystem"]  # colonne storiche + Method
+
+class ExportCancelled(Exception):
+    pass
+
+def count_reqs(subsystems):
+    return sum(len(reqs) for reqs in subsystems.values())
+
+def iter_csv_rows(subsystems, columns=None):
+    """Generatore di righe CSV (liste di stringhe) per un progetto: nessuna lista intermedia."""
+    wanted = set(columns or CSV_DEFAULT)
+    getters = [g for h, g in CSV_COLUMNS if h in wanted]
+    for s, reqs in subsystems.items():
+        for r in reqs: yield [g(s, r) for g in getters]
+
+@profiled("export_csv", lambda n, *a: n)
+def write_csv(path, subsystems, columns=None, progress=None, cancelled=None, chunk=EXPORT_CHUNK_ROWS):
+    """Scrive il CSV a blocchi di `chunk` righe su un file temporaneo, rinominato solo a fine export.
+    progress(done, total) e' chiamato a ogni blocco; se cancelled() e' vero l'export si interrompe
+    con ExportCancelled e il file di destinazione resta intatto. Memoria costante nel numero di righe."""
+    total = count_reqs(subsystems); done = 0
+    headers = [h for h, _ in CSV_COLUMNS if h in set(columns or CSV_DEFAULT)]
+    tmp = path + ".tmp"
+    try:
+        # utf-8-sig per compatibilita' Excel
+        with open(tmp, 'w', newline='', encoding='utf-8-sig', buffering=1 << 20) as f:
+            w = csv.writer(f); w.writerow(headers); buf = []
+            for row in iter_csv_rows(subsystems, headers):
+                buf.append(row)
+                if len(buf) >= chunk:
+                    if cancelled and cancelled(): raise ExportCancelled()
+                    w.writerows(buf); done += len(buf); buf.clear()
+                    if progress: progress(done, total)
+            w.writerows(buf); done += len(buf)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
+    if progress: progress(done, total)
+    return done
+
+# Report PDF: un frammento HTML per sottosistema, costruito con join (niente += quadratico)
+# e riusato finche' il contenuto del sottosistema non cambia.
+REPORT_CSS = """<style>
+    body { font-family: Helvetica, Arial, sans-serif; }
+    h1 { color: #2c3e50; font-size: 24pt; margin-bottom: 5px; }
+    p.meta { color: #7f8c8d; font-size: 10pt; margin-bottom: 20px; }
+    h2 { color: #34495e; border-bottom: 2px solid #34495e; margin-top: 25px; font-size: 16pt; }
+    table { border-collapse: collapse; width: 100%; font-size: 11pt; }
+    th { background-color: #ecf0f1; border: 1px solid #bdc3c7; padding: 8px; font-weight: bold; text-align: left; color: #2c3e50; }
+    td { border: 1px solid #bdc3c7; padding: 8px; vertical-align: top; }
+    .status-draft { color: #95a5a6; font-style: italic; }
+    .status-ver { color: #27ae60; font-weight: bold; }
+    .status-tbd { color: #c0392b; font-weight: bold; }
+    .status-closed { color: #34495e; text-decoration: line-through; }
+</style>"""
+REPORT_HEAD = "<tr><th>ID</th><th>Type</th><th>Description</th><th>Target</th><th>Unit</th><th>Status</th><th>Method</th><th>Parent</th></tr>"
+
+def status_class(st):
+    if "Verified" in st: return "status-ver"
+    if "TBD" in st or "TBC" in st: return "status-tbd"
+    if "Draft" in st: return "status-draft"
+    if "Closed" in st or "Obsolete" in st: return "status-closed"
+    return ""
+
+def report_header_html(project, timestamp):
+    return f"<h1>Project: {html.escape(project)}</h1><p class='meta'>Report \u2022 Generated: {timestamp}</p>"
+
+def section_html(sub, reqs):
+    """Tabella HTML di un sottosistema."""
+    e = lambda v: html.escape(str(v))
+    parts = [f"<h2>{e(sub)}</h2><table width='100%' cellspacing='0'>", REPORT_HEAD]
+    for r in reqs:
+        st = r.get('status', '')
+        parts.append(f"<tr><td><b>{e(r.get('id', ''))}</b></td><td>{e(r.get('type', ''))}</td>"
+                     f"<td>{e(clean_html_smart(r.get('desc', '')))}</td><td>{e(r.get('value', ''))}</td>"
+                     f"<td>{e(r.get('unit', ''))}</td><td class='{status_class(st)}'>{e(st)}</td>"
+                     f"<td>{e(r.get('method', ''))}</td><td>{e(r.get('parent_id', ''))}</td></tr>")
+    parts.append("</table>")
+    return "".join(parts)
+
+def content_digest(obj):
+    return hashlib.sha1(json.dumps(obj, sort_keys=True, ensure_ascii=False, default=json_default).encode('utf-8')).hexdigest()
+
+class ReportCache:
+    """Frammenti HTML per (progetto, sottosistema), validi finche' il digest del contenuto non cambia."""
+    def __init__(self):
+        self.by_project = {}  # progetto -> {sottosistema: (digest, html)}
+
+    @profiled("report_html", lambda out, *a: sum(n for _, n, _ in out))
+    def sections(self, project, subsystems, cancelled=None):
+        """[(sottosistema, n requisiti, html)] in ordine alfabetico, saltando i sottosistemi vuoti."""
+        old = self.by_project.get(project, {}); new = {}; out = []
+        for sub in sorted(subsystems):
+            reqs = subsystems[sub]
+            if not reqs: continue
+            if cancelled and cancelled(): raise ExportCancelled()
+            digest = content_digest(reqs); hit = old.get(sub)
+            frag = hit[1] if hit and hit[0] == digest else section_html(sub, reqs)
+            new[sub] = (digest, frag); out.append((sub, len(reqs), frag))
+        self.by_project[project] = new
+        return out
+
+# --- IMPORT ---
+# Colonne riconosciute in import (minuscole): gli header di export_csv piu' i nomi dei campi e qualche sinonimo.
+IMPORT_ALIASES = {
+    'id': 'id', 'identifier': 'id', 'reqif.foreignid': 'id',
+    'subsystem': 'subsystem',
+    'type': 'type',
+    'desc': 'desc', 'description': 'desc', 'text': 'desc', 'reqif.text': 'desc',
+    'val': 'value', 'value': 'value', 'target': 'value',
+    'unit': 'unit', 'status': 'status', 'method': 'method',
+    'parent': 'parent_id', 'parent_id': 'parent_id', 'parent id': 'parent_id',
+    'needs review': 'needs_review', 'needs_review': 'needs_review', 'review': 'needs_review',
+}
+
+def import_row(raw):
+    """dict con header qualsiasi -> dict con i campi dello schema (solo quelli riconosciuti e non vuoti)."""
+    row = {}
+    for k, v in raw.items():
+        key = IMPORT_ALIASES.get((k or '').strip().lower())
+        if key is None or v is None: continue
+        v = v.strip() if isinstance(v, str) else v
+        if key == 'needs_review': v = str(v).strip().upper() in ("YES", "Y", "TRUE", "1")
+        elif v == '': continue
+        row[key] = v
+    return row
+
+def read_csv_rows(path):
+    """[(numero di riga, campi)] da un CSV con gli header di export_csv (o sinonimi)."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        sample = f.read(4096); f.seek(0)
+        try: dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error: dialect = csv.excel
+        return [(n, import_row(raw)) for n, raw in enumerate(csv.DictReader(f, dialect=dialect), start=2)]
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def read_reqif_rows(path):
+    """[(numero progressivo, campi)] dagli SPEC-OBJECT di un file ReqIF. Gli attributi sono mappati per LONG-NAME
+    (vedi IMPORT_ALIASES); senza un attributo Parent, il parent viene dalla gerarchia SPEC-HIERARCHY."""
+    root = ElementTree.parse(path).getroot()
+    for el in root.iter(): el.tag = _local(el.tag)
+    names = {d.get('IDENTIFIER'): d.get('LONG-NAME') or d.get('IDENTIFIER')
+             for d in root.iter() if d.tag.startswith('ATTRIBUTE-DEFINITION-') or d.tag == 'ENUM-VALUE'}
+    objects = {}
+    for obj in root.iter('SPEC-OBJECT'):
+        raw = {}
+        for av in obj.iter():
+            if not av.tag.startswith('ATTRIBUTE-VALUE-'): continue
+            ref = next((r.text for r in av.iter() if r.tag.startswith('ATTRIBUTE-DEFINITION-') and r.tag.endswith('-REF')), None)
+            if av.tag == 'ATTRIBUTE-VALUE-XHTML':
+                content = next(av.iter('THE-VALUE'), None)
+                val = "".join(ElementTree.tostring(c, encoding='unicode') for c in content) if content is not None else ''
+                val = re.sub(r'\s+xmlns(:\w+)?="[^"]*"', '', val)
+            elif av.tag == 'ATTRIBUTE-VALUE-ENUMERATION':
+                val = ", ".join(names.get(r.text, r.text) for r in av.iter('ENUM-VALUE-REF'))
+            else: val = av.get('THE-VALUE', '')
+            raw[names.get(ref, ref)] = val
+        row = import_row(raw)
+        row.setdefault('id', obj.get('LONG-NAME') or obj.get('IDENTIFIER'))
+        objects[obj.get('IDENTIFIER')] = row
+    def walk(node, parent_row):
+        for h in node.findall('CHILDREN/SPEC-HIERARCHY'):
+            ref = next((r.text for r in h.iter('SPEC-OBJECT-REF')), None); row = objects.get(ref)
+            if row is not None and parent_row is not None: row.setdefault('parent_id', parent_row['id'])
+            walk(h, row if row is not None else parent_row)
+    for spec in root.iter('SPECIFICATION'): walk(spec, None)
+    return list(enumerate(objects.values(), start=1))
+
+def read_import_rows(path):
+    return read_reqif_rows(path) if path.lower().endswith(('.reqif', '.xml')) else read_csv_rows(path)
+
+@profiled("plan_import", lambda res, data, project, rows, *a: len(rows))
+def plan_import(data, project, rows, default_subsystem=None, timestamp=''):
+    """Valida tutte le righe in un solo passo e ritorna (ops, errori).
+    Controlli con insiemi: ID mancanti o con spazi, duplicati nel file o gia' nel progetto, parent inesistenti
+    (ne' nel progetto ne' tra le righe valide), cicli tra le righe importate. errori = [(riga, id, messaggio)].
+    ops aggiunge le righe valide in coda ai sottosistemi (add_sub per quelli nuovi), da applicare in un colpo solo."""
+    subs = data[project]
+    existing = {r['id']: r.get('parent_id') or '' for reqs in subs.values() for r in reqs if r.get('id')}
+    counts = Counter(row.get('id') for _, row in rows)
+    errors = []; ok = {}
+    for line, row in rows:
+        rid = row.get('id'); sub = row.get('subsystem') or default_subsystem
+        if not rid: errors.append((line, '', "Missing ID")); continue
+        if " " in rid: errors.append((line, rid, "ID contains spaces")); continue
+        if counts[rid] > 1: errors.append((line, rid, f"Duplicate ID in file ({counts[rid]} rows)")); continue
+        if rid in existing: errors.append((line, rid, "ID already exists in project")); continue
+        if not sub: errors.append((line, rid, "No subsystem")); continue
+        ok[rid] = (line, row, sub)
+    # parent e cicli in O(N): si risale la catena di ogni riga una volta sola (colorazione) e l'esito si propaga
+    # ai discendenti; i record esistenti non possono puntare a ID nuovi, quindi i cicli sono solo tra le righe importate
+    parent = {rid: row.get('parent_id') or '' for rid, (_, row, _) in ok.items()}
+    verdict = {}  # rid -> None se valida, altrimenti il messaggio d'errore
+    for start in parent:
+        path = []; on_path = set(); rid = start
+        while rid in parent and rid not in verdict and rid not in on_path:
+            on_path.add(rid); path.append(rid); rid = parent[rid]
+        if rid in on_path:
+            k = path.index(rid)
+            for x in path[k:]: verdict[x] = "Circular dependency"
+            path = path[:k]; bad = True
+        else: bad = (rid in verdict and verdict[rid] is not None) or (rid not in verdict and rid != '' and rid not in existing)
+        for x in reversed(path):
+            p = parent[x]
+            verdict[x] = None if not bad else f"Parent '{p}' was rejected" if p in counts else f"Parent '{p}' does not exist"
+    for rid, msg in verdict.items():
+        if msg: errors.append((ok.pop(rid)[0], rid, msg))
+    new_subs = {}; ops = []; pos = {}
+    for rid, (line, row, sub) in ok.items():
+        fields = {k: v for k, v in row.items() if k != 'subsystem'}
+        r = new_req(last_modified=timestamp, **fields)
+        if sub in subs:
+            i = pos.setdefault(sub, len(subs[sub])); pos[sub] += 1
+            ops.append({'op': 'ins', 'p': project, 's': sub, 'i': i, 'r': r})
+        else: new_subs.setdefault(sub, []).append(r)
+    ops += [{'op': 'add_sub', 'p': project, 's': sub, 'reqs': reqs} for sub, reqs in new_subs.items()]
+    errors.sort(key=lambda e: e[0])
+    return ops, errors
@@ -0,0 +1,57 @@
+"""Impaginazione PDF dei report di SatReq Manager: solo QtGui/QtPrintSupport, nessun widget, cosi' la usano
+la GUI, reqbatch (nei worker) e reqcli senza caricare l'interfaccia."""
+import os
+
+from PyQt6.QtCore import QRectF, QSizeF
+from PyQt6.QtGui import QGuiApplication, QTextDocument, QPageLayout, QPainter
+from PyQt6.QtPrintSupport import QPrinter
+
+from reqcore import REPORT_CSS, ExportCancelled, profiled
+
+_app = None  # applicazione offscreen per chi non ha gia' la GUI
+
+def qt_app():
+    """QPrinter e i font di QTextDocument vogliono un'applicazione Qt: se non c'e' (batch, CLI) se ne crea una offscreen."""
+    global _app
+    if _app is None:
+        _app = QGuiApplication.instance()
+        if _app is None:
+            os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+            _app = QGuiApplication([])
+    return _app
+
+@profiled("export_pdf", lambda n, *a: n)
+def print_report(path, header, sections, progress=None, cancelled=None):
+    """Impagina le sezioni [(sottosistema, n, html)] nel PDF path, una pagina alla volta.
+    Ogni sottosistema e' un QTextDocument a se' (la memoria dipende dal sottosistema piu' grande,
+    non dal progetto) e comincia su una pagina nuova. Sicura da chiamare fuori dal GUI thread."""
+    total = sum(n for _, n, _ in sections) or 1; done = 0
+    tmp = path + ".tmp"
+    printer = QPrinter(QPrinter.PrinterMode.HighResolution)
+    printer.setOutputFormat(QPrinter.OutputFormat.PdfFormat)
+    printer.setOutputFileName(tmp)
+    printer.setPageOrientation(QPageLayout.Orientation.Landscape)
+    page = printer.pageRect(QPrinter.Unit.DevicePixel); w, h = page.width(), page.height()
+    painter = QPainter()
+    if not painter.begin(printer): raise OSError(f"Cannot write {path}")
+    try:
+        first = True
+        for i, (sub, n, frag) in enumerate(sections or [("", 0, "")]):
+            doc = QTextDocument(); doc.documentLayout().setPaintDevice(printer); doc.setPageSize(QSizeF(w, h))
+            doc.setHtml(REPORT_CSS + (header if i == 0 else "") + frag)
+            pages = doc.pageCount()
+            for k in range(pages):
+                if cancelled and cancelled(): raise ExportCancelled()
+                if not first: printer.newPage()
+                first = False
+                painter.save(); painter.translate(0, -k * h)
+                doc.drawContents(painter, QRectF(0, k * h, w, h)); painter.restore()
+                if progress: progress(done + n * (k + 1) // pages, total)
+            done += n
+        painter.end()
+        os.replace(tmp, path)
+    except BaseException:
+        if painter.isActive(): painter.end()
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
+    return done
@@ -0,0 +1,312 @@
+"""SatReq Manager in modalita' server: un solo processo tiene il database in memoria con i suoi indici,
+serializza le scritture e notifica i client collegati (GUI, CI) con server-sent events. Solo libreria standard.
+
+    python reqserver.py db.json [--host 127.0.0.1] [--port 8765]
+
+La GUI si collega da File > Connect to Server... (http://127.0.0.1:8765). API JSON:
+
+    GET    /api/info                         versione e progetti/sottosistemi con i conteggi
+    GET    /api/db                           {version, data}: l'intero database
+    GET    /api/projects/<p>/<s>             requisiti di un sottosistema
+    GET    /api/query?q=status:TBD           [{project, subsystem, ...requisito}]
+    GET    /api/trace/<p>/<id>[?up=1]        discendenti (o antenati) con la profondita'
+    GET    /api/orphans/<p>, /api/leaves/<p>
+    GET    /api/validate, /api/stats
+    GET    /api/export/<p>[?format=csv|html][&columns=ID,Desc]
+    GET    /api/events                       stream text/event-stream delle modifiche
+    POST   /api/ops                          {base, client, ops}: operazioni elementari (vedi reqcore.apply_op)
+    POST   /api/requirements/<p>/<s>         nuovo requisito in coda (id generato se manca)
+    PUT    /api/requirements/<p>/<id>        modifica per ID (i figli seguono un cambio di ID)
+    DELETE /api/requirements/<p>/<id>        eliminazione per ID (i figli restano orfani)
+    POST   /api/move/<p>/<id>?dir=up|down
+    POST   /api/rename                       {project, subsystem?, name}
+    POST   /api/save                         salvataggio completo / compattazione dello store
+"""
+import sys
+import io
+import csv
+import json
+import asyncio
+import argparse
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs, unquote
+
+import reqcore
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message); self.status = status
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 409: "Conflict", 500: "Internal Server Error"}
+MAX_BODY = 64 * 1024 * 1024
+
+def timestamp(): return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def op_error(data, op):
+    """Messaggio d'errore per un'operazione dei client che apply_op non puo' applicare cosi' com'e' (o che
+    sovrascriverebbe un sottosistema o un progetto esistente), None se va bene. Va chiamata sullo stato
+    in cui l'operazione verra' applicata, cioe' dopo le precedenti dello stesso batch."""
+    if not isinstance(op, dict): return "not an object"
+    k = op.get('op'); p = op.get('p')
+    if k not in reqcore.OP_LABELS: return f"unknown op '{k}'"
+    if not isinstance(p, str) or not p: return "'p' must be a project name"
+    if k == 'add_proj':
+        if p in data: return f"project '{p}' already exists"
+        return None if isinstance(op.get('subs') or {}, dict) else "'subs' must be an object"
+    if p not in data: return f"project '{p}' not found"
+    if k == 'del_proj': return None
+    if k == 'ren_proj':
+        n = op.get('n')
+        if not isinstance(n, str) or not n: return "'n' must be a project name"
+        return f"project '{n}' already exists" if n in data else None
+    s = op.get('s'); subs = data[p]
+    if not isinstance(s, str) or not s: return "'s' must be a subsystem name"
+    if k == 'add_sub':
+        if s in subs: return f"subsystem '{s}' already exists"
+        return None if isinstance(op.get('reqs') or [], list) else "'reqs' must be a list"
+    if s not in subs: return f"subsystem '{s}' not found"
+    if k == 'del_sub': return None
+    if k == 'ren_sub':
+        n = op.get('n')
+        if not isinstance(n, str) or not n: return "'n' must be a subsystem name"
+        return f"subsystem '{n}' already exists" if n in subs else None
+    size = reqcore.sub_count(subs, s) + (k == 'ins')  # ins puo' anche accodare
+    for key in ('i', 'j') if k == 'swap' else ('i',):
+        v = op.get(key)
+        if type(v) is not int or not 0 <= v < size: return f"'{key}' out of range"
+    if k in ('ins', 'set') and not isinstance(op.get('r'), (dict, reqcore.Requirement)): return "'r' must be an object"
+    return None
+
+class ReqServer:
+    """Stato condiviso: database caldo in memoria, indici, versione (+1 per ogni batch scritto) e iscritti agli eventi.
+    Le letture non aspettano nessuno; le scritture passano da un solo lock, cosi' il journal riceve i batch in ordine."""
+    def __init__(self, db_path):
+        self.store = reqcore.open_store(db_path)
+        self.data = self.store.load(); self.index = reqcore.DatabaseIndex(self.data)
+        self.version = 0; self.lock = asyncio.Lock(); self.subscribers = set()
+
+    # --- SCRITTURE ---
+    async def write(self, ops, base=None, client=""):
+        """Applica ops in modo atomico (se una fallisce le precedenti vengono annullate), le scrive sullo store
+        fuori dal loop e le notifica. base: versione su cui il client ha calcolato le posizioni, 409 se superata.
+        ops puo' essere una funzione che le calcola: viene chiamata sotto il lock, quindi le posizioni trovate
+        per ID non possono essere spostate da un'altra scrittura."""
+        async with self.lock:
+            if base is not None and base != self.version:
+                raise HttpError(409, f"version {base} is stale, server is at {self.version}")
+            if callable(ops): ops = ops()
+            done = []
+            try:
+                for k, op in enumerate(ops, 1):
+                    err = op_error(self.data, op)
+                    if err: raise HttpError(400, f"invalid op #{k}: {err}")
+                    # l'inversa si registra appena i dati sono cambiati: se poi fallisce l'indice, l'op va annullata comunque
+                    done.append(reqcore.apply_op(self.data, op)); self.index.apply(op, done[-1])
+            except HttpError:
+                self.rollback(ops, done); raise
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                self.rollback(ops, done); raise HttpError(400, f"invalid op #{k}: {e!r}")
+            if not ops: return self.version
+            try:
+                payload = self.store.encode(ops)
+                await asyncio.get_running_loop().run_in_executor(None, self.store.commit, [payload])
+            except Exception as e:
+                # non scritto: la memoria torna com'era, altrimenti i client divergerebbero dal server e dal disco
+                self.rollback(ops, done)
+                raise HttpError(500, f"write failed, nothing applied: {e}") from e
+            self.version += 1
+            self.publish({'version': self.version, 'client': client, 'ops': ops})
+            return self.version
+
+    def rollback(self, ops, done):
+        """Annulla sui dati le operazioni gia' applicate (done = le loro inverse) e scarta l'indice dei progetti
+        toccati, che si ricostruisce alla prossima richiesta: un indice aggiornato a meta' non torna indietro da solo."""
+        for inv in reversed(done): reqcore.apply_op(self.data, inv)
+        for op in ops[:len(done)]:
+            for p in (op['p'], op['n']) if op['op'] == 'ren_proj' else (op['p'],): self.index.projects.pop(p, None)
+
+    def publish(self, ev):
+        line = ("data: " + json.dumps(ev, ensure_ascii=False, default=reqcore.json_default) + "\n\n").encode('utf-8')
+        for q in self.subscribers: q.put_nowait(line)
+
+    async def save(self):
+        async with self.lock:
+            await asyncio.get_running_loop().run_in_executor(None, self.store.save_all, self.data)
+
+    # --- HELPER ---
+    def project(self, p):
+        if p not in self.data: raise HttpError(404, f"project '{p}' not found")
+        return self.data[p], self.index.project(p)
+
+    def locate(self, p, rid):
+        subs, pidx = self.project(p); r = pidx.get(rid)
+        if r is None: raise HttpError(404, f"requirement '{rid}' not found in '{p}'")
+        s = pidx.subsystem_of(r)
+        return s, reqcore.position_of(subs[s], r), r, pidx
+
+    # --- API ---
+    async def handle(self, method, parts, query, body):
+        get = lambda k, d=None: query.get(k, [d])[0]
+        route = (method, parts[0] if parts else "", len(parts))
+        if route == ("GET", "info", 1):
+            return {'version': self.version, 'projects': {p: {s: reqcore.sub_count(subs, s) for s in subs} for p, subs in self.data.items()}}
+        if route == ("GET", "db", 1): return {'version': self.version, 'data': self.data}
+        if route == ("GET", "projects", 3):
+            subs, _ = self.project(parts[1])
+            if parts[2] not in subs: raise HttpError(404, f"subsystem '{parts[2]}' not found")
+            return subs[parts[2]]
+        if route == ("GET", "query", 1):
+            try: res = reqcore.compile_query(get('q', '')).run(self.index)
+            except reqcore.QueryError as e: raise HttpError(400, str(e))
+            return [dict(r, project=p, subsystem=s) for p, s, r in res]
+        if route == ("GET", "trace", 3):
+            _, _, r, pidx = self.locate(parts[1], parts[2])
+            rows = list(enumerate(pidx.ancestors(r['id']), 1)) if get('up') else pidx.descendants(r['id'])
+            return [dict(x, subsystem=pidx.subsystem_of(x), depth=d) for d, x in rows]
+        if route in (("GET", "orphans", 2), ("GET", "leaves", 2)):
+            _, pidx = self.project(parts[1])
+            return [dict(r, subsystem=pidx.subsystem_of(r)) for r in (pidx.orphans() if parts[0] == "orphans" else pidx.leaves())]
+        if route == ("GET", "validate", 1): return reqcore.validate(self.data)
+        if route == ("GET", "stats", 1): return reqcore.stats(self.data)
+        if route == ("GET", "export", 2): return self.export(parts[1], get('format', 'csv'), get('columns'))
+        if route == ("POST", "ops", 1):
+            if not isinstance(body, dict) or not isinstance(body.get('ops'), list): raise HttpError(400, "expected {base, client, ops: [...]}")
+            return {'version': await self.write(body['ops'], body.get('base'), body.get('client', ''))}
+        if route == ("POST", "requirements", 3): return await self.create(parts[1], parts[2], body)
+        if route == ("PUT", "requirements", 3): return await self.update(parts[1], parts[2], body)
+        if route == ("DELETE", "requirements", 3): return {'version': await self.write(lambda: self.delete_ops(parts[1], parts[2]))}
+        if route == ("POST", "move", 3): return {'version': await self.write(lambda: self.move_ops(parts[1], parts[2], get('dir')))}
+        if route == ("POST", "rename", 1): return await self.rename(body or {})
+        if route == ("POST", "save", 1): await self.save(); return {'version': self.version}
+        raise HttpError(404 if method in ("GET", "POST", "PUT", "DELETE") else 405, f"no route for {method} /api/{'/'.join(parts)}")
+
+    # le *_ops calcolano le operazioni dallo stato corrente: si passano a write() come funzioni
+    async def create(self, p, s, body):
+        r = reqcore.new_req(**dict(body or {}, last_modified=timestamp()))
+        def ops():
+            subs, pidx = self.project(p)
+            if s not in subs: raise HttpError(404, f"subsystem '{s}' not found")
+            if not r['id']: r['id'] = pidx.next_req_id()
+            err = reqcore.req_id_error(r['id'], r['parent_id'], pidx.ids())
+            if err: raise HttpError(400, err)
+            return [{'op': 'ins', 'p': p, 's': s, 'i': len(subs[s]), 'r': r}]
+        return {'version': await self.write(ops), 'id': r['id']}
+
+    async def update(self, p, rid, body):
+        def ops():
+            s, i, r, pidx = self.locate(p, rid)
+            new = reqcore.Requirement(dict(r, **dict(body or {}, last_modified=timestamp())))
+            err = reqcore.req_id_error(new['id'], new.get('parent_id', ''), pidx.ids(), rid)
+            if err: raise HttpError(400, err)
+            # con un cambio di ID i figli di rid passano a new['id']: il nuovo parent non puo' stare sotto nessuno dei due
+            if any(reqcore.creates_cycle(pidx.get, x, new.get('parent_id', '')) for x in {rid, new['id']}): raise HttpError(400, "Circular dependency.")
+            out = reqcore.reparent_ops(self.data, pidx, p, rid, new['id']) if new['id'] != rid else []
+            return out + [{'op': 'set', 'p': p, 's': s, 'i': i, 'r': new}]
+        return {'version': await self.write(ops)}
+
+    def delete_ops(self, p, rid):
+        s, i, r, pidx = self.locate(p, rid)
+        return reqcore.reparent_ops(self.data, pidx, p, rid, "") + [{'op': 'del', 'p': p, 's': s, 'i': i}]
+
+    def move_ops(self, p, rid, direction):
+        s, i, _, _ = self.locate(p, rid); j = i - 1 if direction == "up" else i + 1
+        return [{'op': 'swap', 'p': p, 's': s, 'i': i, 'j': j}] if 0 <= j < len(self.data[p][s]) else []
+
+    async def rename(self, body):
+        p, s, n = body.get('project'), body.get('subsystem'), (body.get('name') or "").strip()
+        if not n: raise HttpError(400, "name is mandatory")
+        def ops():
+            subs, _ = self.project(p)
+            if s:
+                if s not in subs: raise HttpError(404, f"subsystem '{s}' not found")
+                if n in subs: raise HttpError(400, "Name already exists.")
+                return [{'op': 'ren_sub', 'p': p, 's': s, 'n': n}]
+            if n in self.data: raise HttpError(400, "Project name already exists.")
+            return [{'op': 'ren_proj', 'p': p, 'n': n}]
+        return {'version': await self.write(ops)}
+
+    def export(self, p, fmt, columns):
+        subs, _ = self.project(p)
+        if fmt == "html":
+            parts = [reqcore.REPORT_CSS, reqcore.report_header_html(p, timestamp())]
+            parts += [frag for _, _, frag in reqcore.ReportCache().sections(p, subs)]
+            return ("text/html; charset=utf-8", "".join(parts))
+        cols = columns.split(",") if columns else None
+        buf = io.StringIO(); w = csv.writer(buf)
+        w.writerow([h for h, _ in reqcore.CSV_COLUMNS if h in set(cols or reqcore.CSV_DEFAULT)])
+        w.writerows(reqcore.iter_csv_rows(subs, cols))
+        return ("text/csv; charset=utf-8", buf.getvalue())
+
+    # --- HTTP ---
+    async def serve_client(self, reader, writer):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            lines = head.decode('latin-1').split("\r\n")
+            method, target, _ = lines[0].split(" ", 2)
+            headers = {k.strip().lower(): v.strip() for k, _, v in (l.partition(":") for l in lines[1:] if l)}
+            n = int(headers.get('content-length', 0))
+            if n > MAX_BODY: raise HttpError(400, "request body too large")
+            raw = await reader.readexactly(n) if n else b""
+            url = urlsplit(target)
+            parts = [unquote(x) for x in url.path.split("/") if x]
+            if parts[:1] != ["api"]: raise HttpError(404, "not found")
+            parts = parts[1:]
+            if method == "GET" and parts == ["events"]: await self.stream(writer); return
+            try: body = json.loads(raw) if raw else None
+            except ValueError: raise HttpError(400, "body is not valid JSON")
+            res = await self.handle(method, parts, parse_qs(url.query), body)
+            if isinstance(res, tuple): ctype, text = res
+            else: ctype, text = "application/json", json.dumps(res, ensure_ascii=False, default=reqcore.json_default)
+            await self.respond(writer, 200, ctype, text.encode('utf-8'))
+        except HttpError as e:
+            await self.respond(writer, e.status, "application/json", json.dumps({'error': str(e)}).encode('utf-8'))
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass  # client che ha chiuso a meta' richiesta
+        except ValueError as e:  # request line o header malformati
+            await self.respond(writer, 400, "application/json", json.dumps({'error': str(e)}).encode('utf-8'))
+        except Exception as e:
+            await self.respond(writer, 500, "application/json", json.dumps({'error': repr(e)}).encode('utf-8'))
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, ctype, payload):
+        writer.write(f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\nContent-Type: {ctype}\r\n"
+                     f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode('latin-1') + payload)
+        try: await writer.drain()
+        except ConnectionError: pass
+
+    async def stream(self, writer):
+        """Server-sent events: un 'hello' con la versione corrente, poi una riga per batch scritto."""
+        q = asyncio.Queue(); self.subscribers.add(q)
+        try:
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\nConnection: close\r\n\r\n")
+            writer.write(f"data: {json.dumps({'hello': True, 'version': self.version})}\n\n".encode('utf-8'))
+            await writer.drain()
+            while True:
+                try: line = await asyncio.wait_for(q.get(), 15)
+                except asyncio.TimeoutError: line = b": keep-alive\n\n"
+                writer.write(line); await writer.drain()
+        except ConnectionError: pass
+        finally: self.subscribers.discard(q)
+
+async def serve(db_path, host, port):
+    srv = ReqServer(db_path)
+    server = await asyncio.start_server(srv.serve_client, host, port)
+    print(f"serving {db_path} on http://{host}:{port}", file=sys.stderr)
+    try:
+        async with server: await server.serve_forever()
+    finally:
+        srv.store.close()
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="reqserver", description="SatReq Manager server")
+    ap.add_argument("db", help="database (.json, .sqlite or <dir>/manifest.json)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    args = ap.parse_args(argv)
+    try: asyncio.run(serve(args.db, args.host, args.port))
+    except KeyboardInterrupt: pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,43 @@
+"""Export CSV a blocchi: contenuto, record senza ID e annullamento senza toccare il file di destinazione."""
+import os
+import sys
+import csv
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import reqcore
+
+SUBS = {"EPS": [reqcore.Requirement(id="REQ-001", desc="<p>Battery <b>capacity</b></p>", status="Draft", needs_review=True),
+                reqcore.Requirement(desc="no id")],
+        "COM": [reqcore.Requirement(id=f"REQ-{k:03d}", parent_id="REQ-001") for k in range(2, 12)]}
+
+class CsvExportTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory(); self.path = os.path.join(self.tmp.name, "out.csv")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def read(self):
+        with open(self.path, newline='', encoding='utf-8-sig') as f: return list(csv.reader(f))
+
+    def test_rows_and_columns(self):
+        seen = []
+        n = reqcore.write_csv(self.path, SUBS, ["ID", "Subsystem", "Desc", "Needs Review"], progress=lambda d, t: seen.append((d, t)), chunk=4)
+        rows = self.read()
+        self.assertEqual(n, 12); self.assertEqual(len(rows), 13)
+        self.assertEqual(rows[0], ["ID", "Subsystem", "Desc", "Needs Review"])
+        self.assertEqual(rows[1], ["REQ-001", "EPS", "Battery capacity", "YES"])
+        self.assertEqual(rows[2], ["", "EPS", "no id", "NO"])
+        self.assertEqual(seen[-1], (12, 12))
+
+    def test_cancel_keeps_previous_file(self):
+        with open(self.path, 'w', encoding='utf-8') as f: f.write("old")
+        with self.assertRaises(reqcore.ExportCancelled):
+            reqcore.write_csv(self.path, SUBS, cancelled=lambda: True, chunk=4)
+        with open(self.path, encoding='utf-8') as f: self.assertEqual(f.read(), "old")
+        self.assertEqual(os.listdir(self.tmp.name), ["out.csv"])
+
+if __name__ == '__main__':
+    unittest.main()
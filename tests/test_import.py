@@ -0,0 +1,44 @@
+"""Import in blocco: validazione di tutte le righe in un passo, cicli e parent rifiutati, operazioni da applicare."""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import reqcore
+
+def rows(*specs):
+    return [(k + 2, dict(spec)) for k, spec in enumerate(specs)]
+
+class PlanImportTest(unittest.TestCase):
+    def setUp(self):
+        self.data = reqcore.as_reqs({"P": {"EPS": [{"id": "REQ-001"}, {"desc": "no id"}]}})
+
+    def plan(self, *specs):
+        return reqcore.plan_import(self.data, "P", rows(*specs), "EPS", "2024-01-01 00:00:00")
+
+    def test_valid_rows(self):
+        ops, errors = self.plan({"id": "REQ-002", "parent_id": "REQ-001"}, {"id": "REQ-003", "parent_id": "REQ-002", "subsystem": "COM"})
+        self.assertEqual(errors, [])
+        self.assertEqual([(op['op'], op['s']) for op in ops], [('ins', 'EPS'), ('add_sub', 'COM')])
+        self.assertEqual(ops[0]['i'], 2); self.assertEqual(ops[0]['r']['last_modified'], "2024-01-01 00:00:00")
+        for op in ops: reqcore.apply_op(self.data, op)
+        self.assertEqual([r.get('id') for r in self.data["P"]["EPS"]], ["REQ-001", None, "REQ-002"])
+        self.assertEqual([i['kind'] for i in reqcore.validate(self.data)], ['missing_id'])
+
+    def test_cycles_are_rejected(self):
+        ops, errors = self.plan({"id": "A", "parent_id": "B"}, {"id": "B", "parent_id": "C"}, {"id": "C", "parent_id": "A"},
+                                {"id": "D", "parent_id": "C"}, {"id": "E", "parent_id": "E"}, {"id": "F", "parent_id": "REQ-001"})
+        self.assertEqual([op['r']['id'] for op in ops], ["F"])
+        self.assertEqual({rid: msg for _, rid, msg in errors},
+                         {"A": "Circular dependency", "B": "Circular dependency", "C": "Circular dependency",
+                          "D": "Parent 'C' was rejected", "E": "Circular dependency"})
+
+    def test_row_errors(self):
+        ops, errors = self.plan({"desc": "x"}, {"id": "A B"}, {"id": "X"}, {"id": "X"}, {"id": "REQ-001"}, {"id": "G", "parent_id": "NOPE"})
+        self.assertEqual(ops, [])
+        self.assertEqual([(line, msg) for line, _, msg in errors],
+                         [(2, "Missing ID"), (3, "ID contains spaces"), (4, "Duplicate ID in file (2 rows)"),
+                          (5, "Duplicate ID in file (2 rows)"), (6, "ID already exists in project"), (7, "Parent 'NOPE' does not exist")])
+
+if __name__ == '__main__':
+    unittest.main()
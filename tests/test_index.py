@@ -0,0 +1,45 @@
+"""Indice di progetto: record senza ID, figli e posizione dei record per identita'."""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import reqcore
+
+def req(**fields): return reqcore.Requirement(fields)
+
+class ProjectIndexTest(unittest.TestCase):
+    def test_record_without_id(self):
+        noid = req(desc="x", parent_id="REQ-001")
+        idx = reqcore.ProjectIndex({"EPS": [req(id="REQ-001"), noid, req(id="REQ-007")]})
+        self.assertEqual(idx.next_req_id(), "REQ-008")
+        self.assertIs(idx.get(""), noid)
+        self.assertIn(noid, idx.children_of("REQ-001"))
+        self.assertEqual([r for _, r in idx.descendants("REQ-001")], [noid])
+        self.assertIn(noid, idx.leaves())
+        idx.remove(noid)
+        self.assertIsNone(idx.get("")); self.assertEqual(idx.children_of("REQ-001"), [])
+
+    def test_incremental_updates(self):
+        data = {"P": {"EPS": [req(id="REQ-001"), req(id="REQ-002", parent_id="REQ-001")]}}
+        dbi = reqcore.DatabaseIndex(data); idx = dbi.project("P")
+        op = {'op': 'ins', 'p': 'P', 's': 'EPS', 'i': 2, 'r': req(id="REQ-003", parent_id="REQ-002")}
+        dbi.apply(op, reqcore.apply_op(data, op))
+        self.assertEqual([r['id'] for _, r in idx.descendants("REQ-001")], ["REQ-002", "REQ-003"])
+        self.assertEqual([r['id'] for r in idx.ancestors("REQ-003")], ["REQ-002", "REQ-001"])
+        op = {'op': 'del', 'p': 'P', 's': 'EPS', 'i': 1}
+        dbi.apply(op, reqcore.apply_op(data, op))
+        self.assertEqual(idx.children_of("REQ-001"), []); self.assertIsNone(idx.get("REQ-002"))
+
+    def test_parent_ref_op_picks_the_same_record(self):
+        # due record identici: l'operazione deve puntare al figlio vero, non al primo uguale
+        twin = req(id="REQ-002", parent_id="REQ-001"); child = req(id="REQ-002", parent_id="REQ-001")
+        data = {"P": {"EPS": [req(id="REQ-001")], "COM": [twin, child]}}
+        idx = reqcore.ProjectIndex(data["P"])
+        self.assertEqual(reqcore.parent_ref_op(data, idx, "P", child, "")['i'], 1)
+        ops = reqcore.reparent_ops(data, idx, "P", "REQ-001", "")
+        self.assertEqual(sorted(op['i'] for op in ops), [0, 1])
+        self.assertTrue(all(op['r']['parent_id'] == "" and op['r']['needs_review'] for op in ops))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""Database JSON con journal: round-trip delle operazioni, crash recovery e compattazione."""
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import reqcore
+
+DATA = {"P1": {"EPS": [{"id": "REQ-001", "desc": "a"}, {"id": "REQ-002", "parent_id": "REQ-001"}], "COM": []}}
+OPS = [{'op': 'ins', 'p': 'P1', 's': 'COM', 'i': 0, 'r': {"id": "REQ-003", "status": "Draft"}},
+       {'op': 'set', 'p': 'P1', 's': 'EPS', 'i': 0, 'r': {"id": "REQ-001", "desc": "b"}},
+       {'op': 'swap', 'p': 'P1', 's': 'EPS', 'i': 0, 'j': 1},
+       {'op': 'ren_sub', 'p': 'P1', 's': 'COM', 'n': 'COMMS'}]
+EXPECTED = {"P1": {"EPS": [{"id": "REQ-002", "parent_id": "REQ-001"}, {"id": "REQ-001", "desc": "b"}],
+                   "COMMS": [{"id": "REQ-003", "status": "Draft"}]}}
+
+def plain(data):
+    return json.loads(json.dumps(data, default=reqcore.json_default))
+
+class JsonStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory(); self.db = os.path.join(self.tmp.name, "db.json")
+        with open(self.db, 'w', encoding='utf-8') as f: json.dump(DATA, f)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def edit(self):
+        store = reqcore.JsonStore(self.db); data = store.load()
+        for op in OPS: reqcore.apply_op(data, op)
+        store.commit([store.encode(OPS)])
+        return store, data
+
+    def reload(self):
+        store = reqcore.JsonStore(self.db)
+        try: return plain(store.load(readonly=True))
+        finally: store.close()
+
+    def test_journal_replayed_on_load(self):
+        store, data = self.edit()
+        self.assertEqual(plain(data), EXPECTED)
+        with open(self.db, encoding='utf-8') as f: self.assertEqual(json.load(f), DATA)  # file principale intatto
+        self.assertEqual(self.reload(), EXPECTED)
+
+    def test_truncated_last_line_is_ignored(self):
+        store, _ = self.edit()
+        with open(store.path, 'a', encoding='utf-8') as f: f.write('{"op": "del", "p": "P1"')
+        self.assertEqual(self.reload(), EXPECTED)
+
+    def test_compaction_and_save_all(self):
+        store, data = self.edit()
+        store.compact_async(); store.wait()
+        self.assertFalse(store.pending())
+        with open(self.db, encoding='utf-8') as f: self.assertEqual(json.load(f), EXPECTED)
+        op = {'op': 'del', 'p': 'P1', 's': 'COMMS', 'i': 0}
+        reqcore.apply_op(data, op); store.commit([store.encode([op])])  # journal nuovo dopo la compattazione
+        store.save_all(data); store.close()
+        self.assertFalse(store.pending())
+        self.assertEqual(self.reload(), {"P1": {"EPS": EXPECTED["P1"]["EPS"], "COMMS": []}})
+
+if __name__ == '__main__':
+    unittest.main()
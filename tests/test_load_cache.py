@@ -0,0 +1,73 @@
+"""Cache binaria di avvio: round-trip senza perdite, invalidazione quando cambia il JSON e nessun codice
+eseguito da un file di cache costruito ad arte."""
+import os
+import sys
+import json
+import pickle
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import reqcore
+
+DATA = {"P1": {"EPS": [{"id": "REQ-001", "desc": "<p>a</p>", "needs_review": True, "custom": {"k": [1, 2.5, None]}},
+                       {"desc": "no id"}], "COM": []},
+        "P2": {"ADCS": [{"id": "REQ-010", "status": "Draft", "value": 3}]}}
+
+class Payload:
+    """Oggetto che, se un pickle venisse caricato, creerebbe una cartella."""
+    def __init__(self, path): self.path = path
+    def __reduce__(self): return (os.makedirs, (self.path,))
+
+class LoadCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory(); self.db = os.path.join(self.tmp.name, "db.json")
+        with open(self.db, 'w', encoding='utf-8') as f: json.dump(DATA, f)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def load(self, readonly=False):
+        store = reqcore.JsonStore(self.db); data = store.load(readonly)
+        plain = json.loads(json.dumps(data, default=reqcore.json_default))
+        return store.loaded_from, plain, data
+
+    def test_round_trip(self):
+        self.assertEqual(self.load()[0], "json")
+        src, plain, data = self.load()
+        self.assertEqual((src, plain), ("cache", DATA))
+        self.assertNotIn('type', data["P1"]["EPS"][1])  # un campo assente resta assente
+        self.assertEqual(reqcore.LoadCache(self.db).skeleton(), {"P1": [["EPS", 2], ["COM", 0]], "P2": [["ADCS", 1]]})
+
+    def test_readonly_does_not_write(self):
+        self.assertEqual(self.load(readonly=True)[0], "json")
+        self.assertFalse(os.path.exists(self.db + ".cache"))
+
+    def test_stale_cache_is_ignored(self):
+        self.load()
+        changed = dict(DATA, P3={})
+        with open(self.db, 'w', encoding='utf-8') as f: json.dump(changed, f)
+        self.assertIsNone(reqcore.LoadCache(self.db).skeleton())
+        self.assertEqual(self.load()[:2], ("json", changed))
+
+    def test_journal_on_top_of_cache(self):
+        self.load()
+        store = reqcore.JsonStore(self.db)
+        store.commit([store.encode([{'op': 'del_sub', 'p': 'P1', 's': 'COM'}])])
+        src, plain, _ = self.load(readonly=True)
+        self.assertEqual(src, "cache"); self.assertEqual(list(plain["P1"]), ["EPS"])
+
+    def test_crafted_cache_runs_no_code(self):
+        self.load()
+        cache = reqcore.LoadCache(self.db); marker = os.path.join(self.tmp.name, "pwned")
+        with open(cache.path, 'rb') as f:
+            f.read(len(cache.MAGIC)); head = f.readline()  # intestazione valida: firma giusta del JSON
+        for magic in (cache.MAGIC, b"SATREQ-CACHE\n"):
+            with open(cache.path, 'wb') as f: f.write(magic + head + pickle.dumps(Payload(marker)))
+            self.assertEqual(self.load(readonly=True)[:2], ("json", DATA))
+            self.assertFalse(os.path.exists(marker))
+        with open(cache.path, 'wb') as f: f.write(cache.MAGIC + pickle.dumps({'format': cache.FORMAT}) + b"\n")
+        self.assertIsNone(cache.skeleton()); self.assertFalse(os.path.exists(marker))
+
+if __name__ == '__main__':
+    unittest.main()
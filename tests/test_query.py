@@ -0,0 +1,52 @@
+"""Motore di query: parsing, errori e stessi risultati con e senza indici secondari."""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import reqcore
+
+def req(**fields): return reqcore.new_req(**fields)
+
+DATA = {"SAT": {"EPS": [req(id="REQ-001", type="Performance", status="TBD (To Be Defined)", desc="<p>Battery capacity</p>"),
+                        req(id="REQ-002", parent_id="REQ-001", status="Verified", needs_review=True, value="28", unit="V")],
+                "COMMS": [req(id="REQ-003", parent_id="REQ-001", type="Interface", desc="Downlink rate")]},
+        "GND": {"Station": [req(id="REQ-001", status="TBD (To Be Defined)", method="Test")]}}
+
+def ids(res): return sorted((p, s, r['id']) for p, s, r in res)
+
+class QueryTest(unittest.TestCase):
+    def test_fields(self):
+        q = lambda text: ids(reqcore.query(DATA, text))
+        self.assertEqual(q("status:tbd type:perf"), [("SAT", "EPS", "REQ-001")])
+        self.assertEqual(q("parent:REQ-001"), [("SAT", "COMMS", "REQ-003"), ("SAT", "EPS", "REQ-002")])
+        self.assertEqual(q("status:tbd -project:SAT"), [("GND", "Station", "REQ-001")])
+        self.assertEqual(q("review:yes"), [("SAT", "EPS", "REQ-002")])
+        self.assertEqual(q("id:req-00?"), q("id:REQ*"))
+        self.assertEqual(q('desc:"battery cap"'), [("SAT", "EPS", "REQ-001")])
+        self.assertEqual(q("downlink sub:comms"), [("SAT", "COMMS", "REQ-003")])
+        self.assertEqual(q("unit:v target:28"), [("SAT", "EPS", "REQ-002")])
+        self.assertEqual(len(q("")), 4)
+
+    def test_errors(self):
+        for text in ("color:red", "review:maybe", 'desc:"open'):
+            with self.assertRaises(reqcore.QueryError): reqcore.compile_query(text)
+        self.assertTrue(reqcore.is_structured_query("-status:Draft")); self.assertFalse(reqcore.is_structured_query("battery"))
+
+    def test_indexed_and_scan_agree(self):
+        index = reqcore.DatabaseIndex(DATA)
+        for text in ("status:tbd", "method:test -status:verified", "parent:REQ-001 review:no", "type:perf status:verified"):
+            q = reqcore.compile_query(text)
+            scan = [(p, s, r) for p, subs in DATA.items() for s, reqs in subs.items() for r in reqs if q.match(p, s, r)]
+            self.assertEqual(ids(q.run(index)), ids(scan), text)
+
+    def test_index_follows_edits(self):
+        data = {"SAT": {"EPS": [req(id="REQ-001")]}}; index = reqcore.DatabaseIndex(data)
+        self.assertEqual(ids(reqcore.query(data, "status:verified", index)), [])
+        op = {'op': 'set', 'p': 'SAT', 's': 'EPS', 'i': 0, 'r': req(id="REQ-001", status="Verified")}
+        index.apply(op, reqcore.apply_op(data, op))
+        self.assertEqual(ids(reqcore.query(data, "status:verified", index)), [("SAT", "EPS", "REQ-001")])
+        self.assertEqual(ids(reqcore.query(data, "status:draft", index)), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+"""Report HTML/PDF: frammenti per sottosistema, escape del testo, record senza ID e cache dei frammenti."""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import reqcore
+
+def subs():
+    return {"EPS": [reqcore.Requirement(id="REQ-001", desc="<p>V &lt; 28</p>", status="TBD (To Be Defined)"),
+                    reqcore.Requirement(desc="no id")],
+            "COM": [reqcore.Requirement(id="REQ-<2>")], "TCS": []}
+
+class ReportTest(unittest.TestCase):
+    def test_sections(self):
+        out = reqcore.ReportCache().sections("P", subs())
+        self.assertEqual([(s, n) for s, n, _ in out], [("COM", 1), ("EPS", 2)])  # ordinati, vuoti saltati
+        com, eps = out[0][2], out[1][2]
+        self.assertIn("REQ-&lt;2&gt;", com)
+        self.assertIn("V &lt; 28", eps); self.assertIn("<td><b></b></td>", eps)
+
+    def test_cache_reuses_unchanged_sections(self):
+        cache = reqcore.ReportCache(); data = subs()
+        first = dict((s, frag) for s, _, frag in cache.sections("P", data))
+        data["EPS"][0]['status'] = "Verified"
+        second = dict((s, frag) for s, _, frag in cache.sections("P", data))
+        self.assertIs(second["COM"], first["COM"])
+        self.assertNotEqual(second["EPS"], first["EPS"]); self.assertIn("Verified", second["EPS"])
+
+    def test_cancel(self):
+        with self.assertRaises(reqcore.ExportCancelled): reqcore.ReportCache().sections("P", subs(), lambda: True)
+
+if __name__ == '__main__':
+    unittest.main()
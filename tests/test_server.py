@@ -0,0 +1,91 @@
+"""Server: scritture atomiche (memoria, indice e journal restano d'accordo anche quando qualcosa fallisce)
+e controlli sulle operazioni dei client."""
+import os
+import sys
+import json
+import asyncio
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import reqcore
+import reqserver
+
+DATA = {"P1": {"EPS": [{"id": "REQ-001"}, {"id": "REQ-002", "parent_id": "REQ-001"}, {"id": "REQ-003", "parent_id": "REQ-002"}],
+               "COM": [{"id": "REQ-004"}]},
+        "P2": {"ADCS": []}}
+
+def state(data):
+    return json.dumps(data, default=reqcore.json_default)
+
+class ServerWriteTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory(); self.db = os.path.join(self.tmp.name, "db.json")
+        with open(self.db, 'w', encoding='utf-8') as f: json.dump(DATA, f)
+        self.srv = reqserver.ReqServer(self.db)
+        self.srv.index.project("P1")  # indice gia' costruito, come dopo la prima query
+
+    def tearDown(self):
+        self.srv.store.close(); self.tmp.cleanup()
+
+    def call(self, coro):
+        return asyncio.run(coro)
+
+    def post(self, ops):
+        return self.call(self.srv.handle("POST", ["ops"], {}, {'ops': ops}))
+
+    def assert_rejected(self, status, ops):
+        before = state(self.srv.data)
+        with self.assertRaises(reqserver.HttpError) as cm: self.post(ops)
+        self.assertEqual(cm.exception.status, status)
+        self.assertEqual(state(self.srv.data), before)
+        self.assertEqual(self.srv.version, 0); self.assertFalse(self.srv.store.pending())
+        pidx = self.srv.index.project("P1")
+        self.assertEqual(sorted(pidx.ids()), ["REQ-001", "REQ-002", "REQ-003", "REQ-004"])
+        self.assertEqual([r['id'] for r in pidx.children_of("REQ-001")], ["REQ-002"])
+        return cm.exception
+
+    def test_write_is_journaled(self):
+        self.assertEqual(self.post([{'op': 'ins', 'p': 'P1', 's': 'COM', 'i': 0, 'r': {"desc": "x"}}])['version'], 1)
+        self.assertEqual(reqcore.JsonStore.read_ops(self.srv.store.path)[0]['r'], {"desc": "x"})
+
+    def test_commit_failure_rolls_back(self):
+        def fail(payloads): raise OSError("disk full")
+        self.srv.store.commit = fail
+        err = self.assert_rejected(500, [{'op': 'swap', 'p': 'P1', 's': 'EPS', 'i': 0, 'j': 1},
+                                         {'op': 'del', 'p': 'P1', 's': 'EPS', 'i': 0}])
+        self.assertIn("disk full", str(err))
+
+    def test_index_failure_rolls_back(self):
+        apply = self.srv.index.apply; calls = []
+        def flaky(op, inv):
+            calls.append(op)
+            if len(calls) == 2: raise KeyError('id')
+            apply(op, inv)
+        self.srv.index.apply = flaky
+        self.assert_rejected(400, [{'op': 'del', 'p': 'P1', 's': 'COM', 'i': 0},
+                                   {'op': 'ins', 'p': 'P1', 's': 'EPS', 'i': 0, 'r': {"id": "REQ-009"}}])
+
+    def test_invalid_ops(self):
+        for op in ({'op': 'ren_sub', 'p': 'P1', 's': 'COM', 'n': 'EPS'}, {'op': 'ren_proj', 'p': 'P1', 'n': 'P2'},
+                   {'op': 'add_sub', 'p': 'P1', 's': 'EPS'}, {'op': 'add_proj', 'p': 'P2'},
+                   {'op': 'del', 'p': 'P1', 's': 'EPS', 'i': -1}, {'op': 'ins', 'p': 'P1', 's': 'EPS', 'i': 4, 'r': {}},
+                   {'op': 'swap', 'p': 'P1', 's': 'EPS', 'i': 0, 'j': 3}, {'op': 'set', 'p': 'P1', 's': 'EPS', 'i': 0, 'r': "x"},
+                   {'op': 'del', 'p': 'P1', 's': 'NOPE', 'i': 0}, {'op': 'drop', 'p': 'P1'}, "del"):
+            with self.subTest(op=op):
+                self.assert_rejected(400, [{'op': 'ins', 'p': 'P1', 's': 'COM', 'i': 1, 'r': {"id": "REQ-005"}}, op])
+        # le posizioni si controllano sullo stato dopo le operazioni precedenti del batch
+        self.assertEqual(self.post([{'op': 'ins', 'p': 'P1', 's': 'COM', 'i': 1, 'r': {"id": "REQ-005"}},
+                                    {'op': 'swap', 'p': 'P1', 's': 'COM', 'i': 0, 'j': 1}])['version'], 1)
+
+    def test_update_rejects_cycle_through_old_id(self):
+        # REQ-001 diventa REQ-010 con parent REQ-003: REQ-002 passerebbe sotto REQ-010, chiudendo l'anello
+        body = {"id": "REQ-010", "parent_id": "REQ-003"}
+        with self.assertRaises(reqserver.HttpError) as cm: self.call(self.srv.update("P1", "REQ-001", body))
+        self.assertEqual(cm.exception.status, 400)
+        self.call(self.srv.update("P1", "REQ-001", {"id": "REQ-010"}))
+        self.assertEqual(self.srv.index.project("P1").get("REQ-002")['parent_id'], "REQ-010")
+        self.assertEqual(reqcore.validate(self.srv.data), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""Database a shard: manifest letto da solo, sottosistemi caricati al primo accesso, journal e compattazione."""
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import reqcore
+
+DATA = {"P1": {"EPS": [{"id": "REQ-001"}, {"id": "REQ-002", "parent_id": "REQ-001"}], "COM": [{"id": "REQ-003"}]},
+        "P2": {"ADCS": [{"id": "REQ-010"}]}}
+
+def plain(data):
+    return json.loads(json.dumps(data, default=reqcore.json_default))
+
+class ShardedStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        src = os.path.join(self.tmp.name, "src.json")
+        with open(src, 'w', encoding='utf-8') as f: json.dump(DATA, f)
+        self.db = os.path.join(self.tmp.name, "db", reqcore.ShardedStore.MANIFEST)
+        reqcore.convert_store(src, self.db)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def shards(self):
+        with open(self.db, encoding='utf-8') as f: m = json.load(f)
+        return {(p['name'], e['name']): e['file'] for p in m['projects'] for e in p['subsystems']}
+
+    def test_lazy_load(self):
+        store = reqcore.open_store(self.db); data = store.load(); store.close()
+        self.assertEqual(list(data), ["P1", "P2"]); self.assertEqual(data["P1"].loaded, {})
+        self.assertEqual(reqcore.sub_count(data["P1"], "EPS"), 2)
+        self.assertEqual(plain(data["P1"]["COM"]), DATA["P1"]["COM"]); self.assertEqual(list(data["P1"].loaded), ["COM"])
+        self.assertEqual(plain(data), DATA)
+
+    def test_journal_and_compaction(self):
+        before = self.shards()
+        store = reqcore.open_store(self.db); data = store.load()
+        ops = [{'op': 'set', 'p': 'P1', 's': 'COM', 'i': 0, 'r': {"id": "REQ-003", "status": "Verified"}},
+               {'op': 'ren_proj', 'p': 'P2', 'n': 'P3'}]
+        for op in ops: reqcore.apply_op(data, op)
+        store.commit([store.encode(ops)])
+        expected = {"P1": {"EPS": DATA["P1"]["EPS"], "COM": [{"id": "REQ-003", "status": "Verified"}]}, "P3": DATA["P2"]}
+        reader = reqcore.open_store(self.db)
+        self.assertEqual(plain(reader.load(readonly=True)), expected); reader.close()
+        store.compact_async(); store.wait(); store.close()
+        self.assertFalse(store.pending())
+        after = self.shards()
+        # riscritto solo lo shard toccato; quelli non toccati restano gli stessi file, anche col progetto rinominato
+        self.assertNotEqual(after[("P1", "COM")], before[("P1", "COM")])
+        self.assertEqual(after[("P1", "EPS")], before[("P1", "EPS")]); self.assertEqual(after[("P3", "ADCS")], before[("P2", "ADCS")])
+        self.assertEqual(sorted("shards/" + n for n in os.listdir(os.path.join(os.path.dirname(self.db), "shards"))), sorted(after.values()))
+        reader = reqcore.open_store(self.db)
+        self.assertEqual(plain(reader.load()), expected); reader.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+"""Undo di Delete Project su un database a shard dopo un salvataggio (gli shard del progetto vengono cancellati)."""
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import reqcore
+
+DATA = {"P1": {"EPS": [{"id": "R-1", "desc": "a"}, {"id": "R-2", "parent_id": "R-1"}], "COM": [{"id": "R-3"}]},
+        "P2": {"ADCS": [{"id": "R-4"}]}}
+
+class ShardedDeleteProjectUndo(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        src = os.path.join(self.tmp.name, "src.json")
+        with open(src, 'w', encoding='utf-8') as f: json.dump(DATA, f)
+        self.db = os.path.join(self.tmp.name, "db", reqcore.ShardedStore.MANIFEST)
+        reqcore.convert_store(src, self.db)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def plain(self, data):
+        return {p: {s: [r.to_dict() for r in subs[s]] for s in subs} for p, subs in data.items()}
+
+    def test_delete_save_undo(self):
+        store = reqcore.open_store(self.db); data = store.load()
+        inv = reqcore.apply_op(data, {'op': 'del_proj', 'p': 'P1'})
+        store.save_all(data)  # gli shard di P1 non sono piu' nel manifest: vengono cancellati
+        reqcore.apply_op(data, inv)
+        store.commit([store.encode([inv])]); store.close()
+        self.assertEqual(self.plain(data)["P1"], DATA["P1"])
+        store = reqcore.open_store(self.db)
+        try: self.assertEqual(self.plain(store.load()), {"P2": DATA["P2"], "P1": DATA["P1"]})
+        finally: store.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""Backend SQLite: caricamento lazy per sottosistema e stesso risultato delle operazioni in memoria e su disco."""
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import reqcore
+
+DATA = {"P1": {"EPS": [{"id": "REQ-001", "desc": "a", "status": "Draft"}, {"id": "REQ-002", "parent_id": "REQ-001"}],
+               "COM": [{"id": "REQ-003", "extra": [1, 2]}], "TCS": []},
+        "P2": {"ADCS": [{"id": "REQ-010"}]}}
+OPS = [{'op': 'ins', 'p': 'P1', 's': 'EPS', 'i': 1, 'r': {"id": "REQ-004"}},
+       {'op': 'set', 'p': 'P1', 's': 'EPS', 'i': 0, 'r': {"id": "REQ-001", "desc": "b", "status": "Verified"}},
+       {'op': 'swap', 'p': 'P1', 's': 'EPS', 'i': 0, 'j': 2},
+       {'op': 'del', 'p': 'P1', 's': 'EPS', 'i': 1},
+       {'op': 'ren_sub', 'p': 'P1', 's': 'COM', 'n': 'COMMS'},
+       {'op': 'del_sub', 'p': 'P1', 's': 'TCS'},
+       {'op': 'add_sub', 'p': 'P1', 's': 'OBDH', 'reqs': [{"id": "REQ-005"}]},
+       {'op': 'ren_proj', 'p': 'P2', 'n': 'P3'},
+       {'op': 'add_proj', 'p': 'P4', 'subs': {"EPS": [{"id": "REQ-020"}]}}]
+
+def plain(data):
+    return json.loads(json.dumps(data, default=reqcore.json_default))
+
+def order(data):
+    return [(p, list(subs)) for p, subs in data.items()]
+
+class SqliteStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        src = os.path.join(self.tmp.name, "src.json")
+        with open(src, 'w', encoding='utf-8') as f: json.dump(DATA, f)
+        self.db = os.path.join(self.tmp.name, "db.sqlite")
+        reqcore.convert_store(src, self.db)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def open(self):
+        store = reqcore.open_store(self.db); self.addCleanup(store.close)
+        return store
+
+    def test_lazy_load(self):
+        data = self.open().load()
+        self.assertIsInstance(data["P1"], reqcore.SqliteProject)
+        self.assertEqual(reqcore.sub_count(data["P1"], "EPS"), 2); self.assertEqual(data["P1"].loaded, {})
+        self.assertEqual(plain(data["P1"]["COM"]), DATA["P1"]["COM"])
+        self.assertEqual(list(data["P1"].loaded), ["COM"])
+        self.assertEqual(plain(self.open().load(readonly=True)), DATA)
+
+    def test_ops_match_memory(self):
+        store = self.open(); data = store.load(); mem = reqcore.as_reqs(json.loads(json.dumps(DATA)))
+        for op in OPS:
+            reqcore.apply_op(mem, json.loads(json.dumps(op))); reqcore.apply_op(data, op)
+        store.commit([store.encode(OPS)])
+        for back in (self.open().load(readonly=True), self.open().load()):
+            self.assertEqual(plain(back), plain(mem)); self.assertEqual(order(back), order(mem))
+        self.assertEqual(plain(data), plain(mem))
+
+    def test_save_all_reads_unloaded_subsystems(self):
+        store = self.open(); data = store.load()
+        reqcore.apply_op(data, {'op': 'del', 'p': 'P1', 's': 'EPS', 'i': 0})
+        store.save_all(data)  # COM, TCS e P2 mai letti: devono restare
+        expected = plain(DATA); del expected["P1"]["EPS"][0]
+        self.assertEqual(plain(self.open().load(readonly=True)), expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""Undo come log di comandi: ogni operazione ha un'inversa esatta, e il log tiene solo i record sostituiti o rimossi."""
+import os
+import sys
+import json
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import reqcore
+
+DATA = {"P1": {"EPS": [{"id": "REQ-001"}, {"id": "REQ-002", "parent_id": "REQ-001"}, {"desc": "no id"}], "COM": [{"id": "REQ-003"}]},
+        "P2": {"ADCS": [{"id": "REQ-010"}]}}
+OPS = [{'op': 'ins', 'p': 'P1', 's': 'COM', 'i': 0, 'r': {"id": "REQ-004"}},
+       {'op': 'set', 'p': 'P1', 's': 'EPS', 'i': 2, 'r': {"id": "REQ-005"}},
+       {'op': 'del', 'p': 'P1', 's': 'EPS', 'i': 0},
+       {'op': 'swap', 'p': 'P1', 's': 'COM', 'i': 0, 'j': 1},
+       {'op': 'add_sub', 'p': 'P1', 's': 'TCS', 'reqs': [{"id": "REQ-006"}]},
+       {'op': 'del_sub', 'p': 'P1', 's': 'COM'},
+       {'op': 'ren_sub', 'p': 'P1', 's': 'EPS', 'n': 'Power'},
+       {'op': 'add_proj', 'p': 'P3', 'subs': {"S": []}},
+       {'op': 'ren_proj', 'p': 'P2', 'n': 'P4'},
+       {'op': 'del_proj', 'p': 'P1'}]
+
+def state(data):
+    # contenuto e ordine dei record: sottosistemi e progetti ripristinati da un undo tornano in coda, non al loro posto
+    return json.dumps(data, default=reqcore.json_default, sort_keys=True)
+
+class InverseOpsTest(unittest.TestCase):
+    def test_each_op_is_undone(self):
+        data = reqcore.as_reqs(json.loads(json.dumps(DATA)))
+        for op in OPS:
+            before = state(data)
+            inv = reqcore.apply_op(data, json.loads(json.dumps(op)))
+            after = state(data)
+            redo = reqcore.apply_op(data, inv)
+            self.assertEqual(state(data), before, op['op'])
+            reqcore.apply_op(data, redo)
+            self.assertEqual(state(data), after, op['op'])
+
+    def test_labels(self):
+        data = reqcore.as_reqs(json.loads(json.dumps(DATA)))
+        labels = []
+        for op in OPS[:3]: labels.append(reqcore.op_label(op, reqcore.apply_op(data, op)))
+        self.assertEqual(labels, ["Add REQ-004", "Edit REQ-005", "Delete REQ-001"])
+        op = {'op': 'del', 'p': 'P1', 's': 'EPS', 'i': 1}  # l'ex record senza ID, ora REQ-005
+        op2 = {'op': 'set', 'p': 'P1', 's': 'EPS', 'i': 0, 'r': {"desc": "still no id"}}
+        self.assertEqual(reqcore.op_label(op2, reqcore.apply_op(data, op2)), "Edit ")
+        self.assertEqual(reqcore.op_label(op, reqcore.apply_op(data, op)), "Delete REQ-005")
+
+class UndoLogTest(unittest.TestCase):
+    def test_push_pop_and_redo(self):
+        log = reqcore.UndoLog()
+        log.push("a", [{'op': 'del', 'p': 'P', 's': 'S', 'i': 0}, {'op': 'del', 'p': 'P', 's': 'S', 'i': 1}])
+        self.assertEqual(log.label(log.undo), "a")
+        label, ops = log.pop(log.undo)
+        self.assertEqual([op['i'] for op in ops], [1, 0])  # inverse in ordine inverso
+        log.push_redo(label, [{'op': 'ins', 'p': 'P', 's': 'S', 'i': 0, 'r': {}}])
+        self.assertEqual(log.label(log.redo), "a")
+        log.push("b", [{'op': 'del', 'p': 'P', 's': 'S', 'i': 0}])
+        self.assertEqual(log.redo, []); self.assertEqual(log.records, 1)
+
+    def test_limits(self):
+        log = reqcore.UndoLog(max_steps=3, max_records=10)
+        for k in range(5): log.push(str(k), [{'op': 'ins', 'p': 'P', 's': 'S', 'i': 0, 'r': {}}])
+        self.assertEqual([label for label, _, _ in log.undo], ["2", "3", "4"])
+        log.push("big", [{'op': 'add_sub', 'p': 'P', 's': 'S', 'reqs': [{}] * 20}])
+        self.assertEqual([label for label, _, _ in log.undo], ["big"])  # l'ultimo passo resta anche se pesa troppo
+        self.assertEqual(log.records, 21)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+"""Validatore di integrita': ogni tipo di problema, operazioni di revisione e indice su un database non valido."""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import reqcore
+
+def database():
+    return reqcore.as_reqs({"P": {"EPS": [{"id": "A", "parent_id": "C"}, {"id": "B", "parent_id": "A"}, {"desc": "no id"}],
+                                  "COM": [{"id": "C", "parent_id": "B"}, {"id": "A"}, {"id": "D", "parent_id": "NOPE", "needs_review": True},
+                                          {"id": "E", "parent_id": "C"}]},
+                            "Q": {"EPS": [{"id": "A"}, {"id": "F", "parent_id": "A"}]}})
+
+class ValidateTest(unittest.TestCase):
+    def test_issues(self):
+        issues = reqcore.validate(database())
+        got = sorted((it['project'], it['kind'], it['id'], tuple(it['at'])) for it in issues)
+        self.assertEqual(got, [("P", "cycle", "A", (("EPS", 0), ("COM", 0), ("EPS", 1))),  # A -> C -> B -> A
+                               ("P", "dangling", "D", (("COM", 2),)),
+                               ("P", "duplicate", "A", (("EPS", 0), ("COM", 1))),
+                               ("P", "missing_id", "", (("EPS", 2),))])
+        self.assertEqual(reqcore.validate({"P": {"EPS": [{"id": "A"}, {"id": "B", "parent_id": "A"}]}}), [])
+
+    def test_review_ops(self):
+        data = database(); issues = reqcore.validate(data)
+        ops = reqcore.review_ops(data, issues)
+        # una operazione per record coinvolto, tranne D che e' gia' marcato
+        self.assertEqual(sorted((op['s'], op['i']) for op in ops), [("COM", 0), ("COM", 1), ("EPS", 0), ("EPS", 1), ("EPS", 2)])
+        for op in ops: reqcore.apply_op(data, op)
+        self.assertEqual(reqcore.review_ops(data, issues), [])
+
+    def test_index_accepts_invalid_database(self):
+        # l'indice si costruisce anche con ID mancanti e duplicati: il caricamento non fallisce, validate li riporta
+        index = reqcore.DatabaseIndex(database())
+        pidx = index.project("P")
+        self.assertEqual(len(pidx.by_id["A"]), 2); self.assertEqual(pidx.get("")["desc"], "no id")
+
+    def test_long_chain(self):
+        n = 50000  # nessuna ricorsione: una catena lunga non esaurisce lo stack
+        reqs = [{"id": f"R{k}", "parent_id": f"R{k - 1}" if k else f"R{n - 1}"} for k in range(n)]
+        issues = reqcore.validate({"P": {"S": reqs}})
+        self.assertEqual([it['kind'] for it in issues], ["cycle"]); self.assertEqual(len(issues[0]['at']), n)
+
+if __name__ == '__main__':
+    unittest.main()